@@ -3,37 +3,146 @@ NANBAN AI - Tamil Conversational Companion
 Main Flask Application Server
 """
 
-from flask import Flask, render_template, request, jsonify, session, make_response
+from flask import Flask, render_template, request, jsonify, session, make_response, Response, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
 from datetime import datetime
 import json
+import gzip
+import zlib
+import threading
+import hmac
+from functools import wraps
 from openai_brain import NanbanBrain
 from voice_handler import VoiceHandler
 from database import Database
+from memory_index import MemoryIndex
+from session_store import ServerSessionInterface
+from checkin_analytics import mood_trends
+from scheduler import Scheduler
+from idempotency import IdempotencyStore, idempotent
+from usage import UsageTracker
+from data_transfer import ImportTooLarge, iter_export_lines, gzip_chunks, import_lines, spool_import
+from assets import init_app as init_assets, render_cached
+from compression import init_app as init_compression
+from json_provider import FastJSONProvider
+from memory_profiling import MemoryProfiler
+from observability import configure_logging, get_logger, init_app as init_observability, metrics_payload, timed
 
 # Load local environment variables from .env if present
 load_dotenv()
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.secret_key = os.environ.get('SECRET_KEY', 'nanban-secret-key-change-in-production')
 CORS(app)
+configure_logging()
+init_observability(app)
+init_assets(app)
+init_compression(app)
+# tracemalloc per endpoint when MEMORY_PROFILING=on (see /api/admin/memory)
+memory_profiler = MemoryProfiler()
+memory_profiler.init_app(app)
+logger = get_logger('app')
+
+# Number of older matching turns recalled into the prompt (0 disables)
+HISTORY_RECALL_K = int(os.environ.get('HISTORY_RECALL_K', 3))
+# Number of memory facts retrieved into the prompt per message
+MEMORY_TOP_K = int(os.environ.get('MEMORY_TOP_K', 5))
 
 # Initialize components
 brain = NanbanBrain()
-voice = VoiceHandler()
 db = Database()
+voice = VoiceHandler(cache=db)
+memory_index = MemoryIndex(db)
+brain.instant.use_precomputed_greetings(lambda: db.get_precomputed_replies('greeting'))
+brain.suggestions.use_precomputed(lambda: db.get_precomputed_replies('suggestions'))
+
+# Token usage per turn, daily rollups and per-user budgets
+usage = UsageTracker(db)
+# Bearer token for /api/admin/* (admin routes are disabled when unset)
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+# Largest /api/import body accepted, measured after gzip decompression
+IMPORT_MAX_BYTES = int(os.environ.get('IMPORT_MAX_BYTES', 20 * 1024 * 1024))
+
+# Client retries of /api/chat with the same Idempotency-Key get the first response
+idempotency = IdempotencyStore(db)
+
+# Keep session data server-side; the cookie only carries a small session id
+if os.environ.get('SESSION_BACKEND', 'server') == 'server':
+    app.session_interface = ServerSessionInterface(db)
+
+# Periodic maintenance, run by whichever worker holds the scheduler lease
+scheduler = Scheduler(db)
+CONVERSATION_RETENTION_DAYS = int(os.environ.get('CONVERSATION_RETENTION_DAYS', 0))
+JOB_HISTORY_DAYS = 30
+scheduler.add('purge_idempotency_keys', idempotency.purge, every=600)
+if isinstance(app.session_interface, ServerSessionInterface):
+    scheduler.add('purge_sessions', app.session_interface.purge, every=3600)
+if CONVERSATION_RETENTION_DAYS:
+    scheduler.add(
+        'conversation_retention', lambda: db.purge_conversations(CONVERSATION_RETENTION_DAYS), cron='0 3 * * *'
+    )
+scheduler.add('purge_usage_turns', usage.purge_turns, cron='30 3 * * *')
+scheduler.add('purge_job_runs', lambda: db.purge_job_runs(JOB_HISTORY_DAYS), cron='45 3 * * *')
+scheduler.add('recompute_favorites', db.recompute_favorites, cron='15 3 * * *')
+scheduler.add('analyze_db', db.analyze, cron='0 4 * * 0')
+scheduler.add('warm_tts_phrases', lambda: voice.warm(brain.instant.common_phrases()), every=6 * 3600)
+
+# Worker lifecycle state used by the health endpoints and graceful drain
+_lifecycle = {'draining': False, 'in_flight': 0}
+_lifecycle_lock = threading.Lock()
+
+def reinit_after_fork():
+    """Give a freshly forked gunicorn worker its own network clients and scheduler thread"""
+    brain.reset_client()
+    voice.reset_client()
+    _lifecycle.update(draining=False, in_flight=0)
+    scheduler.start()
+
+def start_draining():
+    """Fail readiness so the load balancer stops routing new chats here (signal-safe: only sets a flag)"""
+    _lifecycle['draining'] = True
+
+def shutdown_worker():
+    """Stop the scheduler and hand its lease to another worker once this one has drained"""
+    logger.info('Worker exiting', extra={'in_flight': _lifecycle['in_flight']})
+    scheduler.stop()
+
+def is_admin():
+    """True when the request carries 'Authorization: Bearer <ADMIN_TOKEN>'"""
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(supplied, ADMIN_TOKEN)
+
+def require_admin(view):
+    """Allow a view only with 'Authorization: Bearer <ADMIN_TOKEN>'"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not is_admin():
+            return jsonify({'error': 'Forbidden'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.before_request
+def _track_in_flight():
+    with _lifecycle_lock:
+        _lifecycle['in_flight'] += 1
+
+@app.teardown_request
+def _untrack_in_flight(exc):
+    with _lifecycle_lock:
+        _lifecycle['in_flight'] -= 1
 
 @app.route('/')
 def home():
     """Landing page"""
-    return render_template('home.html')
+    return render_cached('home.html')
 
 @app.route('/setup')
 def setup():
     """Slang and Persona selection page"""
-    return render_template('setup.html')
+    return render_cached('setup.html')
 
 @app.route('/chat')
 def chat():
@@ -81,6 +190,7 @@ def save_preferences():
     })
 
 @app.route('/api/chat', methods=['POST'])
+@idempotent(idempotency)
 def chat_endpoint():
     """Handle chat messages"""
     data = request.json
@@ -96,13 +206,20 @@ def chat_endpoint():
     persona = session.get('persona', 'JALIANA')
     user_name = session.get('user_name', '')
     voice_enabled = session.get('voice_enabled', False)
-    memory = db.get_memory(user_id) if user_id else None
     current_mood = mood or session.get('mood', 'CHILL')
     current_reply_mode = reply_mode or session.get('reply_mode', 'quick')
     memory_facts = ''
 
+    with timed('memory_lookup'):
+        memory = db.get_memory(user_id) if user_id else None
+        if memory and memory.get('consent') is True:
+            # Only the facts relevant to this message enter the prompt
+            memory_facts = memory_index.relevant_facts(user_id, user_message, k=MEMORY_TOP_K)
+            if not memory_facts:
+                # Nothing matched (e.g. small talk): the offline summary still gives the gist
+                memory_facts = db.get_memory_summary(user_id) or ''
+
     if memory and memory.get('consent') is True:
-        memory_facts = memory.get('facts', '')
         if not mood:
             current_mood = memory.get('mood', current_mood)
         if not reply_mode:
@@ -115,55 +232,88 @@ def chat_endpoint():
         return jsonify({'error': 'No message provided'}), 400
     
     try:
+        # Greetings, thanks, bye etc. are answered locally without the model
+        instant = None
+        if user_message and not image_data:
+            with timed('instant_reply'):
+                instant = brain.instant.match(user_message, slang, persona, user_name)
+        
+        # Users over their daily token budget get cheaper turns, then local replies
+        budget = usage.budget_level(user_id) if instant is None else None
+        if budget == 'hard':
+            instant = brain.instant.fallback(slang, persona, user_name, kind='budget')
+        
         # Get conversation history
-        history = db.get_conversation_history(user_id) if user_id else []
+        history = []
+        if user_id and instant is None:
+            with timed('history_fetch'):
+                history = db.get_conversation_history(user_id)
         
-        # Generate AI response (image or text)
-        if image_data:
-            ai_result = brain.chat_with_image(
-                user_message=user_message or "இந்த படத்தில என்ன இருக்கு?",
-                image_data=image_data,
-                image_mime=image_mime,
-                slang=slang,
-                persona=persona,
-                user_name=user_name,
-                mood=current_mood,
-                reply_mode=current_reply_mode,
-                memory_facts=memory_facts
-            )
+        # Recall older turns matching this message that are outside the recent window
+        related = []
+        if user_id and user_message and HISTORY_RECALL_K and not image_data and instant is None:
+            with timed('history_recall'):
+                recent = {msg['content'] for msg in history[-3:]}
+                related = [
+                    msg for msg in db.search_messages(user_id, user_message, limit=HISTORY_RECALL_K * 2, match_any=True)
+                    if msg['content'] not in recent and msg['content'] != user_message
+                ][:HISTORY_RECALL_K]
+        
+        # Generate AI response (instant, image or text)
+        if instant is not None:
+            ai_result = brain.respond(instant, slang, persona, user_name, current_mood, fallback=budget == 'hard')
         else:
-            ai_result = brain.chat(
-                user_message=user_message,
-                slang=slang,
-                persona=persona,
-                user_name=user_name,
-                conversation_history=history,
-                mood=current_mood,
-                reply_mode=current_reply_mode,
-                memory_facts=memory_facts
-            )
-
-        ai_response = ai_result.get('text') if isinstance(ai_result, dict) else ai_result
-        is_fallback = ai_result.get('fallback') if isinstance(ai_result, dict) else False
-        suggestions = ai_result.get('suggestions') if isinstance(ai_result, dict) else None
+            with timed('llm'):
+                if image_data:
+                    ai_result = brain.chat_with_image(
+                        user_message=user_message or "இந்த படத்தில என்ன இருக்கு?",
+                        image_data=image_data,
+                        image_mime=image_mime,
+                        slang=slang,
+                        persona=persona,
+                        user_name=user_name,
+                        mood=current_mood,
+                        reply_mode=current_reply_mode,
+                        memory_facts=memory_facts,
+                        budget=budget,
+                        on_usage=usage.recorder(user_id, slang, persona)
+                    )
+                else:
+                    ai_result = brain.chat(
+                        user_message=user_message,
+                        slang=slang,
+                        persona=persona,
+                        user_name=user_name,
+                        conversation_history=history,
+                        related_messages=related,
+                        mood=current_mood,
+                        reply_mode=current_reply_mode,
+                        memory_facts=memory_facts,
+                        budget=budget,
+                        on_usage=usage.recorder(user_id, slang, persona)
+                    )
+
+        ai_response = ai_result['text']
         
         # Save conversation
         if user_id:
-            if user_message:
-                db.save_message(user_id, 'user', user_message)
-            db.save_message(user_id, 'assistant', ai_response)
+            with timed('db_write'):
+                if user_message:
+                    db.save_message(user_id, 'user', user_message)
+                db.save_message(user_id, 'assistant', ai_response)
         
         # Generate voice if enabled
         audio_url = None
         if voice_enabled:
             try:
-                audio_url = voice.text_to_speech(
-                    text=ai_response,
-                    slang=slang,
-                    persona=persona
-                )
-            except Exception as e:
-                print(f"Voice generation error: {e}")
+                with timed('tts'):
+                    audio_url = voice.text_to_speech(
+                        text=ai_response,
+                        slang=slang,
+                        persona=persona
+                    )
+            except Exception:
+                logger.exception('Voice generation error')
                 # Continue without voice if it fails
         
         return jsonify({
@@ -171,17 +321,45 @@ def chat_endpoint():
             'response': ai_response,
             'audio_url': audio_url,
             'timestamp': datetime.now().isoformat(),
-            'fallback': bool(is_fallback),
-            'suggestions': suggestions
+            'fallback': ai_result['fallback'],
+            'suggestions': ai_result['suggestions']
         })
         
     except Exception as e:
-        print(f"Chat error: {e}")
+        logger.exception('Chat error')
         return jsonify({
             'error': 'Sorry, something went wrong. Please try again.',
             'details': str(e)
         }), 500
 
+@app.route('/api/history', methods=['GET'])
+def history():
+    """Page backwards through conversation history (?before=<id>&limit=<n>)"""
+    user_id = session.get('user_id')
+    if not user_id:
+        page = {'messages': [], 'next_cursor': None}
+    else:
+        before_id = request.args.get('before', type=int)
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        page = db.get_conversation_page(user_id, before_id=before_id, limit=limit)
+
+    response = app.response_class(app.json.dumps_bytes(page), mimetype='application/json')
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+@app.route('/api/search', methods=['GET'])
+def search_history():
+    """Full-text search over the current user's conversation history"""
+    user_id = session.get('user_id')
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'No query provided'}), 400
+    
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    results = db.search_messages(user_id, query, limit=limit) if user_id else []
+    return jsonify({'query': query, 'results': results})
+
 @app.route('/api/clear-history', methods=['POST'])
 def clear_history():
     """Clear conversation history"""
@@ -228,6 +406,7 @@ def memory_update():
 
     if user_id:
         db.set_memory(user_id, consent=consent, facts=facts, mood=mood, reply_mode=reply_mode)
+        memory_index.replace_facts(user_id, facts if consent else '')
 
     return jsonify({'success': True})
 
@@ -240,6 +419,7 @@ def memory_forget():
     session.pop('reply_mode', None)
     if user_id:
         db.clear_memory(user_id)
+        memory_index.forget(user_id)
     return jsonify({'success': True})
 
 @app.route('/api/checkin/status', methods=['GET'])
@@ -261,6 +441,125 @@ def checkin_update():
     db.upsert_checkin(user_id, today, mood, note)
     return jsonify({'success': True})
 
+@app.route('/api/checkin/trends', methods=['GET'])
+def checkin_trends():
+    """Mood distribution per week or month plus streaks (?period=week|month&from=&to=)"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'No user found'}), 404
+    try:
+        trends = mood_trends(
+            db, user_id,
+            period=request.args.get('period', 'week'),
+            start=request.args.get('from'),
+            end=request.args.get('to'),
+            today=datetime.now().date()
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(trends)
+
+@app.route('/api/export', methods=['GET'])
+def export_data():
+    """Stream the current user's data as NDJSON (add ?gzip=1 to compress)"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'No user found'}), 404
+
+    lines = iter_export_lines(db, user_ids=[user_id])
+    filename = f"nanban-export-{user_id}.ndjson"
+    if request.args.get('gzip') in ('1', 'true'):
+        body = gzip_chunks(lines)
+        mimetype = 'application/gzip'
+        filename += '.gz'
+    else:
+        body = (line.encode('utf-8') for line in lines)
+        mimetype = 'application/x-ndjson'
+
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@app.route('/api/import', methods=['POST'])
+def import_data():
+    """
+    Import an NDJSON export (optionally gzipped) into the current user, or
+    with the admin token and no user, recreate every user in the file.
+    The body is spooled and validated before the write transaction starts.
+    """
+    user_id = session.get('user_id')
+    if not user_id and not is_admin():
+        return jsonify({'error': 'No user found'}), 404
+    if request.content_length is not None and request.content_length > IMPORT_MAX_BYTES:
+        return jsonify({'error': f'Import file larger than {IMPORT_MAX_BYTES} bytes'}), 413
+
+    gzipped = request.mimetype == 'application/gzip' or request.content_encoding == 'gzip'
+    try:
+        upload = spool_import(request.stream, IMPORT_MAX_BYTES, gzipped=gzipped)
+    except ImportTooLarge:
+        return jsonify({'error': f'Import file larger than {IMPORT_MAX_BYTES} bytes'}), 413
+    except ValueError as e:
+        return jsonify({'error': f'Invalid import file: {e}'}), 400
+    except (gzip.BadGzipFile, EOFError, zlib.error):
+        return jsonify({'error': 'Invalid import file: corrupt gzip data'}), 400
+
+    with upload:
+        counts = import_lines(db, upload, target_user_id=user_id or None, memory_index=memory_index)
+
+    return jsonify({'success': True, 'imported': counts})
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: database reachable and the worker is not draining"""
+    if _lifecycle['draining']:
+        return jsonify({'status': 'draining', 'in_flight': _lifecycle['in_flight']}), 503
+    try:
+        db.ping()
+    except Exception as e:
+        logger.warning('Readiness check failed', extra={'error': str(e)})
+        return jsonify({'status': 'unavailable'}), 503
+    return jsonify({'status': 'ready', 'in_flight': _lifecycle['in_flight']})
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint (aggregated across gunicorn workers)"""
+    payload, content_type = metrics_payload()
+    return Response(payload, mimetype=content_type)
+
+@app.route('/api/admin/usage', methods=['GET'])
+@require_admin
+def admin_usage():
+    """Token, latency and cost totals from the daily usage rollups (?days=7)"""
+    days = min(max(request.args.get('days', 7, type=int), 1), 90)
+    return jsonify(usage.report(days=days))
+
+@app.route('/api/admin/jobs', methods=['GET'])
+@require_admin
+def admin_jobs():
+    """Scheduled maintenance jobs and their recent runs"""
+    return jsonify(scheduler.status())
+
+@app.route('/api/admin/jobs/<name>/run', methods=['POST'])
+@require_admin
+def admin_run_job(name):
+    """Run a scheduled job now, in this worker, and return its result"""
+    if name not in scheduler.jobs:
+        return jsonify({'error': f'Unknown job: {name}'}), 404
+    run = scheduler.run_now(name)
+    return jsonify(run), 409 if run['status'] == 'running' else 200
+
+@app.route('/api/admin/memory', methods=['GET'])
+@require_admin
+def admin_memory():
+    """This worker's memory and, when profiling, per-endpoint allocation growth (?limit=20)"""
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 50)
+    return jsonify(memory_profiler.report(limit=limit))
+
 @app.errorhandler(404)
 def not_found(e):
     return render_template('404.html'), 404
@@ -277,6 +576,7 @@ def server_error(e):
 if __name__ == '__main__':
     # Create tables if they don't exist
     db.init_db()
+    scheduler.start()
     
     # Run the app
     port = int(os.environ.get('PORT', 5000))
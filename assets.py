@@ -0,0 +1,185 @@
+"""
+NANBAN AI - Static Assets
+Build step that minifies, fingerprints and precompresses static files,
+plus the Flask glue that serves them (and the fully static pages) with
+long-lived caching, ETags and gzip/brotli.
+
+    python assets.py build
+"""
+
+import argparse
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+
+from flask import current_app, render_template, request, send_from_directory
+from werkzeug.security import safe_join
+
+from compression import STATIC_LEVELS, available_encodings, compress, negotiate
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+COMPRESSIBLE = {'.css', '.js', '.svg', '.html', '.json', '.txt', '.ico'}
+# Below this, compression saves less than the headers it costs
+MIN_COMPRESS_BYTES = 256
+ENCODING_SUFFIX = {'br': '.br', 'gzip': '.gz'}
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Pages reference fingerprinted assets that change per deploy, so revalidate them
+REVALIDATE = 'public, no-cache'
+
+CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+CSS_SPACE_RE = re.compile(r'\s+')
+CSS_BRACE_RE = re.compile(r'\s*([{}])\s*')
+# Whitespace in selectors is a descendant combinator (".a :hover" is not ".a:hover"),
+# so only declaration blocks lose the spaces around ':'
+CSS_SELECTOR_PUNCT_RE = re.compile(r'\s*([;,])\s*')
+CSS_DECLARATION_PUNCT_RE = re.compile(r'\s*([:;,])\s*')
+
+
+def minify_css(css):
+    """Strip comments and redundant whitespace from a stylesheet"""
+    css = CSS_COMMENT_RE.sub('', css)
+    css = CSS_SPACE_RE.sub(' ', css)
+    parts = CSS_BRACE_RE.split(css)
+    for i in range(0, len(parts), 2):
+        # Text right before a '}' is a declaration block; anything else is a selector or at-rule prelude
+        closes_block = i + 1 < len(parts) and parts[i + 1] == '}'
+        punct_re = CSS_DECLARATION_PUNCT_RE if closes_block else CSS_SELECTOR_PUNCT_RE
+        parts[i] = punct_re.sub(r'\1', parts[i].strip())
+    return ''.join(parts).replace(';}', '}').strip()
+
+
+def compress_variants(data):
+    """Precompressed encodings of data, keeping only those that are smaller"""
+    if len(data) < MIN_COMPRESS_BYTES:
+        return {}
+    variants = {encoding: compress(data, encoding, STATIC_LEVELS[encoding]) for encoding in available_encodings()}
+    return {encoding: blob for encoding, blob in variants.items() if len(blob) < len(data)}
+
+
+def build(static_dir):
+    """
+    Write static_dir/dist with minified, content-hashed copies of every
+    static file plus .gz/.br siblings, and a manifest mapping the original
+    path to the hashed one. Returns the manifest.
+    """
+    dist_dir = os.path.join(static_dir, DIST_DIR)
+    shutil.rmtree(dist_dir, ignore_errors=True)
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != dist_dir)
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            logical = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            stem, ext = os.path.splitext(logical)
+
+            with open(source, 'rb') as f:
+                data = f.read()
+            if ext == '.css':
+                data = minify_css(data.decode('utf-8')).encode('utf-8')
+
+            hashed = f'{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}'
+            target = os.path.join(dist_dir, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(data)
+            if ext in COMPRESSIBLE:
+                for encoding, blob in compress_variants(data).items():
+                    with open(target + ENCODING_SUFFIX[encoding], 'wb') as f:
+                        f.write(blob)
+            manifest[logical] = hashed
+
+    with open(os.path.join(dist_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_dir):
+    """The build manifest, or {} when assets have not been built"""
+    try:
+        with open(os.path.join(static_dir, DIST_DIR, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def render_cached(template_name, **context):
+    """
+    Render a page that has no per-user content once per process and serve
+    it with an ETag and a precompressed body (re-rendered on every request
+    in debug mode so template edits show up).
+    """
+    cache = current_app.extensions['assets']['pages']
+    page = None if current_app.debug else cache.get(template_name)
+    if page is None:
+        body = render_template(template_name, **context).encode('utf-8')
+        page = {
+            'etag': hashlib.sha1(body).hexdigest()[:16],
+            'variants': {None: body, **compress_variants(body)},
+        }
+        cache[template_name] = page
+
+    encoding = negotiate(page['variants'])
+    response = current_app.response_class(page['variants'][encoding], mimetype='text/html')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.set_etag(f"{page['etag']}-{encoding}" if encoding else page['etag'])
+    response.headers['Cache-Control'] = REVALIDATE
+    return response.make_conditional(request)
+
+
+def init_app(app):
+    """Serve built assets under /static/dist and point url_for('static') at them"""
+    static_dir = app.static_folder
+    dist_dir = os.path.join(static_dir, DIST_DIR)
+    manifest = load_manifest(static_dir)
+    app.extensions['assets'] = {'manifest': manifest, 'pages': {}}
+
+    @app.url_defaults
+    def _fingerprint(endpoint, values):
+        # Templates keep using url_for('static', filename='css/style.css')
+        if endpoint == 'static' and manifest and not app.debug:
+            hashed = manifest.get(values.get('filename'))
+            if hashed:
+                values['filename'] = f'{DIST_DIR}/{hashed}'
+
+    @app.route(f'/static/{DIST_DIR}/<path:filename>')
+    def dist_asset(filename):
+        path = safe_join(dist_dir, filename)
+        available = [
+            encoding for encoding, suffix in ENCODING_SUFFIX.items()
+            if path and os.path.isfile(path + suffix)
+        ]
+        encoding = negotiate(available)
+        response = send_from_directory(
+            dist_dir, filename + ENCODING_SUFFIX[encoding] if encoding else filename,
+            mimetype=mimetypes.guess_type(filename)[0], max_age=31536000
+        )
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = IMMUTABLE
+        return response
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Nanban AI static asset pipeline')
+    parser.add_argument('command', choices=['build'])
+    parser.add_argument('--static-dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
+    args = parser.parse_args(argv)
+
+    manifest = build(args.static_dir)
+    for logical, hashed in sorted(manifest.items()):
+        print(f'{logical} -> {DIST_DIR}/{hashed}')
+    if 'br' not in available_encodings():
+        print('brotli not installed; wrote gzip variants only')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,438 @@
+"""
+NANBAN AI - Batch Jobs
+Offline LLM work (greetings, quick-reply suggestions, memory summaries)
+submitted in bulk instead of one-by-one through NanbanBrain.chat.
+
+Backends:
+    openai      OpenAI Batch API (JSONL upload, 24h window, cheapest)
+    local       File-based stand-in for the Batch API, for tests and dev
+    concurrent  Bounded parallel chat.completions calls, for small jobs
+
+    python batch_jobs.py run greetings suggestions --backend local
+    python batch_jobs.py run memory_summaries --backend openai --no-wait
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+
+from observability import get_logger
+
+logger = get_logger('batch')
+
+CHAT_COMPLETIONS_URL = '/v1/chat/completions'
+# Upstream batch states after which nothing more will happen
+TERMINAL_STATES = {'completed', 'failed', 'expired', 'cancelled'}
+
+
+@dataclass
+class BatchRequest:
+    """One chat completion request in a batch job"""
+    custom_id: str
+    messages: list
+    max_tokens: int = 150
+    temperature: float = 0.8
+
+    def to_line(self, model):
+        """Serialize in the OpenAI Batch API input format"""
+        return json.dumps({
+            'custom_id': self.custom_id,
+            'method': 'POST',
+            'url': CHAT_COMPLETIONS_URL,
+            'body': {
+                'model': model,
+                'messages': self.messages,
+                'max_tokens': self.max_tokens,
+                'temperature': self.temperature
+            }
+        }, ensure_ascii=False)
+
+
+def parse_output_line(line):
+    """Parse one Batch API output line into (custom_id, status, content)"""
+    record = json.loads(line)
+    response = record.get('response') or {}
+    if record.get('error') or response.get('status_code') != 200:
+        error = record.get('error') or response.get('body', {}).get('error')
+        return record['custom_id'], 'failed', json.dumps(error, ensure_ascii=False)
+    content = response['body']['choices'][0]['message']['content']
+    return record['custom_id'], 'done', content
+
+
+# ---------------------------------------------------------------------------
+# Jobs: each builds requests from the DB and writes finished results back
+# ---------------------------------------------------------------------------
+
+def _combos(brain):
+    for slang in brain.slang_rules:
+        for persona in brain.persona_rules:
+            yield slang, persona
+
+
+def prompt_digest(messages):
+    """Short hash of a request's prompt, so edited prompts are regenerated rather than skipped"""
+    payload = json.dumps(messages, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def build_greetings(db, brain):
+    for slang, persona in _combos(brain):
+        messages = [
+            {'role': 'system', 'content': brain.build_system_prompt(slang, persona, '')},
+            {'role': 'user', 'content': (
+                'A friend just opened the chat. Write one short, warm opening greeting. '
+                'Reply with the greeting only.'
+            )}
+        ]
+        yield BatchRequest(
+            custom_id=f'greeting:{slang}:{persona}:{prompt_digest(messages)}',
+            messages=messages,
+            max_tokens=60
+        )
+
+
+def write_greetings(db, results):
+    rows = []
+    rejected = set()
+    for custom_id, content in results:
+        # A refusal or cut-off completion can come back with no content
+        if not (content or '').strip():
+            logger.warning('Empty greeting', extra={'custom_id': custom_id})
+            rejected.add(custom_id)
+            continue
+        rows.append(('greeting', *custom_id.split(':')[1:3], content.strip()))
+    db.save_precomputed_replies(rows)
+    return rejected
+
+
+def build_suggestions(db, brain):
+    for slang, persona in _combos(brain):
+        messages = [
+            {'role': 'system', 'content': brain.build_system_prompt(slang, persona, '')},
+            {'role': 'user', 'content': (
+                'Give 4 short quick-reply chips (2-4 words each) the user might tap next '
+                'in this chat style. Reply with a JSON array of strings only.'
+            )}
+        ]
+        yield BatchRequest(
+            custom_id=f'suggestions:{slang}:{persona}:{prompt_digest(messages)}',
+            messages=messages,
+            max_tokens=80,
+            temperature=0.9
+        )
+
+
+def write_suggestions(db, results):
+    rows = []
+    rejected = set()
+    for custom_id, content in results:
+        try:
+            chips = json.loads((content or '').strip().strip('`').removeprefix('json'))
+        except ValueError:
+            chips = None
+        if not isinstance(chips, list) or not chips:
+            logger.warning('Unparseable suggestions', extra={'custom_id': custom_id})
+            rejected.add(custom_id)
+            continue
+        chips = [str(chip).strip() for chip in chips if str(chip).strip()][:4]
+        rows.append(('suggestions', *custom_id.split(':')[1:3], json.dumps(chips, ensure_ascii=False)))
+    db.save_precomputed_replies(rows)
+    return rejected
+
+
+def facts_digest(facts):
+    """Short hash of a memory blob, tying a summary to the facts it was made from"""
+    return hashlib.sha256((facts or '').encode('utf-8')).hexdigest()[:16]
+
+
+def build_memory_summaries(db, brain):
+    for user_id, facts in db.iter_consented_memories():
+        yield BatchRequest(
+            custom_id=f'memory_summary:{user_id}:{facts_digest(facts)}',
+            messages=[
+                {'role': 'system', 'content': (
+                    'Condense the facts a user shared about themselves into at most 5 short '
+                    'bullet points. Keep names, dates and preferences. Reply with the bullets only.'
+                )},
+                {'role': 'user', 'content': facts[:4000]}
+            ],
+            max_tokens=200,
+            temperature=0.2
+        )
+
+
+def write_memory_summaries(db, results):
+    rows = []
+    rejected = set()
+    for custom_id, content in results:
+        if not (content or '').strip():
+            logger.warning('Empty memory summary', extra={'custom_id': custom_id})
+            rejected.add(custom_id)
+            continue
+        _, user_id, digest = (custom_id.split(':') + [''])[:3]
+        memory = db.get_memory(int(user_id))
+        # Batches take hours: skip users who changed their facts or withdrew consent meanwhile
+        if memory['consent'] is not True or facts_digest(memory['facts']) != digest:
+            continue
+        rows.append((int(user_id), content.strip()))
+    db.save_memory_summaries(rows)
+    return rejected
+
+
+JOBS = {
+    'greetings': (build_greetings, write_greetings),
+    'suggestions': (build_suggestions, write_suggestions),
+    'memory_summaries': (build_memory_summaries, write_memory_summaries),
+}
+
+
+# ---------------------------------------------------------------------------
+# Backends
+# ---------------------------------------------------------------------------
+
+class OpenAIBatchBackend:
+    """Submit jobs through the OpenAI Batch API"""
+    name = 'openai'
+
+    def __init__(self, client, model, workdir='batch_work'):
+        self.client = client
+        self.model = model
+        self.workdir = workdir
+        os.makedirs(workdir, exist_ok=True)
+
+    def _write_input(self, requests):
+        path = os.path.join(self.workdir, f'input-{uuid.uuid4().hex}.jsonl')
+        with open(path, 'w', encoding='utf-8') as f:
+            for request in requests:
+                f.write(request.to_line(self.model) + '\n')
+        return path
+
+    def submit(self, requests):
+        path = self._write_input(requests)
+        with open(path, 'rb') as f:
+            uploaded = self.client.files.create(file=f, purpose='batch')
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint=CHAT_COMPLETIONS_URL,
+            completion_window='24h'
+        )
+        return batch.id
+
+    def poll(self, batch_id):
+        """Return (status, results); results is a list once the batch is terminal"""
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status not in TERMINAL_STATES:
+            return batch.status, None
+
+        results = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                text = self.client.files.content(file_id).text
+                results.extend(parse_output_line(line) for line in text.splitlines() if line.strip())
+        return batch.status, results
+
+
+class LocalBatchBackend(OpenAIBatchBackend):
+    """
+    File-based stand-in for the Batch API.
+
+    Input and output JSONL use the real Batch formats; a batch "completes"
+    on its first poll by running each line through `responder`.
+    """
+    name = 'local'
+
+    def __init__(self, responder, model='local', workdir='batch_work'):
+        super().__init__(client=None, model=model, workdir=workdir)
+        self.responder = responder
+
+    def submit(self, requests):
+        path = self._write_input(requests)
+        return os.path.basename(path)[len('input-'):-len('.jsonl')]
+
+    def poll(self, batch_id):
+        input_path = os.path.join(self.workdir, f'input-{batch_id}.jsonl')
+        output_path = os.path.join(self.workdir, f'output-{batch_id}.jsonl')
+
+        if not os.path.exists(output_path):
+            with open(input_path, encoding='utf-8') as src, open(output_path, 'w', encoding='utf-8') as out:
+                for line in src:
+                    request = json.loads(line)
+                    out.write(json.dumps({
+                        'id': f'batch_req_{uuid.uuid4().hex[:12]}',
+                        'custom_id': request['custom_id'],
+                        'response': {
+                            'status_code': 200,
+                            'body': {'choices': [{'message': {
+                                'role': 'assistant', 'content': self.responder(request)
+                            }}]}
+                        },
+                        'error': None
+                    }, ensure_ascii=False) + '\n')
+
+        with open(output_path, encoding='utf-8') as f:
+            return 'completed', [parse_output_line(line) for line in f if line.strip()]
+
+
+class ConcurrentBackend:
+    """Run requests as individual chat completions with bounded concurrency"""
+    name = 'concurrent'
+
+    def __init__(self, client, model, max_workers=4):
+        self.client = client
+        self.model = model
+        self.max_workers = max_workers
+
+    def _call(self, request):
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=request.messages,
+                max_tokens=request.max_tokens,
+                temperature=request.temperature
+            )
+            return request.custom_id, 'done', response.choices[0].message.content
+        except Exception as e:
+            return request.custom_id, 'failed', str(e)
+
+    def run(self, requests, on_results, checkpoint_every=20):
+        """Execute requests, passing results to on_results in small batches"""
+        pending = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for future in as_completed([pool.submit(self._call, r) for r in requests]):
+                pending.append(future.result())
+                if len(pending) >= checkpoint_every:
+                    on_results(pending)
+                    pending = []
+        if pending:
+            on_results(pending)
+
+
+def make_template_responder(brain):
+    """Responder for LocalBatchBackend that answers from local templates"""
+    def respond(request):
+        kind, _, rest = request['custom_id'].partition(':')
+        if kind == 'greeting':
+            slang, persona = rest.split(':')[:2]
+            return brain._get_example_opening(slang, persona, '')
+        if kind == 'suggestions':
+            return json.dumps(['சரி', 'இன்னும் சொல்லு', 'அப்புறம்?', 'சூப்பர்!'], ensure_ascii=False)
+        facts = request['body']['messages'][-1]['content']
+        return '\n'.join(f'- {line.strip()}' for line in facts.splitlines()[:5] if line.strip())
+    return respond
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+class BatchJobRunner:
+    """Builds, submits, checkpoints and writes back batch jobs"""
+
+    def __init__(self, db, brain, backend, chunk_size=5000, poll_interval=30):
+        self.db = db
+        self.brain = brain
+        self.backend = backend
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+
+    def _record(self, job, results):
+        """Write successful results back, then checkpoint them all"""
+        done = [(custom_id, content) for custom_id, status, content in results if status == 'done']
+        # Writers return the ids they could not use; those are retried next run
+        rejected = (JOBS[job][1](self.db, done) if done else None) or set()
+        self.db.save_batch_results(job, [
+            (custom_id, 'invalid' if custom_id in rejected else status, content)
+            for custom_id, status, content in results
+        ])
+        return len(done) - len(rejected)
+
+    def _collect(self, job, batch_id, wait):
+        while True:
+            status, results = self.backend.poll(batch_id)
+            if results is not None:
+                written = self._record(job, results)
+                self.db.save_batch_run(batch_id, job, self.backend.name,
+                                       'collected' if status == 'completed' else status)
+                logger.info('Batch collected', extra={'job': job, 'batch_id': batch_id, 'written': written})
+                return True
+            self.db.save_batch_run(batch_id, job, self.backend.name, status)
+            if not wait:
+                return False
+            time.sleep(self.poll_interval)
+
+    def run(self, job, wait=True, resume=True):
+        """Run one job; returns a summary dict"""
+        build, _ = JOBS[job]
+
+        if isinstance(self.backend, ConcurrentBackend):
+            done = self.db.get_batch_done_ids(job) if resume else set()
+            requests = [r for r in build(self.db, self.brain) if r.custom_id not in done]
+            written = []
+            self.backend.run(requests, lambda results: written.append(self._record(job, results)))
+            return {'job': job, 'requests': len(requests), 'written': sum(written)}
+
+        # Finish batches submitted by an earlier run before submitting more,
+        # so in-flight requests are never sent upstream twice
+        for batch_id in self.db.get_open_batch_runs(job, self.backend.name):
+            if not self._collect(job, batch_id, wait):
+                return {'job': job, 'status': 'waiting', 'batch_id': batch_id}
+
+        done = self.db.get_batch_done_ids(job) if resume else set()
+        requests = [r for r in build(self.db, self.brain) if r.custom_id not in done]
+        batch_ids = []
+        for start in range(0, len(requests), self.chunk_size):
+            batch_id = self.backend.submit(requests[start:start + self.chunk_size])
+            self.db.save_batch_run(batch_id, job, self.backend.name, 'submitted')
+            batch_ids.append(batch_id)
+
+        collected = all([self._collect(job, batch_id, wait) for batch_id in batch_ids])
+        return {
+            'job': job,
+            'requests': len(requests),
+            'batches': batch_ids,
+            'status': 'collected' if collected else 'submitted'
+        }
+
+
+def main(argv=None):
+    from database import Database
+    from openai_brain import NanbanBrain
+    from observability import configure_logging
+
+    parser = argparse.ArgumentParser(description='Run Nanban AI background LLM batch jobs')
+    parser.add_argument('--db', default='nanban.db', help='SQLite database path')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Run one or more jobs')
+    run_parser.add_argument('jobs', nargs='+', choices=sorted(JOBS))
+    run_parser.add_argument('--backend', choices=['openai', 'local', 'concurrent'], default='local')
+    run_parser.add_argument('--workdir', default='batch_work', help='Where batch JSONL files are kept')
+    run_parser.add_argument('--concurrency', type=int, default=4)
+    run_parser.add_argument('--poll-interval', type=int, default=30)
+    run_parser.add_argument('--no-wait', action='store_true', help='Submit and exit; collect on the next run')
+    run_parser.add_argument('--fresh', action='store_true', help='Ignore checkpoints and redo every request')
+
+    args = parser.parse_args(argv)
+    configure_logging()
+    db = Database(args.db)
+    brain = NanbanBrain()
+
+    if args.backend == 'local':
+        backend = LocalBatchBackend(make_template_responder(brain), workdir=args.workdir)
+    elif args.backend == 'openai':
+        backend = OpenAIBatchBackend(brain.client, brain.model, workdir=args.workdir)
+    else:
+        backend = ConcurrentBackend(brain.client, brain.model, max_workers=args.concurrency)
+
+    runner = BatchJobRunner(db, brain, backend, poll_interval=args.poll_interval)
+    for job in args.jobs:
+        print(json.dumps(runner.run(job, wait=not args.no_wait, resume=not args.fresh), ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
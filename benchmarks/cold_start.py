@@ -0,0 +1,105 @@
+"""
+NANBAN AI - Cold Start Benchmark
+Measures, in fresh interpreters, the time to import the app and to serve
+the first requests — what the first user of a scale-to-zero instance waits for.
+
+    python -m benchmarks.cold_start --runs 5
+    python -m benchmarks.cold_start --budget-ms 1500
+    python -m benchmarks.cold_start --importtime
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside a fresh interpreter; prints one JSON line of timings
+PROBE = r'''
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.get('/healthz')
+first_request = time.perf_counter()
+client.get('/readyz')
+first_db_request = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'first_request_ms': (first_request - imported) * 1000,
+    'first_db_request_ms': (first_db_request - first_request) * 1000,
+    'total_ms': (first_db_request - start) * 1000,
+}))
+'''
+
+
+def _env():
+    env = dict(os.environ)
+    env.setdefault('OPENAI_API_KEY', 'sk-cold-start')
+    env['LOG_LEVEL'] = 'WARNING'
+    env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+    return env
+
+
+def run_probe(workdir):
+    """Time one cold start in a fresh interpreter with an empty database"""
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE, REPO_ROOT],
+        cwd=workdir, env=_env(), capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def top_imports(limit=15):
+    """Slowest imports by cumulative time, from python -X importtime"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import sys; sys.path.insert(0, {REPO_ROOT!r}); import app'],
+        cwd=tempfile.mkdtemp(prefix='nanban-cold-'), env=_env(), capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line.split(':', 1)[1].split('|')
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    rows.sort(reverse=True)
+    return [
+        {'module': name, 'cumulative_ms': round(cum / 1000, 1), 'self_ms': round(own / 1000, 1)}
+        for cum, own, name in rows[:limit]
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cold start benchmark for Nanban AI')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, help='Fail if median total exceeds this')
+    parser.add_argument('--importtime', action='store_true', help='Also list the slowest imports')
+    args = parser.parse_args(argv)
+
+    # A fresh database per run so schema creation is included, as on a new instance
+    samples = [run_probe(tempfile.mkdtemp(prefix='nanban-cold-')) for _ in range(args.runs)]
+    report = {
+        key: {
+            'median': round(statistics.median(s[key] for s in samples), 1),
+            'max': round(max(s[key] for s in samples), 1),
+        }
+        for key in samples[0]
+    }
+    if args.importtime:
+        report['slowest_imports'] = top_imports()
+    print(json.dumps(report, indent=2))
+
+    if args.budget_ms and report['total_ms']['median'] > args.budget_ms:
+        print(f"Cold start {report['total_ms']['median']}ms exceeds budget {args.budget_ms}ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,318 @@
+"""
+NANBAN AI - Load Test
+Offline benchmark: drives the Flask app with concurrent simulated users
+against mock OpenAI/TTS upstreams and compares results with a baseline.
+
+    python -m benchmarks.load_test --users 20 --messages 10
+    python -m benchmarks.load_test --save-baseline
+    python -m benchmarks.load_test --compare
+"""
+
+import argparse
+import base64
+import http.cookiejar
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.mock_upstreams import MockUpstream, OpenAIHandler, TTSHandler, UpstreamProfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(REPO_ROOT, 'benchmarks', 'baseline.json')
+
+SLANGS = ['CHENNAI', 'KOVAI', 'MADURAI', 'NELLAI', 'EELAM', 'COMMON']
+PERSONAS = ['JALIANA', 'AMAITHIYANA', 'THELIVANA', 'VILAKKAMAANA']
+
+MESSAGE_POOL = [
+    'hi',
+    'வணக்கம்',
+    'எப்படி இருக்க மச்சி?',
+    'thanks da',
+    'இன்னைக்கு office-ல செம்ம tension',
+    'நாளைக்கு exam இருக்கு, எப்படி prepare பண்றது?',
+    'biryani பண்றது எப்படி? step by step சொல்லு',
+    'Explain how compound interest works with a simple example',
+    'எனக்கு கொஞ்சம் bore அடிக்குது, ஏதாவது ஜோக் சொல்லு',
+    'நான் நாளைக்கு interview போறேன். என்ன கேப்பாங்க, எப்படி பதில் சொல்லணும்? detail-ஆ சொல்லு',
+]
+# 1x1 transparent PNG for the vision path
+TINY_PNG = base64.b64encode(bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082'
+)).decode('ascii')
+
+
+def summarize(latencies_ms):
+    """Count, mean and p50/p95/p99 of a list of millisecond latencies"""
+    if not latencies_ms:
+        return {'count': 0}
+    values = sorted(latencies_ms)
+
+    def pct(p):
+        return round(values[min(len(values) - 1, int(p / 100 * len(values)))], 3)
+
+    return {
+        'count': len(values),
+        'mean': round(sum(values) / len(values), 3),
+        'p50': pct(50),
+        'p95': pct(95),
+        'p99': pct(99),
+        'max': round(values[-1], 3),
+    }
+
+
+class SimulatedUser:
+    """One browser session: its own cookie jar, slang/persona and voice choice"""
+
+    def __init__(self, base_url, slang, persona, voice_enabled):
+        self.base_url = base_url
+        self.slang = slang
+        self.persona = persona
+        self.voice_enabled = voice_enabled
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def post(self, path, payload):
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST'
+        )
+        start = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=120) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            status = e.code
+        return status, (time.perf_counter() - start) * 1000
+
+    def run(self, messages, image_ratio, results, lock):
+        self.post('/api/save-preferences', {
+            'name': f'bench-{random.getrandbits(16)}',
+            'slang': self.slang,
+            'persona': self.persona,
+            'voice_enabled': self.voice_enabled
+        })
+        for _ in range(messages):
+            payload = {
+                'message': random.choice(MESSAGE_POOL),
+                'reply_mode': random.choice(['quick', 'detailed'])
+            }
+            if random.random() < image_ratio:
+                payload.update(image_data=TINY_PNG, image_mime='image/png')
+            status, elapsed = self.post('/api/chat', payload)
+            with lock:
+                results['latencies'].append(elapsed)
+                results['status'][status] = results['status'].get(status, 0) + 1
+
+
+def run_load(base_url, users, messages, image_ratio=0.05, voice_ratio=0.3):
+    """Run all simulated users concurrently and summarise /api/chat latency"""
+    results = {'latencies': [], 'status': {}}
+    lock = threading.Lock()
+    sessions = [
+        SimulatedUser(base_url, random.choice(SLANGS), random.choice(PERSONAS), random.random() < voice_ratio)
+        for _ in range(users)
+    ]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        for future in [pool.submit(s.run, messages, image_ratio, results, lock) for s in sessions]:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'duration_s': round(elapsed, 3),
+        'throughput_rps': round(len(results['latencies']) / elapsed, 3) if elapsed else 0.0,
+        'latency_ms': summarize(results['latencies']),
+        'status': {str(k): v for k, v in sorted(results['status'].items())},
+    }
+
+
+def stage_snapshot():
+    """Current (sum, count) of every nanban_stage_seconds series"""
+    from prometheus_client import REGISTRY
+    snapshot = {}
+    for family in REGISTRY.collect():
+        if family.name != 'nanban_stage_seconds':
+            continue
+        for sample in family.samples:
+            stage = sample.labels.get('stage')
+            if sample.name.endswith('_sum'):
+                snapshot.setdefault(stage, [0.0, 0.0])[0] = sample.value
+            elif sample.name.endswith('_count'):
+                snapshot.setdefault(stage, [0.0, 0.0])[1] = sample.value
+    return snapshot
+
+
+def stage_breakdown(before, after):
+    """Mean milliseconds and call count per stage between two snapshots"""
+    breakdown = {}
+    for stage, (total, count) in sorted(after.items()):
+        prev_total, prev_count = before.get(stage, (0.0, 0.0))
+        calls = count - prev_count
+        if calls:
+            breakdown[stage] = {
+                'calls': int(calls),
+                'mean_ms': round((total - prev_total) / calls * 1000, 3)
+            }
+    return breakdown
+
+
+def _time_calls(fn, iterations):
+    latencies = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return summarize(latencies)
+
+
+def bench_components(app_module, iterations):
+    """Micro-benchmarks for Database, NanbanBrain and VoiceHandler"""
+    db = app_module.db
+    user_id = db.create_user(name='bench', slang='CHENNAI', persona='JALIANA')
+    db.import_messages(user_id, [
+        ('user' if i % 2 == 0 else 'assistant', random.choice(MESSAGE_POOL), None)
+        for i in range(5000)
+    ])
+
+    results = {
+        'db.save_message': _time_calls(
+            lambda i: db.save_message(user_id, 'user', random.choice(MESSAGE_POOL)), iterations),
+        'db.get_conversation_history': _time_calls(
+            lambda i: db.get_conversation_history(user_id), iterations),
+        'db.get_conversation_page': _time_calls(
+            lambda i: db.get_conversation_page(user_id, before_id=2500, limit=20), iterations),
+        'db.search_messages': _time_calls(
+            lambda i: db.search_messages(user_id, 'exam interview', limit=5, match_any=True), iterations),
+        'brain.build_system_prompt': _time_calls(
+            lambda i: app_module.brain.build_system_prompt(SLANGS[i % 6], PERSONAS[i % 4], 'Ravi'), iterations),
+        'brain.chat': _time_calls(
+            lambda i: app_module.brain.chat('hi', slang=SLANGS[i % 6], persona=PERSONAS[i % 4]),
+            max(1, iterations // 10)),
+    }
+    if app_module.voice.enabled:
+        results['voice.text_to_speech'] = _time_calls(
+            lambda i: app_module.voice.text_to_speech('வணக்கம் மச்சி! எப்படி இருக்க?', SLANGS[i % 6], PERSONAS[i % 4]),
+            max(1, iterations // 10))
+    return results
+
+
+def compare(current, baseline, tolerance):
+    """List regressions: p95 latencies up, or throughput down, by more than tolerance"""
+    regressions = []
+
+    def check_latency(name, now, before):
+        if before and now and now > before * (1 + tolerance):
+            regressions.append(f'{name}: p95 {before:.2f}ms -> {now:.2f}ms')
+
+    check_latency('chat_endpoint', current['load']['latency_ms'].get('p95'),
+                  baseline.get('load', {}).get('latency_ms', {}).get('p95'))
+
+    before_rps = baseline.get('load', {}).get('throughput_rps')
+    now_rps = current['load']['throughput_rps']
+    if before_rps and now_rps < before_rps * (1 - tolerance):
+        regressions.append(f'throughput: {before_rps:.2f} -> {now_rps:.2f} req/s')
+
+    for name, stats in current.get('components', {}).items():
+        check_latency(name, stats.get('p95'), baseline.get('components', {}).get(name, {}).get('p95'))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Offline load test for Nanban AI')
+    parser.add_argument('--users', type=int, default=20, help='Concurrent simulated users')
+    parser.add_argument('--messages', type=int, default=10, help='Chat messages per user')
+    parser.add_argument('--image-ratio', type=float, default=0.05)
+    parser.add_argument('--voice-ratio', type=float, default=0.3)
+    parser.add_argument('--openai-latency-ms', type=float, default=300.0)
+    parser.add_argument('--tts-latency-ms', type=float, default=150.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--component-iterations', type=int, default=200)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--compare', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative regression')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+    random.seed(args.seed)
+
+    openai_mock = MockUpstream(OpenAIHandler, UpstreamProfile(
+        latency_ms=args.openai_latency_ms, jitter_ms=args.openai_latency_ms / 3, error_rate=args.error_rate
+    )).start()
+    tts_mock = MockUpstream(TTSHandler, UpstreamProfile(
+        latency_ms=args.tts_latency_ms, jitter_ms=args.tts_latency_ms / 3, error_rate=args.error_rate
+    )).start()
+
+    os.environ.update({
+        'OPENAI_API_KEY': 'sk-bench',
+        'OPENAI_BASE_URL': f'{openai_mock.url}/v1',
+        'TTS_API_ENDPOINT': tts_mock.url,
+        'LOG_LEVEL': os.environ.get('LOG_LEVEL', 'WARNING'),
+    })
+    os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+
+    # The app creates nanban.db in the working directory at import time
+    workdir = tempfile.mkdtemp(prefix='nanban-bench-')
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+
+    import app as app_module
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    before = stage_snapshot()
+    load = run_load(base_url, args.users, args.messages, args.image_ratio, args.voice_ratio)
+    stages = stage_breakdown(before, stage_snapshot())
+    components = bench_components(app_module, args.component_iterations)
+    server.shutdown()
+
+    report = {
+        'config': {k: v for k, v in vars(args).items() if k not in ('save_baseline', 'compare', 'baseline')},
+        'load': load,
+        'stages': stages,
+        'components': components,
+        'upstreams': {'openai': openai_mock.counts(), 'tts': tts_mock.counts()},
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    exit_code = 0
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f'No baseline at {args.baseline}; run with --save-baseline first', file=sys.stderr)
+            exit_code = 2
+        else:
+            with open(args.baseline, encoding='utf-8') as f:
+                regressions = compare(report, json.load(f), args.tolerance)
+            for line in regressions:
+                print(f'REGRESSION {line}', file=sys.stderr)
+            exit_code = 1 if regressions else 0
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f'Baseline saved to {args.baseline}', file=sys.stderr)
+
+    openai_mock.stop()
+    tts_mock.stop()
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+NANBAN AI - Memory Benchmark
+Per-worker memory as gunicorn runs it: the app is imported once in a
+master process, which then forks workers that each serve a few requests.
+Reports the master's RSS and, per worker, RSS, PSS and private memory
+(what each extra worker really costs) from /proc/<pid>/smaps_rollup.
+
+    python -m benchmarks.memory
+    python -m benchmarks.memory --workers 4 --requests 200
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside a fresh interpreter (Linux only); prints one JSON line
+PROBE = r'''
+import gc, json, os, sys
+sys.path.insert(0, sys.argv[1])
+workers, requests = int(sys.argv[2]), int(sys.argv[3])
+
+from memory_profiling import process_memory
+import app
+gc.collect()
+# As gunicorn.conf.py does before forking
+gc.freeze()
+master = process_memory()
+
+# Workers stay alive until all have reported, so shared pages are split between them
+release_read, release_write = os.pipe()
+pipes = []
+for _ in range(workers):
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        os.close(release_write)
+        app.reinit_after_fork()
+        client = app.app.test_client()
+        for i in range(requests):
+            client.get('/healthz')
+            client.get('/setup')
+            client.post('/api/chat', json={'message': f'exam-க்கு எப்படி prepare பண்றது {i}?'})
+            client.post('/api/chat', json={'message': 'hi'})
+        gc.collect()
+        os.write(write_end, json.dumps(process_memory()).encode())
+        os.close(write_end)
+        os.read(release_read, 1)
+        os._exit(0)
+    os.close(write_end)
+    pipes.append((pid, read_end))
+
+samples = []
+for pid, read_end in pipes:
+    with os.fdopen(read_end) as f:
+        samples.append(json.loads(f.read()))
+os.close(release_write)
+for pid, _ in pipes:
+    os.waitpid(pid, 0)
+print(json.dumps({'master': master, 'workers': samples}))
+'''
+
+
+def run_probe(workers, requests):
+    env = dict(os.environ, COMPLETION_BACKEND='template', OPENAI_API_KEY='', SCHEDULER='off',
+               LOG_LEVEL='WARNING', SESSION_BACKEND='cookie')
+    out = subprocess.run(
+        [sys.executable, '-c', PROBE, REPO_ROOT, str(workers), str(requests)],
+        cwd=tempfile.mkdtemp(prefix='nanban-mem-'), env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Per-worker memory benchmark for Nanban AI')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--requests', type=int, default=100, help='Request rounds per worker')
+    args = parser.parse_args(argv)
+
+    probe = run_probe(args.workers, args.requests)
+
+    def mib(value):
+        return round(value / 2**20, 2)
+
+    report = {
+        'master_rss_mib': mib(probe['master']['rss']),
+        'worker_mib': {
+            key: mib(statistics.median(worker[key] for worker in probe['workers']))
+            for key in ('rss', 'pss', 'private', 'shared')
+        },
+    }
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
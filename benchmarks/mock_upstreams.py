@@ -0,0 +1,213 @@
+"""
+NANBAN AI - Mock Upstreams
+Local stand-ins for the OpenAI chat/vision API and Google Cloud TTS (REST)
+
+Point the app at them with:
+    OPENAI_BASE_URL=http://127.0.0.1:<port>/v1
+    TTS_API_ENDPOINT=http://127.0.0.1:<port>
+"""
+
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MOCK_REPLIES = [
+    "மச்சி, செம்ம கேள்வி! கொஞ்சம் யோசிச்சு சொல்றேன்.",
+    "அட, சூப்பர்! இன்னைக்கு என்ன plan?",
+    "சரி சரி, புரிஞ்சுது. நல்லா பண்ணலாம்.",
+    "ஓஹோ! அப்படியா? இன்னும் கொஞ்சம் சொல்லு.",
+]
+# A few hundred bytes standing in for an MP3 clip
+MOCK_AUDIO = base64.b64encode(b'ID3' + bytes(range(256)) * 8).decode('ascii')
+
+
+@dataclass
+class UpstreamProfile:
+    """Latency and failure behaviour of a mock upstream"""
+    latency_ms: float = 300.0
+    jitter_ms: float = 100.0
+    error_rate: float = 0.0
+    chunk_delay_ms: float = 20.0
+
+    def delay(self):
+        time.sleep(max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000)
+
+    def should_fail(self):
+        return random.random() < self.error_rate
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    profile = UpstreamProfile()
+    stats = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _count(self, key):
+        with self.stats['lock']:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+
+class OpenAIHandler(_Handler):
+    """Implements POST /v1/chat/completions (plain and streaming)"""
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'not found'}})
+            return
+
+        request = self._read_json()
+        self._count('requests')
+        self.profile.delay()
+        if self.profile.should_fail():
+            self._count('errors')
+            self._send_json(500, {'error': {'message': 'mock upstream failure', 'type': 'server_error'}})
+            return
+
+        reply = random.choice(MOCK_REPLIES)
+        prompt_tokens = sum(len(json.dumps(m, ensure_ascii=False)) // 4 for m in request.get('messages', []))
+        completion_tokens = min(len(reply) // 2, request.get('max_tokens') or 150)
+        model = request.get('model', 'gpt-4o-mini')
+
+        if request.get('stream'):
+            self._stream(reply, model)
+            return
+
+        self._send_json(200, {
+            'id': f'chatcmpl-mock-{random.getrandbits(32):x}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': reply},
+                'finish_reason': 'stop'
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens
+            }
+        })
+
+    def _stream(self, reply, model):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def send(data):
+            payload = f'data: {data}\n\n'.encode('utf-8')
+            self.wfile.write(f'{len(payload):x}\r\n'.encode('ascii') + payload + b'\r\n')
+
+        created = int(time.time())
+        for word in reply.split(' '):
+            time.sleep(self.profile.chunk_delay_ms / 1000)
+            send(json.dumps({
+                'id': 'chatcmpl-mock-stream',
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': model,
+                'choices': [{'index': 0, 'delta': {'content': word + ' '}, 'finish_reason': None}]
+            }, ensure_ascii=False))
+        send('[DONE]')
+        self.wfile.write(b'0\r\n\r\n')
+
+
+class TTSHandler(_Handler):
+    """Implements POST /v1/text:synthesize (Google Cloud TTS REST)"""
+
+    def do_POST(self):
+        if not self.path.startswith('/v1/text:synthesize'):
+            self._send_json(404, {'error': {'message': 'not found'}})
+            return
+
+        self._read_json()
+        self._count('requests')
+        self.profile.delay()
+        if self.profile.should_fail():
+            self._count('errors')
+            self._send_json(503, {'error': {'code': 503, 'message': 'mock upstream failure'}})
+            return
+
+        self._send_json(200, {'audioContent': MOCK_AUDIO})
+
+
+class MockUpstream:
+    """A mock HTTP upstream running on a background thread"""
+
+    def __init__(self, handler, profile=None, host='127.0.0.1', port=0):
+        self.stats = {'lock': threading.Lock()}
+        handler_class = type(handler.__name__, (handler,), {
+            'profile': profile or UpstreamProfile(),
+            'stats': self.stats
+        })
+        self.server = ThreadingHTTPServer((host, port), handler_class)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def counts(self):
+        return {k: v for k, v in self.stats.items() if k != 'lock'}
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run mock OpenAI and Google TTS upstreams')
+    parser.add_argument('--openai-port', type=int, default=8081)
+    parser.add_argument('--tts-port', type=int, default=8082)
+    parser.add_argument('--latency-ms', type=float, default=300.0)
+    parser.add_argument('--tts-latency-ms', type=float, default=150.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    openai_mock = MockUpstream(
+        OpenAIHandler, UpstreamProfile(latency_ms=args.latency_ms, error_rate=args.error_rate),
+        port=args.openai_port
+    ).start()
+    tts_mock = MockUpstream(
+        TTSHandler, UpstreamProfile(latency_ms=args.tts_latency_ms, error_rate=args.error_rate),
+        port=args.tts_port
+    ).start()
+
+    print(f'OPENAI_BASE_URL={openai_mock.url}/v1')
+    print(f'TTS_API_ENDPOINT={tts_mock.url}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        openai_mock.stop()
+        tts_mock.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+NANBAN AI - Payload Benchmark
+Serialization time and wire size of typical API payloads: Flask's stdlib
+JSON provider versus FastJSONProvider, and gzip/brotli transfer sizes.
+
+    python -m benchmarks.payloads
+    python -m benchmarks.payloads --number 20000
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import timeit
+from datetime import datetime
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from compression import DYNAMIC_LEVELS, available_encodings, compress  # noqa: E402
+from json_provider import FastJSONProvider, orjson  # noqa: E402
+
+REPLY = 'மச்சி, நாளைக்கு exam-ஆ? முதல்ல ஒரு timetable போடு. தினமும் 2 மணி நேரம் படி, நடுவுல ஒரு tea break. கவலைப்படாதே, நீ கலக்குவ! 🔥'
+
+
+def chat_payload(audio_bytes=0):
+    """An /api/chat response; audio_bytes > 0 adds an inline base64 MP3"""
+    audio = None
+    if audio_bytes:
+        audio = 'data:audio/mp3;base64,' + base64.b64encode(random.randbytes(audio_bytes)).decode('ascii')
+    return {
+        'success': True,
+        'response': REPLY,
+        'audio_url': audio,
+        'timestamp': datetime(2026, 1, 15, 20, 30).isoformat(),
+        'fallback': False,
+        'suggestions': ['சரி', 'இன்னும் சொல்லு', 'அப்புறம்?'],
+    }
+
+
+def history_payload(messages=20):
+    """An /api/history page"""
+    return {
+        'messages': [
+            {
+                'id': 1000 + i,
+                'role': 'user' if i % 2 == 0 else 'assistant',
+                'content': REPLY if i % 2 else 'exam-க்கு எப்படி prepare பண்றது மச்சி?',
+                'timestamp': '2026-01-15 20:30:00',
+            }
+            for i in range(messages)
+        ],
+        'next_cursor': 1000,
+    }
+
+
+def run(number):
+    app = Flask(__name__)
+    providers = {'stdlib': DefaultJSONProvider(app), 'fast': FastJSONProvider(app)}
+    payloads = {
+        'chat': chat_payload(),
+        'chat_with_audio': chat_payload(audio_bytes=24000),
+        'history_page': history_payload(),
+    }
+
+    report = {'orjson': orjson is not None, 'encodings': list(available_encodings()), 'payloads': {}}
+    for name, payload in payloads.items():
+        row = {}
+        for label, provider in providers.items():
+            # As used by jsonify(): what goes on the wire before compression
+            with app.app_context():
+                body = provider.response(payload).get_data()
+                seconds = timeit.timeit(lambda: provider.response(payload), number=number)
+            row[label] = {'bytes': len(body), 'us_per_response': round(seconds / number * 1e6, 2)}
+
+        body = providers['fast'].response(payload).get_data()
+        for encoding in available_encodings():
+            level = DYNAMIC_LEVELS[encoding]
+            blob = compress(body, encoding, level)
+            seconds = timeit.timeit(lambda: compress(body, encoding, level), number=max(number // 10, 1))
+            row[encoding] = {
+                'bytes': len(blob),
+                'us_per_response': round(seconds / max(number // 10, 1) * 1e6, 2),
+            }
+        report['payloads'][name] = row
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='API payload serialization/compression benchmark')
+    parser.add_argument('--number', type=int, default=5000, help='Iterations per measurement')
+    args = parser.parse_args(argv)
+    random.seed(7)
+    print(json.dumps(run(args.number), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+NANBAN AI - Response Pipeline Benchmark
+Per-turn cost of the local response work added around each model call:
+mood/memory prompt lines, reply post-processing and suggestion lookup.
+
+    python -m benchmarks.response_pipeline
+    python -m benchmarks.response_pipeline --number 20000 --budget-ms 1
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from itertools import cycle
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from openai_brain import NanbanBrain  # noqa: E402
+from response_pipeline import MOODS  # noqa: E402
+
+# Replies shaped like real model output: markdown, emoji runs, a cut-off
+# reply, and a long explanation
+REPLIES = [
+    ('மச்சி, நாளைக்கு exam-ஆ? முதல்ல ஒரு timetable போடு. கவலைப்படாதே, நீ கலக்குவ! 🔥😄', 'stop'),
+    ('**சரி நண்பா**, இதோ steps:\n\n\n- முதல்ல notes எடு\n- அப்புறம் revise பண்ணு\n- நல்லா தூங்கு 😊', 'stop'),
+    ('ஏலே, அது ஒரு பெரிய கதை. முதல்ல அவன் வீட்டுக்கு போனான், அப்புறம் அங்க இருந்து', 'length'),
+    ('GST-ன்னா Goods and Services Tax. ' * 12 + 'புரிஞ்சுதா?', 'stop'),
+]
+
+
+def run(number):
+    brain = NanbanBrain()
+    route = brain.router.route('exam-க்கு எப்படி prepare பண்றது?')
+    combos = cycle([
+        (reply, finish_reason, slang, persona, mood)
+        for reply, finish_reason in REPLIES
+        for slang in brain.slang_rules
+        for persona in brain.persona_rules
+        for mood in MOODS
+    ])
+    facts = 'Name: Priya\nStudying for CA exams\nLikes filter coffee'
+
+    def turn():
+        reply, finish_reason, slang, persona, mood = next(combos)
+        brain._mood_and_memory(route, mood, facts)
+        return brain.respond(reply, slang, persona, '', mood, truncated=finish_reason == 'length')
+
+    for _ in range(min(number, 1000)):
+        turn()
+    samples = []
+    for _ in range(number):
+        start = time.perf_counter()
+        turn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+
+    def us(seconds):
+        return round(seconds * 1e6, 1)
+
+    return {
+        'turns': number,
+        'us_per_turn': {
+            'mean': us(statistics.fmean(samples)),
+            'p50': us(samples[len(samples) // 2]),
+            'p99': us(samples[int(len(samples) * 0.99)]),
+            'max': us(samples[-1]),
+        },
+        'example': brain.respond(REPLIES[1][0], 'CHENNAI', 'AMAITHIYANA', '', 'STRESSED'),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Response pipeline overhead benchmark')
+    parser.add_argument('--number', type=int, default=10000, help='Turns to time')
+    parser.add_argument('--budget-ms', type=float, default=1.0, help='Fail if p99 per turn exceeds this')
+    args = parser.parse_args(argv)
+
+    report = run(args.number)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    p99_ms = report['us_per_turn']['p99'] / 1000
+    if args.budget_ms and p99_ms > args.budget_ms:
+        print(f'Response pipeline p99 {p99_ms}ms per turn exceeds budget {args.budget_ms}ms', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+NANBAN AI - Check-in Analytics
+Weekly/monthly mood distributions and streaks from the check-in rollups
+"""
+
+import argparse
+import json
+import sys
+from datetime import date, timedelta
+
+import numpy as np
+
+PERIODS = ('week', 'month')
+# Most buckets a single trends query may cover (two years of weeks, three of months)
+MAX_BUCKETS = {'week': 106, 'month': 36}
+
+
+def period_start(day, period):
+    """First day (YYYY-MM-DD) of the ISO week or calendar month containing day"""
+    d = date.fromisoformat(day)
+    if period == 'week':
+        return (d - timedelta(days=d.weekday())).isoformat()
+    return d.replace(day=1).isoformat()
+
+
+def compute_rollups(user_ids, days, moods):
+    """
+    Rollup rows for check-ins given as parallel sequences sorted by
+    (user_id, day), computed with array operations instead of per row:
+
+        counts   [(user_id, period, period_start, mood, count), ...]
+        streaks  [(user_id, current_streak, longest_streak, last_day, total_days), ...]
+
+    current_streak is the run of consecutive days ending at last_day;
+    whether it is still alive depends on today, so readers decide that.
+    """
+    if not len(days):
+        return [], []
+
+    users = np.asarray(user_ids, dtype=np.int64)
+    dates = np.asarray(days, dtype='datetime64[D]')
+    ordinals = dates.astype(np.int64)
+    mood_names, mood_codes = np.unique(np.asarray([mood or '' for mood in moods], dtype=str), return_inverse=True)
+
+    # 1970-01-01 was a Thursday, so (ordinal + 3) % 7 is the weekday with Monday = 0
+    starts = {
+        'week': ordinals - (ordinals + 3) % 7,
+        'month': dates.astype('datetime64[M]').astype('datetime64[D]').astype(np.int64),
+    }
+    counts = []
+    for period in PERIODS:
+        keys, n = np.unique(np.stack([users, starts[period], mood_codes]), axis=1, return_counts=True)
+        counts.extend(zip(
+            keys[0].tolist(),
+            [period] * len(n),
+            keys[1].astype('datetime64[D]').astype(str).tolist(),
+            mood_names[keys[2]].tolist(),
+            n.tolist(),
+        ))
+
+    new_user = np.ones(len(users), dtype=bool)
+    new_user[1:] = users[1:] != users[:-1]
+    new_run = new_user.copy()
+    new_run[1:] |= np.diff(ordinals) != 1
+
+    run_starts = np.flatnonzero(new_run)
+    run_lengths = np.diff(np.append(run_starts, len(users)))
+    user_starts = np.flatnonzero(new_user)
+    user_ends = np.append(user_starts[1:], len(users)) - 1
+    first_runs = np.searchsorted(run_starts, user_starts)
+    last_runs = np.append(first_runs[1:], len(run_starts)) - 1
+
+    streaks = list(zip(
+        users[user_starts].tolist(),
+        run_lengths[last_runs].tolist(),
+        np.maximum.reduceat(run_lengths, first_runs).tolist(),
+        dates[user_ends].astype(str).tolist(),
+        (user_ends - user_starts + 1).tolist(),
+    ))
+    return counts, streaks
+
+
+def mood_trends(db, user_id, period='week', start=None, end=None, today=None):
+    """
+    Mood distribution per week or month between two days, plus streaks.
+
+    Only rollup rows are read (one per bucket and mood), so the cost
+    depends on the range asked for, not on how many check-ins a user has.
+    Raises ValueError for an unknown period or malformed/oversized range.
+    """
+    if period not in PERIODS:
+        raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+    today = today or date.today()
+    end = date.fromisoformat(end) if end else today
+    span = MAX_BUCKETS[period] * (7 if period == 'week' else 31)
+    start = date.fromisoformat(start) if start else end - timedelta(days=(12 * 7 if period == 'week' else 365))
+    if start > end:
+        raise ValueError('from must not be after to')
+    if (end - start).days > span:
+        raise ValueError(f'Range is limited to {MAX_BUCKETS[period]} {period}s')
+
+    buckets = {}
+    rows = db.get_checkin_mood_counts(
+        user_id, period, period_start(start.isoformat(), period), end.isoformat()
+    )
+    for row in rows:
+        bucket = buckets.setdefault(row['period_start'], {'start': row['period_start'], 'total': 0, 'moods': {}})
+        bucket['moods'][row['mood']] = row['count']
+        bucket['total'] += row['count']
+
+    streak = db.get_checkin_streak(user_id) or {
+        'current_streak': 0, 'longest_streak': 0, 'last_day': None, 'total_days': 0
+    }
+    # A run that ended before yesterday is broken
+    if not streak['last_day'] or date.fromisoformat(streak['last_day']) < today - timedelta(days=1):
+        streak['current_streak'] = 0
+
+    return {
+        'period': period,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'buckets': [buckets[key] for key in sorted(buckets)],
+        'streak': streak,
+    }
+
+
+def main(argv=None):
+    from database import Database
+
+    parser = argparse.ArgumentParser(description='Nanban AI check-in analytics')
+    parser.add_argument('--db', default='nanban.db', help='SQLite database path')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    rebuild_parser = subparsers.add_parser('rebuild', help='Recompute check-in rollups (after a backfill)')
+    rebuild_parser.add_argument('--user', type=int, action='append', help='User id (repeatable, default: all)')
+
+    trends_parser = subparsers.add_parser('trends', help="Print one user's mood trends")
+    trends_parser.add_argument('--user', type=int, required=True)
+    trends_parser.add_argument('--period', choices=PERIODS, default='week')
+    trends_parser.add_argument('--from', dest='start')
+    trends_parser.add_argument('--to', dest='end')
+
+    args = parser.parse_args(argv)
+    db = Database(args.db)
+
+    if args.command == 'rebuild':
+        print(json.dumps({'users': db.rebuild_checkin_rollups(user_ids=args.user)}), file=sys.stderr)
+    else:
+        print(json.dumps(mood_trends(db, args.user, args.period, args.start, args.end), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+NANBAN AI - Circuit Breaker
+Stops calling an upstream that keeps failing, and probes it again later
+"""
+
+import os
+import threading
+import time
+
+from observability import CIRCUIT_TRANSITIONS, get_logger
+
+logger = get_logger('circuit')
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    closed     calls go through; failure_threshold consecutive failures open it
+    open       calls are refused until reset_timeout has passed
+    half_open  one trial call goes through: success closes the circuit,
+               failure opens it again for another reset_timeout
+
+    State is per process; each gunicorn worker learns about an outage
+    from its own failed calls.
+    """
+
+    def __init__(self, service, failure_threshold=None, reset_timeout=None):
+        self.service = service
+        self.failure_threshold = failure_threshold or int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', 5))
+        self.reset_timeout = reset_timeout or float(os.environ.get('CIRCUIT_RESET_SECONDS', 30))
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def _current(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    def _transition(self, state):
+        self._state = state
+        CIRCUIT_TRANSITIONS.labels(service=self.service, state=state).inc()
+        logger.info('Circuit state changed', extra={'service': self.service, 'state': state})
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current()
+
+    @property
+    def is_open(self):
+        """True while calls are being refused (open, or half-open with its trial in flight)"""
+        with self._lock:
+            state = self._current()
+            return state == OPEN or (state == HALF_OPEN and self._trial_in_flight)
+
+    def allow(self):
+        """May a call go through now? In half-open state this claims the single trial"""
+        with self._lock:
+            state = self._current()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._trial_in_flight = False
+            if self._state != CLOSED:
+                self._transition(CLOSED)
+
+    def cancel_trial(self):
+        """Give back a claimed trial without a verdict (the call never reached the upstream)"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self._transition(OPEN)
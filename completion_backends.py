@@ -0,0 +1,163 @@
+"""
+NANBAN AI - Completion Backends
+What turns a chat prompt into a reply: the OpenAI API, any OpenAI-compatible
+server (e.g. a local llama.cpp/Ollama/vLLM endpoint), or an offline template
+engine built from NanbanBrain's slang and persona rules.
+"""
+
+import os
+import random
+import threading
+from collections import namedtuple
+
+from model_router import QUESTION_RE
+
+# Token counts in the shape of the OpenAI SDK's response.usage
+Usage = namedtuple('Usage', ['prompt_tokens', 'completion_tokens'])
+# finish_reason 'length' means the reply was cut at max_tokens; fallback is
+# True when the text is a stand-in rather than a model's answer
+Completion = namedtuple('Completion', ['text', 'usage', 'finish_reason', 'fallback'], defaults=('stop', False))
+
+
+class OpenAIBackend:
+    """
+    chat.completions against api.openai.com, or against base_url for a
+    local OpenAI-compatible server. model, when set, replaces the routed
+    model name (a local server only knows its own models).
+    """
+
+    remote = True
+
+    def __init__(self, name='openai', api_key=None, base_url=None, model=None):
+        self.name = name
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        """OpenAI client, created on first use"""
+        if self._client is None:
+            if not self.api_key:
+                raise ValueError("OPENAI_API_KEY not found in environment variables!")
+            with self._client_lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    self._client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        return self._client
+
+    def reset(self):
+        """Drop any client inherited across fork (its HTTP pool must not be shared)"""
+        with self._client_lock:
+            self._client = None
+
+    def complete(self, messages, model, max_tokens, context, **options):
+        response = self.client.chat.completions.create(
+            model=self.model or model,
+            messages=messages,
+            max_tokens=max_tokens,
+            **options
+        )
+        choice = response.choices[0]
+        return Completion(choice.message.content, getattr(response, 'usage', None), choice.finish_reason)
+
+
+# {addr} is how the user is addressed in their slang; the other slots are
+# filled from NanbanBrain.human_patterns
+LOCAL_TEMPLATES = {
+    'question': {
+        'casual': [
+            '{thinking}... இதுக்கு இப்போ சரியான பதில் சொல்ல முடியல {addr}. கொஞ்ச நேரம் கழிச்சு மறுபடியும் கேளு!{emoji}',
+            '{filler} {addr}, நல்ல கேள்வி! ஆனா இப்போ என் மூளை கொஞ்சம் offline. அப்புறம் விளக்கமா சொல்றேன்.{emoji}',
+            '{reaction} இதை ஒழுங்கா யோசிச்சு சொல்லணும் {addr}. கொஞ்சம் நேரம் குடு, மறுபடியும் கேளு.{emoji}',
+        ],
+        'formal': [
+            '{thinking}. இந்தக் கேள்விக்கு இப்போது முழுமையான பதில் தர இயலவில்லை {addr}. சற்று நேரம் கழித்து மீண்டும் கேளுங்கள்.',
+            'நல்ல கேள்வி {addr}. இப்போது விரிவாக விளக்க முடியவில்லை; சிறிது நேரத்தில் மீண்டும் முயற்சிக்கவும்.',
+        ],
+    },
+    'statement': {
+        'casual': [
+            '{filler}, {confirm} {addr}. {transition} என்ன ஆச்சு? இன்னும் சொல்லு!{emoji}',
+            '{reaction} {confirm} {addr}. அப்புறம்? முழுசா சொல்லு.{emoji}',
+            '{filler}... {confirm}. நீ சொல்லு {addr}, நான் கேட்டுட்டு இருக்கேன்.{emoji}',
+        ],
+        'formal': [
+            '{confirm} {addr}. மேலும் சொல்லுங்கள், கேட்டுக்கொண்டிருக்கிறேன்.',
+            '{filler}. {confirm}. {transition} என்ன நடந்தது என்று சொல்லுங்கள் {addr}.',
+        ],
+    },
+    'vision': {
+        'casual': [
+            '{reaction} photo வந்துச்சு {addr}, ஆனா இப்போ சரியா பாக்க முடியல. கொஞ்ச நேரம் கழிச்சு மறுபடியும் அனுப்பு!{emoji}',
+            '{filler} {addr}, இந்த photo-வ இப்போ படிக்க முடியல. என்ன இருக்குன்னு வார்த்தையில சொல்லு!{emoji}',
+        ],
+        'formal': [
+            'படம் கிடைத்தது {addr}, ஆனால் இப்போது அதைப் பார்க்க இயலவில்லை. அதில் உள்ளதை எழுத்தில் சொல்லுங்கள்.',
+        ],
+    },
+}
+
+
+class TemplateBackend:
+    """
+    Offline stand-in for the model: fills LOCAL_TEMPLATES with the user's
+    slang address, the brain's human patterns and the persona's register.
+    It never claims to answer a question it can't; it acknowledges and
+    asks the user to continue or retry. Needs no network, key or GPU, so
+    the app runs (and load tests run) with no upstream at all.
+    """
+
+    remote = False
+    name = 'template'
+
+    def __init__(self, brain):
+        self.brain = brain
+
+    def reset(self):
+        pass
+
+    def complete(self, messages, model, max_tokens, context, **options):
+        slang = context.get('slang', 'COMMON')
+        persona = context.get('persona', 'JALIANA')
+        user_name = context.get('user_name', '')
+        message = context.get('user_message') or ''
+        if context.get('kind') == 'vision':
+            kind = 'vision'
+        else:
+            kind = 'question' if QUESTION_RE.search(message) else 'statement'
+
+        brain = self.brain
+        register = 'formal' if persona in ('VILAKKAMAANA', 'AMAITHIYANA') else 'casual'
+        patterns = brain.human_patterns
+        text = random.choice(LOCAL_TEMPLATES[kind][register]).format(
+            addr=brain.instant.address(slang, persona, user_name),
+            filler=random.choice(patterns.fillers),
+            reaction=random.choice(patterns.reactions),
+            confirm=random.choice(patterns.confirmations),
+            transition=random.choice(patterns.transitions),
+            thinking=random.choice(patterns.thinking),
+            emoji=' 😄' if persona == 'JALIANA' else '',
+        )
+        return Completion(' '.join(text.split()), Usage(0, 0), fallback=True)
+
+
+BACKENDS = ('openai', 'local', 'template')
+
+
+def create_backend(name, brain):
+    """Build a backend by name (COMPLETION_BACKEND / COMPLETION_FAILOVER)"""
+    if name == 'openai':
+        return OpenAIBackend(api_key=brain.api_key)
+    if name == 'local':
+        return OpenAIBackend(
+            name='local',
+            api_key=os.environ.get('LOCAL_LLM_API_KEY', 'local'),
+            base_url=os.environ.get('LOCAL_LLM_BASE_URL', 'http://127.0.0.1:11434/v1'),
+            model=os.environ.get('LOCAL_LLM_MODEL', 'llama3.1'),
+        )
+    if name == 'template':
+        return TemplateBackend(brain)
+    raise ValueError(f"Unknown completion backend {name!r} (expected one of {', '.join(BACKENDS)})")
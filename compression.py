@@ -0,0 +1,74 @@
+"""
+NANBAN AI - Response Compression
+Negotiated gzip/brotli for API responses above a size threshold
+"""
+
+import gzip
+import os
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional; responses are gzip-only without it
+    brotli = None
+
+# Below this, compression saves less than it costs (about one TCP segment)
+MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+COMPRESSIBLE_TYPES = {'application/json', 'application/x-ndjson', 'text/plain', 'text/html', 'text/css'}
+
+# Fast settings for per-response work; build-time assets use the maximum
+DYNAMIC_LEVELS = {'br': 4, 'gzip': 6}
+STATIC_LEVELS = {'br': 11, 'gzip': 9}
+
+
+def available_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress(data, encoding, level):
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def negotiate(available):
+    """Best encoding among available that the client accepts, or None"""
+    for encoding in ('br', 'gzip'):
+        if encoding in available and request.accept_encodings[encoding]:
+            return encoding
+    return None
+
+
+def init_app(app, prefixes=('/api/',)):
+    """Compress responses under the given path prefixes"""
+
+    @app.after_request
+    def _compress(response):
+        if (
+            not request.path.startswith(prefixes)
+            or response.direct_passthrough
+            or response.is_streamed
+            or response.status_code < 200
+            or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES
+        ):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        if len(data) < MIN_BYTES:
+            return response
+        encoding = negotiate(available_encodings())
+        if encoding is None:
+            return response
+
+        response.set_data(compress(data, encoding, DYNAMIC_LEVELS[encoding]))
+        response.headers['Content-Encoding'] = encoding
+        # The compressed bytes differ, but the representation is the same:
+        # a weak validator still matches the view's If-None-Match check
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
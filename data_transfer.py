@@ -0,0 +1,236 @@
+"""
+NANBAN AI - Data Transfer
+Streaming export/import of user data as newline-delimited JSON
+"""
+
+import argparse
+import gzip
+import io
+import json
+import sys
+import tempfile
+import zlib
+from datetime import date, datetime
+
+from database import Database
+from memory_index import MemoryIndex
+
+EXPORT_VERSION = 1
+# Optional record fields that must be a string or null when present
+TEXT_FIELDS = ('name', 'slang', 'persona', 'facts', 'mood', 'reply_mode', 'note', 'timestamp')
+
+
+class ImportTooLarge(ValueError):
+    """The (decompressed) upload exceeds the import size limit"""
+
+
+def _dump(record):
+    """Serialize one record as a compact NDJSON line"""
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def iter_user_records(db, user_id, batch_size=1000):
+    """Yield export records for one user: profile, memory, check-ins, messages"""
+    user = db.get_user(user_id)
+    if not user:
+        return
+
+    yield {
+        'type': 'user',
+        'user_id': user['id'],
+        'name': user['name'],
+        'slang': user['slang'],
+        'persona': user['persona'],
+        'created_at': user['created_at']
+    }
+
+    memory = db.get_memory(user_id)
+    if memory.get('consent') is not None:
+        yield dict(memory, type='memory', user_id=user_id)
+
+    for checkin in db.iter_checkins(user_id, batch_size=batch_size):
+        yield dict(checkin, type='checkin', user_id=user_id)
+
+    for message in db.iter_conversations(user_id, batch_size=batch_size):
+        yield {
+            'type': 'message',
+            'user_id': user_id,
+            'role': message['role'],
+            'content': message['content'],
+            'timestamp': message['timestamp']
+        }
+
+
+def iter_export_lines(db, user_ids=None, batch_size=1000):
+    """Yield NDJSON lines for the given users (or every user if None)"""
+    yield _dump({
+        'type': 'header',
+        'version': EXPORT_VERSION,
+        'exported_at': datetime.now().isoformat()
+    })
+
+    if user_ids is None:
+        user_ids = db.iter_user_ids(batch_size=batch_size)
+
+    for user_id in user_ids:
+        for record in iter_user_records(db, user_id, batch_size=batch_size):
+            yield _dump(record)
+
+
+def gzip_chunks(lines, level=6):
+    """Compress an iterable of text lines into a stream of gzip chunks"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for line in lines:
+        chunk = compressor.compress(line.encode('utf-8'))
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+def _is_iso_day(value):
+    try:
+        return date.fromisoformat(value).isoformat() == value
+    except ValueError:
+        return False
+
+
+def iter_import_records(lines):
+    """Parse and validate NDJSON lines into records, checking and skipping the header"""
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f'line {number}: {e}') from e
+        if not isinstance(record, dict):
+            raise ValueError(f'line {number}: expected a JSON object')
+
+        kind = record.get('type')
+        if kind == 'header':
+            version = record.get('version', EXPORT_VERSION)
+            if not isinstance(version, int) or isinstance(version, bool) or version > EXPORT_VERSION:
+                raise ValueError(f'Unsupported export version: {version!r}')
+            continue
+        if not isinstance(record.get('user_id'), (int, str, type(None))):
+            raise ValueError(f'line {number}: user_id must be a number or a string')
+        for field in TEXT_FIELDS:
+            if not isinstance(record.get(field), (str, type(None))):
+                raise ValueError(f'line {number}: {field} must be a string or null')
+        if not isinstance(record.get('consent'), (bool, type(None))):
+            raise ValueError(f'line {number}: consent must be true, false or null')
+        if kind == 'checkin':
+            day = record.get('day')
+            if not (day and isinstance(day, str)):
+                raise ValueError(f'line {number}: check-in without a day')
+            if not _is_iso_day(day):
+                raise ValueError(f'line {number}: day must be YYYY-MM-DD, got {day!r}')
+        if kind == 'message' and not (isinstance(record.get('role'), str) and isinstance(record.get('content'), str)):
+            raise ValueError(f'line {number}: message without a role or content')
+        yield record
+
+
+def spool_import(stream, max_bytes, gzipped=False, chunk_size=64 * 1024):
+    """
+    Copy an upload into a temporary file and validate every line, so the
+    import transaction only starts once the whole body has arrived.
+
+    Returns a text file positioned at the start. Raises ImportTooLarge once
+    more than max_bytes (after decompression) have been read, ValueError for
+    malformed lines, and gzip/zlib errors for a corrupt gzip body.
+    """
+    if gzipped:
+        stream = gzip.GzipFile(fileobj=stream, mode='rb')
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    try:
+        size = 0
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise ImportTooLarge(f'import exceeds {max_bytes} bytes')
+            spool.write(chunk)
+
+        spool.seek(0)
+        text = io.TextIOWrapper(spool, encoding='utf-8')
+        for _ in iter_import_records(text):
+            pass
+        text.seek(0)
+        return text
+    except BaseException:
+        spool.close()
+        raise
+
+
+def import_lines(db, lines, target_user_id=None, batch_size=5000, memory_index=None):
+    """
+    Import NDJSON lines produced by iter_export_lines, all or nothing.
+
+    Each source user is recreated under a new id unless target_user_id is
+    given, in which case every record is imported into that user. Lines are
+    parsed as they stream in and messages and check-ins are written in
+    batches, so memory use stays bounded by batch_size regardless of input
+    size, but everything commits in one transaction: malformed input (a
+    ValueError naming the offending line) or a broken stream leaves the
+    database as it was. When a MemoryIndex is passed, imported memory facts
+    are re-embedded.
+    """
+    return db.import_records(
+        iter_import_records(lines),
+        target_user_id=target_user_id,
+        batch_size=batch_size,
+        embedder=memory_index.embedder if memory_index is not None else None
+    )
+
+
+def open_export_file(path, mode):
+    """Open an export file for text I/O, transparently handling .gz"""
+    if path == '-':
+        stream = sys.stdout if 'w' in mode else sys.stdin
+        return io.TextIOWrapper(stream.buffer, encoding='utf-8')
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export or import Nanban AI user data (NDJSON)')
+    parser.add_argument('--db', default='nanban.db', help='SQLite database path')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='Export users to NDJSON')
+    export_parser.add_argument('--user', type=int, action='append', help='User id (repeatable, default: all)')
+    export_parser.add_argument('--out', default='-', help='Output path (.gz to compress, - for stdout)')
+    export_parser.add_argument('--batch-size', type=int, default=1000)
+
+    import_parser = subparsers.add_parser('import', help='Import users from NDJSON')
+    import_parser.add_argument('--in', dest='src', default='-', help='Input path (.gz supported, - for stdin)')
+    import_parser.add_argument('--into-user', type=int, help='Import everything into this existing user')
+    import_parser.add_argument('--batch-size', type=int, default=5000)
+
+    args = parser.parse_args(argv)
+    db = Database(args.db)
+
+    if args.command == 'export':
+        with open_export_file(args.out, 'w') as out:
+            for line in iter_export_lines(db, user_ids=args.user, batch_size=args.batch_size):
+                out.write(line)
+    else:
+        with open_export_file(args.src, 'r') as src:
+            counts = import_lines(
+                db, src,
+                target_user_id=args.into_user,
+                batch_size=args.batch_size,
+                memory_index=MemoryIndex(db)
+            )
+        print(json.dumps(counts), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,25 +5,104 @@ SQLite database for user data and conversation storage
 
 import sqlite3
 import json
-from datetime import datetime
+import re
+from datetime import date, datetime, timedelta
 import os
+import logging
+import threading
+import time
+
+from checkin_analytics import compute_rollups, period_start
+from memory_index import HashingEmbedder, embed_facts
+
+logger = logging.getLogger('nanban.database')
+
+# unicode61 treats Tamil vowel signs and virama as separators, which would
+# shred every word into single consonants. Declaring them (and ZWNJ/ZWJ) as
+# token characters keeps whole Tamil words together in the FTS index.
+TAMIL_TOKENCHARS = (
+    '\u0b82\u0b83\u0bbe\u0bbf\u0bc0\u0bc1\u0bc2\u0bc6\u0bc7\u0bc8'
+    '\u0bca\u0bcb\u0bcc\u0bcd\u0bd7\u200c\u200d'
+)
+SEARCH_TERM_RE = re.compile(r'[\w\u0b82-\u0bd7\u200c\u200d]+')
 
 class Database:
+    # Maximum number of full-text matches ranked per search
+    SEARCH_WINDOW = 1000
+    # Bump whenever _create_schema changes so existing databases re-run it
+    SCHEMA_VERSION = 9
+    
     def __init__(self, db_path='nanban.db'):
         self.db_path = db_path
-        self.init_db()
+        self.fts_enabled = False
+        # Schema is checked lazily on the first connection
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
     
     def get_connection(self):
         """Get database connection"""
+        if not self._schema_ready:
+            self.init_db()
+        return self._connect()
+    
+    def _connect(self):
         conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row  # Return rows as dictionaries
         return conn
     
     def init_db(self):
-        """Initialize database tables"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
+        """Bring the schema up to SCHEMA_VERSION (a single PRAGMA when already current)"""
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute('PRAGMA user_version')
+            version = cursor.fetchone()[0]
+            
+            if version < self.SCHEMA_VERSION:
+                # Other processes may be migrating the same file: take the write
+                # lock first, then re-check whether one of them already finished
+                cursor.execute('BEGIN IMMEDIATE')
+                cursor.execute('PRAGMA user_version')
+                version = cursor.fetchone()[0]
+            
+            if version >= self.SCHEMA_VERSION:
+                cursor.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'conversations_fts'"
+                )
+                self.fts_enabled = cursor.fetchone() is not None
+            else:
+                self._create_schema(cursor)
+                if version < 6:
+                    # Rollups are new in v6: derive them from existing check-ins
+                    self._rebuild_checkin_rollups(cursor)
+                if version < 8:
+                    # Memory retrieval only reads chunks: index facts saved before it existed
+                    self._index_memory_facts(cursor)
+                cursor.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+                conn.commit()
+                logger.info('Database schema created', extra={
+                    'db_path': self.db_path, 'from_version': version, 'to_version': self.SCHEMA_VERSION
+                })
+            
+            conn.close()
+            self._schema_ready = True
+    
+    def _index_memory_facts(self, cursor):
+        """Chunk and embed consented memory facts of users who have no chunks yet"""
+        embedder = HashingEmbedder()
+        cursor.execute('''
+            SELECT user_id, facts FROM user_memory
+            WHERE consent = 1 AND COALESCE(facts, '') != ''
+            AND user_id NOT IN (SELECT DISTINCT user_id FROM memory_chunks)
+        ''')
+        for user_id, facts in cursor.fetchall():
+            self._replace_memory_chunks(cursor, user_id, embed_facts(facts, embedder))
+    
+    def _create_schema(self, cursor):
+        """Create all tables and indexes (idempotent)"""
         # Users table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS users (
@@ -48,6 +127,12 @@ class Database:
                 FOREIGN KEY (user_id) REFERENCES users (id)
             )
         ''')
+
+        # Per-user keyset index for paging through conversations
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_conversations_user_id
+            ON conversations (user_id, id)
+        ''')
         
         # User stats table
         cursor.execute('''
@@ -74,6 +159,21 @@ class Database:
             )
         ''')
 
+        # Memory fact chunks with float16 embeddings (see memory_index.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS memory_chunks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                text TEXT,
+                embedding BLOB,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_memory_chunks_user_id
+            ON memory_chunks (user_id, id)
+        ''')
+
         # Daily check-ins table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS user_checkins (
@@ -87,16 +187,257 @@ class Database:
             )
         ''')
         
-        conn.commit()
-        conn.close()
+        # Background batch jobs: per-request checkpoints and submitted upstream batches
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS batch_results (
+                job TEXT,
+                custom_id TEXT,
+                status TEXT,
+                content TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (job, custom_id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS batch_runs (
+                batch_id TEXT PRIMARY KEY,
+                job TEXT,
+                backend TEXT,
+                status TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Replies generated offline per slang/persona (greetings, suggestions)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS precomputed_replies (
+                kind TEXT,
+                slang TEXT,
+                persona TEXT,
+                content TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (kind, slang, persona)
+            )
+        ''')
+        
+        # Condensed memory facts generated offline
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS memory_summaries (
+                user_id INTEGER PRIMARY KEY,
+                summary TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        ''')
         
-        print("✅ Database initialized successfully")
+        # Server-side web sessions; the cookie only carries the session id.
+        # updated_at is the last write, last_seen the last (daily-sampled) visit
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                sid TEXT PRIMARY KEY,
+                data TEXT,
+                version INTEGER DEFAULT 1,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('PRAGMA table_info(sessions)')
+        if 'last_seen' not in {row[1] for row in cursor.fetchall()}:
+            # Sessions from before v9: their last write is the best guess at a last visit
+            cursor.execute('ALTER TABLE sessions ADD COLUMN last_seen TIMESTAMP')
+            cursor.execute('UPDATE sessions SET last_seen = updated_at')
+        cursor.execute('DROP INDEX IF EXISTS idx_sessions_updated_at')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_sessions_last_seen
+            ON sessions (last_seen)
+        ''')
+        
+        # Idempotency keys for client-retried requests (status_code NULL = in progress)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                key TEXT PRIMARY KEY,
+                request_hash TEXT,
+                status_code INTEGER,
+                content_type TEXT,
+                body BLOB,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created_at
+            ON idempotency_keys (created_at)
+        ''')
+        
+        # LLM usage per chat turn (user_id 0 = no account yet)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS usage_turns (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                day TEXT,
+                user_id INTEGER,
+                slang TEXT,
+                persona TEXT,
+                model TEXT,
+                tier TEXT,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                latency_ms INTEGER,
+                retries INTEGER,
+                cost_usd REAL
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_usage_turns_day
+            ON usage_turns (day)
+        ''')
+        
+        # Daily rollup of usage_turns, maintained on insert
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS usage_daily (
+                day TEXT,
+                user_id INTEGER,
+                slang TEXT,
+                persona TEXT,
+                model TEXT,
+                turns INTEGER DEFAULT 0,
+                prompt_tokens INTEGER DEFAULT 0,
+                completion_tokens INTEGER DEFAULT 0,
+                latency_ms INTEGER DEFAULT 0,
+                retries INTEGER DEFAULT 0,
+                cost_usd REAL DEFAULT 0,
+                PRIMARY KEY (day, user_id, slang, persona, model)
+            )
+        ''')
+        
+        # Check-in rollups, maintained by upsert_checkin: mood counts per
+        # week/month (period_start is the Monday or the 1st) and day streaks
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS checkin_mood_counts (
+                user_id INTEGER,
+                period TEXT,
+                period_start TEXT,
+                mood TEXT,
+                count INTEGER DEFAULT 0,
+                PRIMARY KEY (user_id, period, period_start, mood)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS checkin_streaks (
+                user_id INTEGER PRIMARY KEY,
+                current_streak INTEGER DEFAULT 0,
+                longest_streak INTEGER DEFAULT 0,
+                last_day TEXT,
+                total_days INTEGER DEFAULT 0
+            )
+        ''')
+        
+        # Scheduler: single-row leader lease and per-run history (epoch seconds)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scheduler_lease (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                owner TEXT,
+                expires_at REAL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS job_runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job TEXT,
+                owner TEXT,
+                status TEXT,
+                started_at REAL,
+                finished_at REAL,
+                duration_ms INTEGER,
+                result TEXT,
+                error TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_job_runs_job_started_at
+            ON job_runs (job, started_at)
+        ''')
+        
+        # Synthesized audio for common phrases, shared by all workers
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tts_cache (
+                key TEXT PRIMARY KEY,
+                audio TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        self.fts_enabled = self._init_fts(cursor)
+    
+    def ping(self):
+        """Check the database is reachable"""
+        conn = self.get_connection()
+        conn.execute('SELECT 1')
+        conn.close()
+    
+    def _init_fts(self, cursor):
+        """Create the FTS5 mirror of conversations and its sync triggers"""
+        try:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'conversations_fts'"
+            )
+            exists = cursor.fetchone() is not None
+            
+            # External-content index: stores only the index, rows live in conversations
+            cursor.execute(f'''
+                CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5(
+                    content,
+                    user_id,
+                    content='conversations',
+                    content_rowid='id',
+                    tokenize="unicode61 remove_diacritics 0 tokenchars '{TAMIL_TOKENCHARS}'",
+                    prefix='2 3'
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS conversations_fts_insert
+                AFTER INSERT ON conversations BEGIN
+                    INSERT INTO conversations_fts (rowid, content, user_id)
+                    VALUES (new.id, new.content, new.user_id);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS conversations_fts_delete
+                AFTER DELETE ON conversations BEGIN
+                    INSERT INTO conversations_fts (conversations_fts, rowid, content, user_id)
+                    VALUES ('delete', old.id, old.content, old.user_id);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS conversations_fts_update
+                AFTER UPDATE ON conversations BEGIN
+                    INSERT INTO conversations_fts (conversations_fts, rowid, content, user_id)
+                    VALUES ('delete', old.id, old.content, old.user_id);
+                    INSERT INTO conversations_fts (rowid, content, user_id)
+                    VALUES (new.id, new.content, new.user_id);
+                END
+            ''')
+            
+            # Index messages written before the FTS table existed
+            if not exists:
+                cursor.execute("INSERT INTO conversations_fts (conversations_fts) VALUES ('rebuild')")
+            
+            return True
+        except sqlite3.OperationalError as e:
+            logger.warning('SQLite FTS5 not available, search will use LIKE', extra={'error': str(e)})
+            return False
     
     def create_user(self, name='', slang='COMMON', persona='JALIANA'):
         """Create a new user"""
         conn = self.get_connection()
         cursor = conn.cursor()
+        user_id = self._insert_user(cursor, name, slang, persona)
+        conn.commit()
+        conn.close()
         
+        return user_id
+    
+    def _insert_user(self, cursor, name, slang, persona):
         cursor.execute('''
             INSERT INTO users (name, slang, persona)
             VALUES (?, ?, ?)
@@ -110,10 +451,45 @@ class Database:
             VALUES (?, ?, ?)
         ''', (user_id, slang, persona))
         
-        conn.commit()
+        return user_id
+    
+    def get_user(self, user_id):
+        """Get a user's profile"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT id, name, slang, persona, voice_enabled, created_at, last_active
+            FROM users
+            WHERE id = ?
+        ''', (user_id,))
+        
+        row = cursor.fetchone()
         conn.close()
         
-        return user_id
+        return dict(row) if row else None
+    
+    def iter_user_ids(self, batch_size=1000):
+        """Yield every user id in ascending order, one keyset page at a time"""
+        last_id = 0
+        while True:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id FROM users
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+            ''', (last_id, batch_size))
+            rows = cursor.fetchall()
+            conn.close()
+            
+            for row in rows:
+                yield row['id']
+            
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1]['id']
     
     def update_user_preferences(self, user_id, slang=None, persona=None, name=None):
         """Update user preferences"""
@@ -198,6 +574,92 @@ class Database:
         
         return history
     
+    def get_conversation_page(self, user_id, before_id=None, limit=20):
+        """Get one page of history older than before_id using id keyset pagination"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        # Fetch one extra row to know whether an older page exists
+        if before_id:
+            cursor.execute('''
+                SELECT id, role, content, timestamp
+                FROM conversations
+                WHERE user_id = ? AND id < ?
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (user_id, before_id, limit + 1))
+        else:
+            cursor.execute('''
+                SELECT id, role, content, timestamp
+                FROM conversations
+                WHERE user_id = ?
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (user_id, limit + 1))
+        
+        rows = cursor.fetchall()
+        conn.close()
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        return {
+            'messages': [dict(row) for row in reversed(rows)],
+            'next_cursor': rows[-1]['id'] if has_more else None
+        }
+    
+    def iter_conversations(self, user_id, batch_size=1000):
+        """Yield a user's messages oldest-first, one keyset page at a time"""
+        last_id = 0
+        while True:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, role, content, timestamp
+                FROM conversations
+                WHERE user_id = ? AND id > ?
+                ORDER BY id
+                LIMIT ?
+            ''', (user_id, last_id, batch_size))
+            rows = cursor.fetchall()
+            conn.close()
+            
+            for row in rows:
+                yield dict(row)
+            
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1]['id']
+    
+    def import_messages(self, user_id, messages):
+        """Bulk insert (role, content, timestamp) tuples in a single transaction"""
+        if not messages:
+            return 0
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        self._insert_messages(cursor, [(user_id, role, content, timestamp) for role, content, timestamp in messages])
+        conn.commit()
+        conn.close()
+        
+        return len(messages)
+    
+    def _insert_messages(self, cursor, rows):
+        """Insert (user_id, role, content, timestamp) rows and bump each user's message count"""
+        cursor.executemany('''
+            INSERT INTO conversations (user_id, role, content, timestamp)
+            VALUES (?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+        ''', rows)
+        
+        per_user = {}
+        for row in rows:
+            per_user[row[0]] = per_user.get(row[0], 0) + 1
+        cursor.executemany('''
+            UPDATE user_stats
+            SET total_messages = total_messages + ?
+            WHERE user_id = ?
+        ''', [(count, user_id) for user_id, count in per_user.items()])
+    
     def clear_conversation_history(self, user_id):
         """Clear all conversation history for a user"""
         conn = self.get_connection()
@@ -211,6 +673,55 @@ class Database:
         conn.commit()
         conn.close()
     
+    def search_messages(self, user_id, query, limit=10, match_any=False):
+        """Full-text search over a user's messages, best matches first"""
+        terms = [t for t in SEARCH_TERM_RE.findall(query or '') if len(t) > 1][:8]
+        if not user_id or not terms:
+            return []
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        if self.fts_enabled:
+            # Prefix match each term so Tamil suffixes (பிரியாணி -> பிரியாணிக்கு) still hit
+            joiner = ' OR ' if match_any else ' AND '
+            expression = joiner.join(f'"{term}"*' for term in terms)
+            match = f'user_id : "{int(user_id)}" AND content : ({expression})'
+            
+            # Very common terms can match a user's whole history; only rank the
+            # newest SEARCH_WINDOW matches so scoring cost stays bounded
+            cursor.execute('''
+                SELECT rowid FROM conversations_fts
+                WHERE conversations_fts MATCH ?
+                ORDER BY rowid DESC
+                LIMIT 1 OFFSET ?
+            ''', (match, self.SEARCH_WINDOW - 1))
+            floor = cursor.fetchone()
+            
+            cursor.execute('''
+                SELECT c.id, c.role, c.content, c.timestamp
+                FROM conversations_fts f
+                JOIN conversations c ON c.id = f.rowid
+                WHERE conversations_fts MATCH ? AND f.rowid >= ?
+                ORDER BY bm25(conversations_fts, 1.0, 0.0)
+                LIMIT ?
+            ''', (match, floor[0] if floor else 0, limit))
+        else:
+            joiner = ' OR ' if match_any else ' AND '
+            clause = joiner.join('content LIKE ?' for _ in terms)
+            cursor.execute(f'''
+                SELECT id, role, content, timestamp
+                FROM conversations
+                WHERE user_id = ? AND ({clause})
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (user_id, *[f'%{term}%' for term in terms], limit))
+        
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return [dict(row) for row in rows]
+    
     def get_user_stats(self, user_id):
         """Get user statistics"""
         conn = self.get_connection()
@@ -284,6 +795,18 @@ class Database:
 
         conn = self.get_connection()
         cursor = conn.cursor()
+        self._upsert_memory(cursor, user_id, consent, facts, mood, reply_mode)
+        conn.commit()
+        conn.close()
+
+    def _upsert_memory(self, cursor, user_id, consent, facts, mood, reply_mode):
+        # A summary of facts the user has since changed or withdrawn no longer applies
+        cursor.execute('''
+            DELETE FROM memory_summaries
+            WHERE user_id = ? AND (NOT ? OR EXISTS (
+                SELECT 1 FROM user_memory WHERE user_id = ? AND COALESCE(facts, '') != ?
+            ))
+        ''', (user_id, bool(consent), user_id, facts or ''))
         cursor.execute('''
             INSERT INTO user_memory (user_id, consent, facts, mood, reply_mode)
             VALUES (?, ?, ?, ?, ?)
@@ -294,8 +817,6 @@ class Database:
                 reply_mode=excluded.reply_mode,
                 updated_at=CURRENT_TIMESTAMP
         ''', (user_id, consent, facts, mood, reply_mode))
-        conn.commit()
-        conn.close()
 
     def clear_memory(self, user_id):
         """Clear user memory settings"""
@@ -304,9 +825,53 @@ class Database:
         conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute('DELETE FROM user_memory WHERE user_id = ?', (user_id,))
+        cursor.execute('DELETE FROM memory_chunks WHERE user_id = ?', (user_id,))
+        cursor.execute('DELETE FROM memory_summaries WHERE user_id = ?', (user_id,))
+        conn.commit()
+        conn.close()
+
+    def replace_memory_chunks(self, user_id, chunks):
+        """Replace a user's memory chunks with (text, embedding) tuples"""
+        if not user_id:
+            return
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        self._replace_memory_chunks(cursor, user_id, chunks)
         conn.commit()
         conn.close()
 
+    def _replace_memory_chunks(self, cursor, user_id, chunks):
+        cursor.execute('DELETE FROM memory_chunks WHERE user_id = ?', (user_id,))
+        cursor.executemany('''
+            INSERT INTO memory_chunks (user_id, text, embedding)
+            VALUES (?, ?, ?)
+        ''', [(user_id, text, embedding) for text, embedding in chunks])
+
+    def get_memory_chunks_version(self, user_id):
+        """Get the newest chunk id for a user (changes whenever chunks are replaced)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT MAX(id) AS version FROM memory_chunks WHERE user_id = ?', (user_id,))
+        version = cursor.fetchone()['version']
+        conn.close()
+        return version
+
+    def get_memory_chunks(self, user_id):
+        """Get a user's memory chunks in insertion order"""
+        if not user_id:
+            return []
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT text, embedding
+            FROM memory_chunks
+            WHERE user_id = ?
+            ORDER BY id
+        ''', (user_id,))
+        rows = cursor.fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+
     def get_checkin(self, user_id, day):
         """Get daily check-in for a user and day (YYYY-MM-DD)"""
         if not user_id:
@@ -329,11 +894,15 @@ class Database:
         }
 
     def upsert_checkin(self, user_id, day, mood, note):
-        """Upsert daily check-in"""
+        """Upsert daily check-in and fold it into the mood/streak rollups"""
         if not user_id:
             return
         conn = self.get_connection()
         cursor = conn.cursor()
+        # Take the write lock before reading the previous mood so rollups can't race
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('SELECT mood FROM user_checkins WHERE user_id = ? AND day = ?', (user_id, day))
+        previous = cursor.fetchone()
         cursor.execute('''
             INSERT INTO user_checkins (user_id, day, mood, note)
             VALUES (?, ?, ?, ?)
@@ -342,6 +911,781 @@ class Database:
                 note=excluded.note,
                 created_at=CURRENT_TIMESTAMP
         ''', (user_id, day, mood, note))
+        
+        if previous is not None:
+            if (previous['mood'] or '') != (mood or ''):
+                self._count_checkin_mood(cursor, user_id, day, previous['mood'], -1)
+                self._count_checkin_mood(cursor, user_id, day, mood, 1)
+        else:
+            cursor.execute('SELECT * FROM checkin_streaks WHERE user_id = ?', (user_id,))
+            streak = cursor.fetchone()
+            if streak is not None and day < streak['last_day']:
+                # A backfilled earlier day can join runs up: recompute this user
+                self._rebuild_checkin_rollups(cursor, [user_id])
+            else:
+                self._count_checkin_mood(cursor, user_id, day, mood, 1)
+                current, longest, total = 1, 1, 1
+                if streak is not None:
+                    gap = date.fromisoformat(day) - date.fromisoformat(streak['last_day'])
+                    current = streak['current_streak'] + 1 if gap == timedelta(days=1) else 1
+                    longest = max(streak['longest_streak'], current)
+                    total = streak['total_days'] + 1
+                cursor.execute('''
+                    INSERT OR REPLACE INTO checkin_streaks
+                        (user_id, current_streak, longest_streak, last_day, total_days)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (user_id, current, longest, day, total))
+        conn.commit()
+        conn.close()
+    
+    def _count_checkin_mood(self, cursor, user_id, day, mood, delta):
+        """Add delta to the week and month mood counts containing day"""
+        for period in ('week', 'month'):
+            cursor.execute('''
+                INSERT INTO checkin_mood_counts (user_id, period, period_start, mood, count)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(user_id, period, period_start, mood) DO UPDATE SET
+                    count=count + excluded.count
+            ''', (user_id, period, period_start(day, period), mood or '', delta))
+        cursor.execute('''
+            DELETE FROM checkin_mood_counts
+            WHERE user_id = ? AND mood = ? AND count <= 0
+        ''', (user_id, mood or ''))
+    
+    def _rebuild_checkin_rollups(self, cursor, user_ids=None):
+        """Recompute rollups from user_checkins for some users (default all); returns users rebuilt"""
+        if user_ids is None:
+            where, params = '', ()
+        else:
+            where, params = f"WHERE user_id IN ({', '.join('?' * len(user_ids))})", tuple(user_ids)
+        cursor.execute(f'SELECT user_id, day, mood FROM user_checkins {where} ORDER BY user_id, day', params)
+        rows = cursor.fetchall()
+        counts, streaks = compute_rollups(
+            [row['user_id'] for row in rows], [row['day'] for row in rows], [row['mood'] for row in rows]
+        )
+        
+        cursor.execute(f'DELETE FROM checkin_mood_counts {where}', params)
+        cursor.execute(f'DELETE FROM checkin_streaks {where}', params)
+        cursor.executemany('''
+            INSERT INTO checkin_mood_counts (user_id, period, period_start, mood, count)
+            VALUES (?, ?, ?, ?, ?)
+        ''', counts)
+        cursor.executemany('''
+            INSERT INTO checkin_streaks (user_id, current_streak, longest_streak, last_day, total_days)
+            VALUES (?, ?, ?, ?, ?)
+        ''', streaks)
+        return len(streaks)
+    
+    def rebuild_checkin_rollups(self, user_ids=None, batch_size=5000):
+        """Recompute check-in rollups after a backfill, batch_size users per transaction"""
+        if user_ids is None:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('SELECT DISTINCT user_id FROM user_checkins ORDER BY user_id')
+            user_ids = [row['user_id'] for row in cursor.fetchall()]
+            # Drop rollups of users who no longer have any check-ins
+            cursor.execute('DELETE FROM checkin_mood_counts')
+            cursor.execute('DELETE FROM checkin_streaks')
+            conn.commit()
+            conn.close()
+        
+        rebuilt = 0
+        for i in range(0, len(user_ids), batch_size):
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            rebuilt += self._rebuild_checkin_rollups(cursor, user_ids[i:i + batch_size])
+            conn.commit()
+            conn.close()
+        return rebuilt
+    
+    def get_checkin_mood_counts(self, user_id, period, start_day, end_day):
+        """Rollup rows for a user's week/month buckets starting between two days"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT period_start, mood, count
+            FROM checkin_mood_counts
+            WHERE user_id = ? AND period = ? AND period_start BETWEEN ? AND ?
+            ORDER BY period_start
+        ''', (user_id, period, start_day, end_day))
+        rows = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return rows
+    
+    def get_checkin_streak(self, user_id):
+        """A user's check-in streak rollup, or None before their first check-in"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT current_streak, longest_streak, last_day, total_days
+            FROM checkin_streaks
+            WHERE user_id = ?
+        ''', (user_id,))
+        row = cursor.fetchone()
+        conn.close()
+        return dict(row) if row else None
+    
+    def iter_checkins(self, user_id, batch_size=1000):
+        """Yield a user's check-ins in day order, one keyset page at a time"""
+        last_day = ''
+        while True:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT day, mood, note, created_at
+                FROM user_checkins
+                WHERE user_id = ? AND day > ?
+                ORDER BY day
+                LIMIT ?
+            ''', (user_id, last_day, batch_size))
+            rows = cursor.fetchall()
+            conn.close()
+            
+            for row in rows:
+                yield dict(row)
+            
+            if len(rows) < batch_size:
+                return
+            last_day = rows[-1]['day']
+    
+    def import_records(self, records, target_user_id=None, batch_size=5000, embedder=None):
+        """
+        Write parsed export records (see data_transfer.import_lines) in one
+        transaction, so an import that fails part-way leaves nothing behind.
+        Each source user is recreated under a new id unless target_user_id
+        is given. Messages and check-ins go out with executemany every
+        batch_size rows and check-in rollups are rebuilt once at the end.
+        With an embedder, imported memory facts are chunked and embedded.
+        """
+        user_map = {}
+        messages = []
+        checkins = []
+        checkin_users = set()
+        counts = {'users': 0, 'messages': 0, 'checkins': 0}
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        def flush():
+            if messages:
+                self._insert_messages(cursor, messages)
+                counts['messages'] += len(messages)
+                messages.clear()
+            if checkins:
+                cursor.executemany('''
+                    INSERT INTO user_checkins (user_id, day, mood, note)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(user_id, day) DO UPDATE SET
+                        mood=excluded.mood,
+                        note=excluded.note
+                ''', checkins)
+                counts['checkins'] += len(checkins)
+                checkins.clear()
+        
+        try:
+            for record in records:
+                kind = record.get('type')
+                source_id = record.get('user_id')
+                if source_id not in user_map:
+                    if target_user_id is not None:
+                        user_map[source_id] = target_user_id
+                    else:
+                        user_map[source_id] = self._insert_user(
+                            cursor,
+                            record.get('name') or '',
+                            record.get('slang') or 'COMMON',
+                            record.get('persona') or 'JALIANA'
+                        )
+                    counts['users'] += 1
+                user_id = user_map[source_id]
+                
+                if kind == 'memory':
+                    facts = record.get('facts', '')
+                    self._upsert_memory(
+                        cursor, user_id, record.get('consent'), facts, record.get('mood'), record.get('reply_mode')
+                    )
+                    if embedder is not None:
+                        self._replace_memory_chunks(
+                            cursor, user_id, embed_facts(facts if record.get('consent') else '', embedder)
+                        )
+                elif kind == 'checkin':
+                    checkins.append((user_id, record['day'], record.get('mood'), record.get('note')))
+                    checkin_users.add(user_id)
+                elif kind == 'message':
+                    messages.append((user_id, record['role'], record['content'], record.get('timestamp')))
+                
+                if len(messages) >= batch_size or len(checkins) >= batch_size:
+                    flush()
+            
+            flush()
+            if checkin_users:
+                # Imported days land anywhere in the history, so recompute rather than fold in
+                self._rebuild_checkin_rollups(cursor, sorted(checkin_users))
+            conn.commit()
+        finally:
+            # Closing without a commit rolls the whole import back
+            conn.close()
+        
+        return counts
+    
+    def iter_consented_memories(self, batch_size=500):
+        """Yield (user_id, facts) for users who consented and have facts"""
+        last_id = 0
+        while True:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT user_id, facts
+                FROM user_memory
+                WHERE user_id > ? AND consent = 1 AND facts IS NOT NULL AND facts != ''
+                ORDER BY user_id
+                LIMIT ?
+            ''', (last_id, batch_size))
+            rows = cursor.fetchall()
+            conn.close()
+            
+            for row in rows:
+                yield row['user_id'], row['facts']
+            
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1]['user_id']
+    
+    def save_memory_summaries(self, summaries):
+        """Bulk upsert (user_id, summary) tuples"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.executemany('''
+            INSERT INTO memory_summaries (user_id, summary)
+            VALUES (?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                summary=excluded.summary,
+                updated_at=CURRENT_TIMESTAMP
+        ''', summaries)
+        conn.commit()
+        conn.close()
+    
+    def get_memory_summary(self, user_id):
+        """Get the offline-generated summary of a user's current memory facts"""
+        if not user_id:
+            return None
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT summary FROM memory_summaries WHERE user_id = ?', (user_id,))
+        row = cursor.fetchone()
+        conn.close()
+        return row['summary'] if row else None
+    
+    def save_precomputed_replies(self, replies):
+        """Bulk upsert (kind, slang, persona, content) tuples"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.executemany('''
+            INSERT INTO precomputed_replies (kind, slang, persona, content)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(kind, slang, persona) DO UPDATE SET
+                content=excluded.content,
+                updated_at=CURRENT_TIMESTAMP
+        ''', replies)
+        conn.commit()
+        conn.close()
+    
+    def get_precomputed_replies(self, kind):
+        """Get {(slang, persona): content} for one kind of precomputed reply"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT slang, persona, content
+            FROM precomputed_replies
+            WHERE kind = ?
+        ''', (kind,))
+        rows = cursor.fetchall()
+        conn.close()
+        return {(row['slang'], row['persona']): row['content'] for row in rows}
+    
+    def get_batch_done_ids(self, job):
+        """Get the custom_ids of a job that already completed (for resuming)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT custom_id FROM batch_results
+            WHERE job = ? AND status = 'done'
+        ''', (job,))
+        done = {row['custom_id'] for row in cursor.fetchall()}
+        conn.close()
+        return done
+    
+    def save_batch_results(self, job, results):
+        """Checkpoint (custom_id, status, content) tuples for a job"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.executemany('''
+            INSERT INTO batch_results (job, custom_id, status, content)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(job, custom_id) DO UPDATE SET
+                status=excluded.status,
+                content=excluded.content,
+                updated_at=CURRENT_TIMESTAMP
+        ''', [(job, custom_id, status, content) for custom_id, status, content in results])
+        conn.commit()
+        conn.close()
+    
+    def save_batch_run(self, batch_id, job, backend, status):
+        """Record or update a submitted upstream batch"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO batch_runs (batch_id, job, backend, status)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(batch_id) DO UPDATE SET
+                status=excluded.status,
+                updated_at=CURRENT_TIMESTAMP
+        ''', (batch_id, job, backend, status))
+        conn.commit()
+        conn.close()
+    
+    def get_open_batch_runs(self, job, backend):
+        """Get ids of submitted batches for a job that have not been collected yet"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT batch_id FROM batch_runs
+            WHERE job = ? AND backend = ? AND status NOT IN ('collected', 'failed', 'expired', 'cancelled')
+            ORDER BY created_at
+        ''', (job, backend))
+        batch_ids = [row['batch_id'] for row in cursor.fetchall()]
+        conn.close()
+        return batch_ids
+    
+    def get_session(self, sid):
+        """Get (data_json, version, last_seen epoch seconds) for a web session, or None"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT data, version, CAST(strftime('%s', last_seen) AS INTEGER) AS last_seen
+            FROM sessions WHERE sid = ?
+        ''', (sid,))
+        row = cursor.fetchone()
+        conn.close()
+        return (row['data'], row['version'], row['last_seen']) if row else None
+    
+    def save_session(self, sid, data):
+        """Upsert a web session (a write is also a visit) and return its new version"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO sessions (sid, data) VALUES (?, ?)
+            ON CONFLICT(sid) DO UPDATE SET
+                data=excluded.data,
+                version=version + 1,
+                updated_at=CURRENT_TIMESTAMP,
+                last_seen=CURRENT_TIMESTAMP
+        ''', (sid, data))
+        cursor.execute('SELECT version FROM sessions WHERE sid = ?', (sid,))
+        version = cursor.fetchone()['version']
+        conn.commit()
+        conn.close()
+        return version
+    
+    def touch_session(self, sid):
+        """Record a visit to a web session without changing its data or version"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('UPDATE sessions SET last_seen = CURRENT_TIMESTAMP WHERE sid = ?', (sid,))
+        conn.commit()
+        conn.close()
+    
+    def delete_session(self, sid):
+        """Delete a web session"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+        conn.commit()
+        conn.close()
+    
+    def purge_sessions(self, max_age_days):
+        """Delete sessions not seen for max_age_days; returns the number removed"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            DELETE FROM sessions
+            WHERE last_seen < datetime('now', ?)
+        ''', (f'-{int(max_age_days)} days',))
+        removed = cursor.rowcount
+        conn.commit()
+        conn.close()
+        return removed
+    
+    def claim_idempotency_key(self, key, request_hash, stale_after_seconds):
+        """
+        Try to claim a key for processing. Returns (True, None) when claimed,
+        otherwise (False, row) with the existing claim or stored response.
+        In-progress claims older than stale_after_seconds are taken over.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            DELETE FROM idempotency_keys
+            WHERE key = ? AND status_code IS NULL AND created_at < datetime('now', ?)
+        ''', (key, f'-{int(stale_after_seconds)} seconds'))
+        cursor.execute('''
+            INSERT OR IGNORE INTO idempotency_keys (key, request_hash)
+            VALUES (?, ?)
+        ''', (key, request_hash))
+        claimed = cursor.rowcount == 1
+        row = None
+        if not claimed:
+            cursor.execute('''
+                SELECT request_hash, status_code, content_type, body
+                FROM idempotency_keys WHERE key = ?
+            ''', (key,))
+            row = cursor.fetchone()
+            row = dict(row) if row else None
+        conn.commit()
+        conn.close()
+        return claimed, row
+    
+    def get_idempotency_key(self, key):
+        """Get the claim or stored response for a key, or None"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT request_hash, status_code, content_type, body
+            FROM idempotency_keys WHERE key = ?
+        ''', (key,))
+        row = cursor.fetchone()
+        conn.close()
+        return dict(row) if row else None
+    
+    def complete_idempotency_key(self, key, status_code, content_type, body):
+        """Store the response for a claimed key"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE idempotency_keys
+            SET status_code = ?, content_type = ?, body = ?
+            WHERE key = ?
+        ''', (status_code, content_type, body, key))
+        conn.commit()
+        conn.close()
+    
+    def release_idempotency_key(self, key):
+        """Drop a claim so the request can be retried from scratch"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM idempotency_keys WHERE key = ?', (key,))
+        conn.commit()
+        conn.close()
+    
+    def purge_idempotency_keys(self, max_age_seconds):
+        """Delete keys older than max_age_seconds; returns the number removed"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            DELETE FROM idempotency_keys
+            WHERE created_at < datetime('now', ?)
+        ''', (f'-{int(max_age_seconds)} seconds',))
+        removed = cursor.rowcount
+        conn.commit()
+        conn.close()
+        return removed
+    
+    def record_usage(self, day, user_id, slang, persona, model, tier, prompt_tokens, completion_tokens,
+                     latency_ms, retries, cost_usd):
+        """Store one turn's LLM usage and fold it into the daily rollup"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO usage_turns
+                (day, user_id, slang, persona, model, tier, prompt_tokens, completion_tokens,
+                 latency_ms, retries, cost_usd)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (day, user_id, slang, persona, model, tier, prompt_tokens, completion_tokens,
+              latency_ms, retries, cost_usd))
+        cursor.execute('''
+            INSERT INTO usage_daily
+                (day, user_id, slang, persona, model, turns, prompt_tokens, completion_tokens,
+                 latency_ms, retries, cost_usd)
+            VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?, ?, ?)
+            ON CONFLICT(day, user_id, slang, persona, model) DO UPDATE SET
+                turns=turns + 1,
+                prompt_tokens=prompt_tokens + excluded.prompt_tokens,
+                completion_tokens=completion_tokens + excluded.completion_tokens,
+                latency_ms=latency_ms + excluded.latency_ms,
+                retries=retries + excluded.retries,
+                cost_usd=cost_usd + excluded.cost_usd
+        ''', (day, user_id, slang, persona, model, prompt_tokens, completion_tokens,
+              latency_ms, retries, cost_usd))
+        conn.commit()
+        conn.close()
+    
+    def get_daily_tokens(self, user_id, day):
+        """Total prompt + completion tokens a user spent on a day"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0) AS tokens
+            FROM usage_daily
+            WHERE day = ? AND user_id = ?
+        ''', (day, user_id))
+        tokens = cursor.fetchone()['tokens']
+        conn.close()
+        return tokens
+    
+    def get_usage_rollup(self, since_day, group_by):
+        """Sum usage_daily since a day, grouped by a tuple of its key columns"""
+        if not group_by or not set(group_by) <= {'day', 'user_id', 'slang', 'persona', 'model'}:
+            raise ValueError(f'Cannot group usage by {group_by}')
+        columns = ', '.join(group_by)
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT {columns},
+                SUM(turns) AS turns,
+                SUM(prompt_tokens) AS prompt_tokens,
+                SUM(completion_tokens) AS completion_tokens,
+                SUM(latency_ms) AS latency_ms,
+                SUM(retries) AS retries,
+                SUM(cost_usd) AS cost_usd
+            FROM usage_daily
+            WHERE day >= ?
+            GROUP BY {columns}
+        ''', (since_day,))
+        rows = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return rows
+    
+    def purge_usage_turns(self, before_day):
+        """Delete per-turn usage rows older than a day (rollups are kept)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM usage_turns WHERE day < ?', (before_day,))
+        removed = cursor.rowcount
+        conn.commit()
+        conn.close()
+        return removed
+    
+    def purge_conversations(self, max_age_days, batch_size=5000):
+        """
+        Delete messages older than max_age_days, batch_size rows per
+        transaction, lowering each user's total_messages in the same batch
+        """
+        removed = 0
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        while True:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('''
+                SELECT id, user_id FROM conversations
+                WHERE timestamp < datetime('now', ?)
+                LIMIT ?
+            ''', (f'-{int(max_age_days)} days', batch_size))
+            rows = cursor.fetchall()
+            cursor.executemany('DELETE FROM conversations WHERE id = ?', [(row['id'],) for row in rows])
+            
+            per_user = {}
+            for row in rows:
+                per_user[row['user_id']] = per_user.get(row['user_id'], 0) + 1
+            cursor.executemany('''
+                UPDATE user_stats
+                SET total_messages = MAX(total_messages - ?, 0)
+                WHERE user_id = ?
+            ''', [(count, user_id) for user_id, count in per_user.items()])
+            # Commit per batch so chat writes aren't blocked behind one long delete
+            conn.commit()
+            removed += len(rows)
+            if len(rows) < batch_size:
+                break
+        conn.close()
+        return removed
+    
+    def recompute_favorites(self):
+        """Set user_stats favorite slang/persona to the ones with the most chat turns"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        updated = 0
+        for column in ('slang', 'persona'):
+            cursor.execute(f'''
+                WITH totals AS (
+                    SELECT user_id, {column} AS value, SUM(turns) AS turns
+                    FROM usage_daily
+                    WHERE user_id != 0
+                    GROUP BY user_id, {column}
+                )
+                SELECT user_id, value
+                FROM (
+                    SELECT user_id, value,
+                        ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY turns DESC) AS rank
+                    FROM totals
+                )
+                WHERE rank = 1
+            ''')
+            favorites = [(row['value'], row['user_id'], row['value']) for row in cursor.fetchall()]
+            before = conn.total_changes
+            cursor.executemany(f'''
+                UPDATE user_stats
+                SET favorite_{column} = ?
+                WHERE user_id = ? AND favorite_{column} IS NOT ?
+            ''', favorites)
+            updated += conn.total_changes - before
+        conn.commit()
+        conn.close()
+        return updated
+    
+    def analyze(self):
+        """Refresh the query planner's statistics"""
+        conn = self.get_connection()
+        # Sample at most this many index rows per table so ANALYZE stays quick
+        conn.execute('PRAGMA analysis_limit = 1000')
+        conn.execute('ANALYZE')
+        conn.commit()
+        conn.close()
+    
+    def acquire_scheduler_lease(self, owner, now, lease_seconds):
+        """
+        Take the scheduler lease if it is free or expired, or renew our own.
+        Returns (held, previous_owner): previous_owner is the holder whose
+        expired lease we just took over, or None.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        # Read the current holder and replace it under one write lock
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('SELECT owner, expires_at FROM scheduler_lease WHERE id = 1')
+        row = cursor.fetchone()
+        cursor.execute('''
+            INSERT INTO scheduler_lease (id, owner, expires_at)
+            VALUES (1, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                owner=excluded.owner,
+                expires_at=excluded.expires_at
+            WHERE scheduler_lease.owner = excluded.owner OR scheduler_lease.expires_at < ?
+        ''', (owner, now + lease_seconds, now))
+        held = cursor.rowcount == 1
+        conn.commit()
+        conn.close()
+        previous_owner = row['owner'] if held and row is not None and row['owner'] != owner else None
+        return held, previous_owner
+    
+    def release_scheduler_lease(self, owner):
+        """Give up the scheduler lease so another worker can take it at once"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM scheduler_lease WHERE owner = ?', (owner,))
+        conn.commit()
+        conn.close()
+    
+    def start_job_run(self, job, owner, started_at):
+        """Record that a job started; returns the run id"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO job_runs (job, owner, status, started_at)
+            VALUES (?, ?, 'running', ?)
+        ''', (job, owner, started_at))
+        run_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        return run_id
+    
+    def finish_job_run(self, run_id, status, finished_at, duration_ms, result, error):
+        """Record how a job run ended"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE job_runs
+            SET status = ?, finished_at = ?, duration_ms = ?, result = ?, error = ?
+            WHERE id = ?
+        ''', (status, finished_at, duration_ms, result, error, run_id))
+        conn.commit()
+        conn.close()
+    
+    def abandon_job_runs(self, owner):
+        """Mark runs the given (lapsed) scheduler owner left 'running' as abandoned"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE job_runs
+            SET status = 'abandoned'
+            WHERE status = 'running' AND owner = ?
+        ''', (owner,))
+        abandoned = cursor.rowcount
+        conn.commit()
+        conn.close()
+        return abandoned
+    
+    def get_last_job_starts(self):
+        """Get {job: started_at} of each job's latest run"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT job, MAX(started_at) AS started_at FROM job_runs GROUP BY job')
+        starts = {row['job']: row['started_at'] for row in cursor.fetchall()}
+        conn.close()
+        return starts
+    
+    def get_job_runs(self, limit=20):
+        """Most recent job runs, newest first"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, job, owner, status, started_at, finished_at, duration_ms, result, error
+            FROM job_runs
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (limit,))
+        rows = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return rows
+    
+    def purge_job_runs(self, max_age_days):
+        """Delete job run history older than max_age_days"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            'DELETE FROM job_runs WHERE started_at < ?', (time.time() - max_age_days * 86400,)
+        )
+        removed = cursor.rowcount
+        conn.commit()
+        conn.close()
+        return removed
+    
+    def get_tts_cache(self, key):
+        """Cached audio data URL for a synthesis request key, or None"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT audio FROM tts_cache WHERE key = ?', (key,))
+        row = cursor.fetchone()
+        conn.close()
+        return row['audio'] if row else None
+    
+    def get_tts_cache_keys(self):
+        """Set of all cached synthesis request keys"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT key FROM tts_cache')
+        keys = {row['key'] for row in cursor.fetchall()}
+        conn.close()
+        return keys
+    
+    def save_tts_cache(self, key, audio):
+        """Store synthesized audio for a request key"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO tts_cache (key, audio)
+            VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                audio=excluded.audio,
+                created_at=CURRENT_TIMESTAMP
+        ''', (key, audio))
+        conn.commit()
+        conn.close()
+    
+    def delete_tts_cache(self, keys):
+        """Remove cached audio for the given request keys"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.executemany('DELETE FROM tts_cache WHERE key = ?', [(key,) for key in keys])
         conn.commit()
         conn.close()
     
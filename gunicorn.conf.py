@@ -0,0 +1,104 @@
+"""
+NANBAN AI - Gunicorn Production Profile
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Tunables (environment):
+    PORT                    Port to bind (default 5000)
+    WEB_CONCURRENCY         Worker processes (default 2 x CPU + 1, max 8)
+    GUNICORN_WORKER_CLASS   gthread (default), gevent or sync
+    GUNICORN_THREADS        Threads per gthread worker (default 8)
+    GUNICORN_TIMEOUT        Hard request timeout in seconds (default 60)
+    GRACEFUL_TIMEOUT        Seconds to drain in-flight chats on shutdown (default 30)
+"""
+
+import gc
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+
+if worker_class == 'gevent':
+    # Patch before the app is preloaded so sockets/threads in imported SDKs are cooperative
+    from gevent import monkey
+    monkey.patch_all()
+
+# Per-worker metric files so /metrics aggregates every worker (see observability.py).
+# Must be set before the app (and prometheus_client) is imported.
+_metrics_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'nanban-metrics')
+)
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+# Chat turns mostly wait on OpenAI/TTS, so threads (or greenlets) are cheap concurrency
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+worker_connections = 200
+
+# Import the app once in the master; workers share the pages
+preload_app = True
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+# OpenAI retries can take a few seconds; give in-flight chats time to finish
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+# Recycle workers occasionally to cap slow memory growth
+max_requests = 2000
+max_requests_jitter = 200
+
+accesslog = None  # the app writes structured access logs itself
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info').lower()
+
+
+def on_starting(server):
+    # Stale files from a previous run would be summed into the new metrics
+    shutil.rmtree(_metrics_dir, ignore_errors=True)
+    os.makedirs(_metrics_dir, exist_ok=True)
+
+
+def when_ready(server):
+    # Schema setup is otherwise lazy: run it here, once, rather than in every
+    # worker's first request (the connection is closed again before forking)
+    import app
+    app.db.init_db()
+    # The preloaded app is built; move its objects out of the collector's reach
+    # so workers' GC passes don't write to (and so copy) the pages they share
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # HTTP pools and gRPC channels created in the master must not be shared
+    import app
+    app.reinit_after_fork()
+
+
+def post_worker_init(worker):
+    # Gunicorn has installed its own SIGTERM handler by now; chain ours in front
+    # so readiness fails immediately while gunicorn drains in-flight requests
+    import app
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def drain(signum, frame):
+        # Runs between bytecodes of whatever thread holds a lock: no logging,
+        # DB or scheduler work here, that waits for worker_exit
+        app.start_draining()
+        if callable(previous):
+            previous(signum, frame)
+
+    signal.signal(signal.SIGTERM, drain)
+
+
+def worker_exit(server, worker):
+    # In-flight requests have drained; release the scheduler lease
+    import app
+    app.shutdown_worker()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,196 @@
+"""
+NANBAN AI - Idempotency
+Deduplicates client retries that carry an Idempotency-Key header: the
+first request runs, concurrent and later duplicates get its stored response.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+from flask import jsonify, make_response, request, session
+
+from observability import IDEMPOTENT_REQUESTS, get_logger
+
+logger = get_logger('idempotency')
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+PROCEED, REPLAY, CONFLICT, BUSY = 'processed', 'replayed', 'conflict', 'busy'
+
+
+class _Entry:
+    """A key this worker is processing or has recently completed"""
+
+    __slots__ = ('fingerprint', 'event', 'result', 'expires')
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.event = threading.Event()
+        self.result = None
+        self.expires = None
+
+
+class IdempotencyStore:
+    """
+    Two layers: an in-process table, so duplicates landing on the same
+    worker wait on an Event instead of polling, and the idempotency_keys
+    table, so duplicates on other gunicorn workers find the claim and poll
+    it until the response is stored.
+
+    Only 2xx responses are stored; anything else releases the key so the
+    client's next retry runs the request again. Requests with no user or
+    server-side session to scope the key to run without deduplication.
+    """
+
+    LOCAL_TTL = 600
+    POLL_INTERVAL = 0.2
+
+    def __init__(self, db, ttl=None, wait_timeout=None, stale_after=None):
+        self.db = db
+        self.ttl = ttl or int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 86400))
+        # How long a duplicate waits for the original before getting a 409
+        self.wait_timeout = wait_timeout or float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', 30))
+        # A claim this old was left by a crashed worker (gunicorn kills requests at its timeout)
+        self.stale_after = stale_after or int(os.environ.get('GUNICORN_TIMEOUT', 60)) * 2
+        self._local = {}
+        # (expires, scope, entry) of completed entries; LOCAL_TTL is fixed, so
+        # completion order is expiry order and eviction only looks at the front
+        self._expiry = deque()
+        self._lock = threading.Lock()
+
+    def _evict_expired(self, now):
+        while self._expiry and self._expiry[0][0] < now:
+            _, scope, entry = self._expiry.popleft()
+            if self._local.get(scope) is entry:
+                del self._local[scope]
+
+    def begin(self, scope, fingerprint):
+        """Return (outcome, result) where result is (status, content_type, body) for REPLAY"""
+        deadline = time.monotonic() + self.wait_timeout
+        with self._lock:
+            self._evict_expired(time.monotonic())
+            entry = self._local.get(scope)
+            owner = entry is None
+            if owner:
+                entry = self._local[scope] = _Entry(fingerprint)
+
+        if not owner:
+            if entry.fingerprint != fingerprint:
+                return CONFLICT, None
+            entry.event.wait(max(deadline - time.monotonic(), 0))
+            return (REPLAY, entry.result) if entry.result else (BUSY, None)
+
+        claimed, row = self.db.claim_idempotency_key(scope, fingerprint, self.stale_after)
+        while not claimed:
+            if row is None:
+                # Released by the other worker between our insert and select
+                claimed, row = self.db.claim_idempotency_key(scope, fingerprint, self.stale_after)
+                continue
+            if row['request_hash'] != fingerprint:
+                self._forget(scope)
+                return CONFLICT, None
+            if row['status_code'] is not None:
+                result = (row['status_code'], row['content_type'], row['body'])
+                self._finish(scope, result)
+                return REPLAY, result
+            if time.monotonic() >= deadline:
+                self._forget(scope)
+                return BUSY, None
+            time.sleep(self.POLL_INTERVAL)
+            row = self.db.get_idempotency_key(scope)
+        return PROCEED, None
+
+    def _finish(self, scope, result):
+        with self._lock:
+            entry = self._local.get(scope)
+            if entry is not None:
+                entry.result = result
+                entry.expires = time.monotonic() + self.LOCAL_TTL
+                self._expiry.append((entry.expires, scope, entry))
+                entry.event.set()
+
+    def _forget(self, scope):
+        with self._lock:
+            entry = self._local.pop(scope, None)
+        if entry is not None:
+            entry.event.set()
+
+    def complete(self, scope, status_code, content_type, body):
+        """Store the response of a request that ran"""
+        self.db.complete_idempotency_key(scope, status_code, content_type, body)
+        self._finish(scope, (status_code, content_type, body))
+
+    def purge(self):
+        """Delete stored keys older than the TTL (run by the scheduler)"""
+        return self.db.purge_idempotency_keys(self.ttl)
+
+    def release(self, scope):
+        """Forget a request that failed so a retry runs it again"""
+        self.db.release_idempotency_key(scope)
+        self._forget(scope)
+
+
+def caller_identity():
+    """'user:<id>', 'session:<sid>' or None when the caller can't be told apart"""
+    user_id = session.get('user_id')
+    if user_id:
+        return f'user:{user_id}'
+    sid = getattr(session, 'sid', None)
+    if sid:
+        return f'session:{sid}'
+    return None
+
+
+def idempotent(store):
+    """Make a POST view honour the Idempotency-Key header"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key:
+                return view(*args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return jsonify({'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'}), 400
+
+            # Keys are per user (or per server-side session before setup), and
+            # bound to the exact request body they were first used with
+            identity = caller_identity()
+            if identity is None:
+                # Nothing to keep one caller's keys apart from another's
+                return view(*args, **kwargs)
+            scope = f'{request.endpoint}:{identity}:{key}'
+            fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+
+            outcome, result = store.begin(scope, fingerprint)
+            IDEMPOTENT_REQUESTS.labels(outcome=outcome).inc()
+            if outcome == CONFLICT:
+                return jsonify({'error': f'{HEADER} was already used with a different request'}), 422
+            if outcome == BUSY:
+                response = jsonify({'error': 'The original request is still in progress'})
+                response.status_code = 409
+                response.headers['Retry-After'] = '1'
+                return response
+            if outcome == REPLAY:
+                status_code, content_type, body = result
+                response = make_response(body, status_code)
+                response.content_type = content_type
+                response.headers['Idempotent-Replayed'] = 'true'
+                return response
+
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                store.release(scope)
+                raise
+            if 200 <= response.status_code < 300 and not response.is_streamed:
+                store.complete(scope, response.status_code, response.content_type, response.get_data())
+            else:
+                store.release(scope)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,285 @@
+"""
+NANBAN AI - Instant Replies
+Answers common intents (greetings, thanks, bye, "who are you") and
+upstream-failure fallbacks locally, without calling OpenAI
+"""
+
+import os
+import random
+import re
+import threading
+import time
+
+from observability import INSTANT_REPLIES
+from response_pipeline import postprocess
+
+# Trigger phrases per intent, matched on normalized tokens
+INTENT_TRIGGERS = {
+    'greeting': [
+        'hi', 'hii', 'hello', 'hey', 'hai', 'helo', 'hola', 'yo', 'vanakkam', 'vanakam', 'வணக்கம்',
+        'ஹாய்', 'ஹலோ', 'good morning', 'good evening', 'good afternoon', 'gm', 'what\'s up', 'whats up',
+        'sup', 'enna machi', 'enna vishayam', 'என்ன விஷயம்',
+    ],
+    'how_are_you': [
+        'how are you', 'how r u', 'how are u', 'epdi irukka', 'epdi iruka', 'eppadi irukka',
+        'eppadi irukeenga', 'epdi irukeenga', 'nalla irukkiya', 'sugama', 'sowkiyama',
+        'எப்படி இருக்க', 'எப்படி இருக்கீங்க', 'எப்படி இருக்கே', 'சுகமா', 'நல்லா இருக்கியா',
+    ],
+    'thanks': [
+        'thanks', 'thank you', 'thank u', 'thx', 'tq', 'ty', 'tnx', 'nandri', 'romba nandri',
+        'நன்றி', 'ரொம்ப நன்றி', 'thanks a lot', 'super thanks',
+    ],
+    'bye': [
+        'bye', 'bye bye', 'goodbye', 'good night', 'gn', 'see you', 'see ya', 'tata', 'cya',
+        'poitu varen', 'poittu varen', 'apram pesalam', 'அப்புறம் பேசலாம்', 'போயிட்டு வரேன்', 'பை',
+    ],
+    'identity': [
+        'who are you', 'who r u', 'what are you', 'what is your name', 'your name', 'ur name',
+        'nee yaaru', 'nee yaar', 'yaar nee', 'yaaru nee', 'un peru enna', 'un per enna',
+        'நீ யாரு', 'நீ யார்', 'யார் நீ', 'யாரு நீ', 'உன் பேரு என்ன', 'உன் பெயர் என்ன',
+    ],
+}
+
+# Words that may surround a trigger without changing the intent ("hi machi", "thanks da")
+FILLER_WORDS = {
+    'machi', 'macha', 'machan', 'nanba', 'nanban', 'bro', 'da', 'di', 'dei', 'dai', 'thala',
+    'anne', 'anna', 'sami', 'ele', 'le', 'ji', 'sir', 'buddy', 'friend', 'ok', 'okay', 'so', 'much',
+    'மச்சி', 'நண்பா', 'நண்பன்', 'டா', 'டி', 'அண்ணே', 'சாமி', 'தல', 'ஏலே', 'லே', 'ஓகே',
+}
+
+# How the friend addresses the user in each slang when no name is known
+SLANG_ADDRESS = {
+    'CHENNAI': 'மச்சி',
+    'KOVAI': 'சாமி',
+    'MADURAI': 'அண்ணே',
+    'NELLAI': 'லே',
+    'EELAM': 'அப்பா',
+    'COMMON': 'நண்பா',
+}
+
+# Reply templates; {addr} is the name or slang address, {emoji} is empty outside JALIANA
+REPLY_TEMPLATES = {
+    'how_are_you': [
+        'நல்லா இருக்கேன் {addr}! நீ எப்படி இருக்க?{emoji}',
+        '{reaction} நான் சூப்பரா இருக்கேன் {addr}. உன் பக்கம் என்ன விஷயம்?{emoji}',
+        'ம்ம்ம், நல்லாத்தான் போகுது {addr}. நீ சொல்லு, எப்படி இருக்க?',
+    ],
+    'thanks': [
+        'இதுக்கெல்லாம் thanks எதுக்கு {addr}!{emoji}',
+        '{confirm} {addr}, எப்போ வேணும்னாலும் கேளு.{emoji}',
+        'அட, நம்ம friend-க்கு பண்ணாம யாருக்கு பண்றது {addr}!{emoji}',
+    ],
+    'bye': [
+        'சரி {addr}, அப்புறம் பேசலாம்!{emoji}',
+        'பத்திரமா இரு {addr}. bye!{emoji}',
+        'ஓகே {addr}, எப்போ வேணும்னாலும் வா. பேசலாம்!{emoji}',
+    ],
+    'identity': [
+        'நான் உன் நண்பன் தான் {addr}! நம்ம ஊரு பேச்சு, நம்ம ஊரு vibe.{emoji}',
+        'நான் நண்பன் {addr}, உன் கூட பேச எப்பவும் ready.{emoji}',
+        'உன் ஊரு நண்பன் {addr}! என்ன வேணும்னாலும் சொல்லு.{emoji}',
+    ],
+}
+
+FALLBACK_TEMPLATES = {
+    'chat': {
+        'casual': [
+            '{addr}, சாரி டா... கொஞ்சம் technical issue. மறுபடியும் try பண்ணு! 😅',
+            'அய்யோ {addr}, line கொஞ்சம் slow-ஆ இருக்கு. இன்னொரு தடவை அனுப்பு! 😅',
+            'ஒரு நிமிஷம் {addr}, கொஞ்சம் glitch. மறுபடியும் கேளு!',
+        ],
+        'formal': [
+            'மன்னிக்கவும், technical issue உள்ளது. மீண்டும் முயற்சிக்கவும்.',
+            'மன்னிக்கவும் {addr}, சிறிய தடங்கல். சற்று நேரம் கழித்து மீண்டும் முயற்சிக்கவும்.',
+        ],
+    },
+    'budget': {
+        'casual': [
+            '{addr}, இன்னைக்கு நிறைய பேசிட்டோம்! கொஞ்சம் rest எடுத்துட்டு நாளைக்கு continue பண்ணலாம் 😄',
+            'இன்னைக்கு quota முடிஞ்சுது {addr}. நாளைக்கு fresh-ஆ பேசலாம்!',
+        ],
+        'formal': [
+            'இன்றைய உரையாடல் வரம்பை அடைந்துவிட்டீர்கள். நாளை மீண்டும் தொடரலாம்.',
+        ],
+    },
+    'vision': {
+        'casual': [
+            '{addr}, படம் படிக்க முடியல. இன்னொரு தடவை try பண்ணு 😅',
+            'அய்யோ {addr}, படம் சரியா load ஆகல. மறுபடியும் அனுப்பு!',
+        ],
+        'formal': [
+            'மன்னிக்கவும், படத்தை படிக்க இயலவில்லை. மீண்டும் முயற்சிக்கவும்.',
+        ],
+    },
+}
+
+PERSONA_EMOJI = {'JALIANA': (' 😄', ' 😊', ' 🔥')}
+
+# Messages longer than this are never treated as a simple intent
+MAX_TOKENS = 6
+
+TOKEN_SPLIT_RE = re.compile(r"[^\w\u0B80-\u0BFF']+")
+REPEAT_RE = re.compile(r'([a-z])\1+')
+
+
+def normalize(text):
+    """Lowercase, drop punctuation/emoji and squeeze repeated Latin letters ("hiiii" -> "hi")"""
+    tokens = TOKEN_SPLIT_RE.split(text.lower())
+    return [REPEAT_RE.sub(r'\1', token) for token in tokens if token]
+
+
+class InstantReplies:
+    """
+    Token trie of intent triggers plus precomputed reply templates per
+    (intent, slang, persona). A message only matches when every token is a
+    trigger, a filler word or the user's name, so "hi, explain GST" still
+    goes to the model.
+
+    INSTANT_REPLIES=off disables matching (fallbacks still work).
+    """
+
+    GREETINGS_TTL = 600
+
+    def __init__(self, brain, enabled=None):
+        self.brain = brain
+        if enabled is None:
+            enabled = os.environ.get('INSTANT_REPLIES', 'on').lower() not in ('0', 'off', 'false', 'no')
+        self.enabled = enabled
+        self.trie = {}
+        self.fillers = {REPEAT_RE.sub(r'\1', word) for word in FILLER_WORDS}
+        for intent, phrases in INTENT_TRIGGERS.items():
+            for phrase in phrases:
+                self._insert(normalize(phrase), intent)
+        self.templates = self._build_templates()
+
+        # Batch-generated greetings (batch_jobs.py greetings), loaded lazily
+        self._greetings_loader = None
+        self._greetings = {}
+        self._greetings_loaded_at = None
+        self._greetings_lock = threading.Lock()
+
+    def _insert(self, tokens, intent):
+        node = self.trie
+        for token in tokens:
+            node = node.setdefault(token, {})
+        node[None] = intent
+
+    def _build_templates(self):
+        patterns = self.brain.human_patterns
+        templates = {}
+        for slang in self.brain.slang_rules:
+            for persona in self.brain.persona_rules:
+                emojis = PERSONA_EMOJI.get(persona, ('',))
+                for intent, texts in REPLY_TEMPLATES.items():
+                    templates[(intent, slang, persona)] = tuple(
+                        text.replace('{emoji}', emojis[i % len(emojis)])
+                            .replace('{reaction}', patterns.reactions[i % len(patterns.reactions)])
+                            .replace('{confirm}', patterns.confirmations[i % len(patterns.confirmations)])
+                        for i, text in enumerate(texts)
+                    )
+        return templates
+
+    def use_precomputed_greetings(self, loader):
+        """Also draw greetings from loader() -> {(slang, persona): text}"""
+        self._greetings_loader = loader
+
+    def _greetings_stale(self):
+        loaded_at = self._greetings_loaded_at
+        return loaded_at is None or time.monotonic() - loaded_at > self.GREETINGS_TTL
+
+    def _precomputed_greeting(self, slang, persona):
+        if self._greetings_loader is None:
+            return None
+        if self._greetings_stale():
+            with self._greetings_lock:
+                if self._greetings_stale():
+                    try:
+                        self._greetings = self._greetings_loader()
+                    except Exception:
+                        self._greetings = {}
+                    self._greetings_loaded_at = time.monotonic()
+        return self._greetings.get((slang, persona))
+
+    def classify(self, message, user_name=''):
+        """Return the intent of a short message, or None"""
+        tokens = normalize(message)
+        if not tokens or len(tokens) > MAX_TOKENS:
+            return None
+        skip = self.fillers | set(normalize(user_name or ''))
+
+        intent = None
+        i = 0
+        while i < len(tokens):
+            # Longest trigger starting at token i
+            node, j, found, end = self.trie, i, None, i
+            while j < len(tokens) and tokens[j] in node:
+                node = node[tokens[j]]
+                j += 1
+                if None in node:
+                    found, end = node[None], j
+            if found:
+                intent, i = found, end
+            elif tokens[i] in skip:
+                i += 1
+            else:
+                return None
+        return intent
+
+    def address(self, slang, persona, user_name):
+        if user_name:
+            return user_name
+        if persona == 'VILAKKAMAANA':
+            return 'நண்பரே'
+        return SLANG_ADDRESS.get(slang, SLANG_ADDRESS['COMMON'])
+
+    def match(self, message, slang='COMMON', persona='JALIANA', user_name=''):
+        """Instant reply for a common intent, or None to fall through to the model"""
+        if not self.enabled or not message:
+            return None
+        intent = self.classify(message, user_name)
+        INSTANT_REPLIES.labels(result=intent or 'miss').inc()
+        if intent is None:
+            return None
+
+        if intent == 'greeting':
+            options = [self.brain._get_example_opening(slang, persona, user_name)]
+            precomputed = self._precomputed_greeting(slang, persona)
+            if precomputed:
+                options.append(precomputed)
+            if persona != 'VILAKKAMAANA':
+                pattern = self.brain.slang_rules.get(slang, self.brain.slang_rules['COMMON']).sentence_patterns[0]
+                options.append(' '.join(pattern.replace('{name}', user_name or '').split()))
+            return random.choice(options)
+
+        templates = self.templates.get((intent, slang, persona)) or self.templates[(intent, 'COMMON', 'JALIANA')]
+        return random.choice(templates).replace('{addr}', self.address(slang, persona, user_name))
+
+    def common_phrases(self):
+        """
+        Yield (text, slang, persona) for every reply match() gives a user
+        without a name, i.e. the phrases worth keeping pre-synthesized.
+        Texts are post-processed as NanbanBrain.respond delivers them.
+        """
+        for text, slang, persona in self._phrases():
+            yield postprocess(text, persona), slang, persona
+
+    def _phrases(self):
+        for slang in self.brain.slang_rules:
+            for persona in self.brain.persona_rules:
+                yield self.brain._get_example_opening(slang, persona, ''), slang, persona
+                precomputed = self._precomputed_greeting(slang, persona)
+                if precomputed:
+                    yield precomputed, slang, persona
+                if persona != 'VILAKKAMAANA':
+                    pattern = self.brain.slang_rules[slang].sentence_patterns[0]
+                    yield ' '.join(pattern.replace('{name}', '').split()), slang, persona
+                address = self.address(slang, persona, '')
+                for intent in REPLY_TEMPLATES:
+                    for text in self.templates[(intent, slang, persona)]:
+                        yield text.replace('{addr}', address), slang, persona
+
+    def fallback(self, slang='COMMON', persona='JALIANA', user_name='', kind='chat'):
+        """Varied local reply for when the model can't be reached (or the user is over budget)"""
+        register = 'casual' if persona == 'JALIANA' else 'formal'
+        text = random.choice(FALLBACK_TEMPLATES[kind][register])
+        return text.replace('{addr}', self.address(slang, persona, user_name))
@@ -0,0 +1,59 @@
+"""
+NANBAN AI - JSON Provider
+Compact UTF-8 JSON for Flask, using orjson when installed
+"""
+
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional; falls back to the stdlib encoder
+    orjson = None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider that always emits compact, unsorted UTF-8 JSON.
+
+    Tamil text is sent as raw UTF-8 (3 bytes a character) rather than
+    \\uXXXX escapes (6 bytes). orjson is used when available; anything it
+    rejects (e.g. integers beyond 64 bits) goes through the stdlib path.
+    """
+
+    ensure_ascii = False
+    sort_keys = False
+    compact = True
+
+    if orjson is not None:
+        # Datetimes go through Flask's default so they keep its HTTP-date format
+        OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps_bytes(self, obj):
+        """Serialize obj to UTF-8 bytes"""
+        if orjson is not None:
+            try:
+                return orjson.dumps(obj, default=self.default, option=self.OPTIONS)
+            except (orjson.JSONEncodeError, TypeError):
+                pass
+        return json.dumps(
+            obj, default=self.default, ensure_ascii=False, separators=(',', ':')
+        ).encode('utf-8')
+
+    def dumps(self, obj, **kwargs):
+        if kwargs or orjson is None:
+            kwargs.setdefault('default', self.default)
+            kwargs.setdefault('ensure_ascii', False)
+            kwargs.setdefault('separators', (',', ':'))
+            return json.dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs or orjson is None:
+            return json.loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
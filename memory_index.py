@@ -0,0 +1,142 @@
+"""
+NANBAN AI - Memory Index
+Per-user fact chunks with local hashed n-gram embeddings and top-k retrieval
+"""
+
+import re
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+# Split free-text memory into facts on line breaks and sentence punctuation
+FACT_SPLIT_RE = re.compile(r'[\n\r]+|(?<=[.!?;।])\s+')
+MAX_CHUNK_CHARS = 200
+
+
+class HashingEmbedder:
+    """
+    Character n-gram feature hashing into a fixed-size vector.
+
+    Works on Tamil, Tanglish and English alike without a model download:
+    n-grams are hashed into `dim` signed buckets and the result is L2
+    normalised, so a dot product is a cosine similarity.
+    """
+
+    def __init__(self, dim=256, ngram_range=(2, 4)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in (text or '').lower().split():
+            padded = f' {word} '
+            for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+                for i in range(len(padded) - n + 1):
+                    h = zlib.crc32(padded[i:i + n].encode('utf-8'))
+                    # Low bit picks the sign so collisions tend to cancel out
+                    vector[(h >> 1) % self.dim] += 1.0 if h & 1 else -1.0
+
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector
+
+
+def split_facts(facts):
+    """Split a free-text memory blob into short fact chunks"""
+    chunks = []
+    for part in FACT_SPLIT_RE.split(facts or ''):
+        part = ' '.join(part.split())
+        while part:
+            chunks.append(part[:MAX_CHUNK_CHARS])
+            part = part[MAX_CHUNK_CHARS:].strip()
+    return chunks
+
+
+def embed_facts(facts, embedder):
+    """(text, float16 embedding bytes) rows for a memory blob's fact chunks"""
+    return [
+        (chunk, embedder.embed(chunk).astype(np.float16).tobytes())
+        for chunk in split_facts(facts)
+    ]
+
+
+class MemoryIndex:
+    """
+    Vector index over each user's memory facts.
+
+    Chunks and their float16 embeddings are persisted in SQLite through
+    Database; each user's matrix is loaded once and kept in a small LRU
+    so retrieval is one cheap version check plus a matrix-vector product.
+    """
+
+    def __init__(self, db, embedder=None, cache_size=256):
+        self.db = db
+        self.embedder = embedder or HashingEmbedder()
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def replace_facts(self, user_id, facts):
+        """Re-chunk and re-embed a user's memory facts"""
+        if not user_id:
+            return 0
+
+        rows = embed_facts(facts, self.embedder)
+        self.db.replace_memory_chunks(user_id, rows)
+        self.forget(user_id)
+        return len(rows)
+
+    def forget(self, user_id):
+        """Drop a user's cached matrix (call after their chunks change)"""
+        with self._lock:
+            self._cache.pop(user_id, None)
+
+    def _load(self, user_id):
+        # Chunks are replaced wholesale, so the newest chunk id identifies the
+        # current set even when another worker rewrote it
+        version = self.db.get_memory_chunks_version(user_id)
+        with self._lock:
+            cached = self._cache.get(user_id)
+            if cached and cached[0] == version:
+                self._cache.move_to_end(user_id)
+                return cached[1], cached[2]
+
+        rows = self.db.get_memory_chunks(user_id)
+        texts = [row['text'] for row in rows]
+        if rows:
+            matrix = np.frombuffer(
+                b''.join(row['embedding'] for row in rows), dtype=np.float16
+            ).reshape(len(rows), self.embedder.dim).astype(np.float32)
+        else:
+            matrix = np.zeros((0, self.embedder.dim), dtype=np.float32)
+
+        with self._lock:
+            self._cache[user_id] = (version, texts, matrix)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return texts, matrix
+
+    def search(self, user_id, query, k=5, min_score=0.1):
+        """Return up to k (text, score) pairs most similar to the query"""
+        if not user_id:
+            return []
+
+        texts, matrix = self._load(user_id)
+        if not texts:
+            return []
+
+        scores = matrix @ self.embedder.embed(query)
+        if len(texts) > k:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(texts))
+        top = top[np.argsort(-scores[top])]
+
+        return [(texts[i], float(scores[i])) for i in top if scores[i] >= min_score]
+
+    def relevant_facts(self, user_id, query, k=5):
+        """Top-k facts for the prompt, as newline-separated text"""
+        return '\n'.join(text for text, _ in self.search(user_id, query, k=k))
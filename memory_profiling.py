@@ -0,0 +1,165 @@
+"""
+NANBAN AI - Memory Profiling
+Process memory figures and, with MEMORY_PROFILING=on, tracemalloc
+allocation tracking per endpoint (served at /api/admin/memory)
+"""
+
+import os
+import resource
+import sys
+import threading
+import tracemalloc
+from dataclasses import dataclass, field
+
+from flask import g, request
+
+from observability import get_logger
+
+logger = get_logger('memory')
+
+# Allocations by tracemalloc itself and the import machinery are noise here
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def process_memory():
+    """
+    This process's memory in bytes. On Linux: rss, pss (shared pages split
+    between the processes using them), private (what this process alone
+    costs) and shared. Elsewhere only the peak RSS is available.
+    """
+    try:
+        fields = {}
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if value.strip().endswith('kB'):
+                    fields[key] = int(value.split()[0]) * 1024
+        return {
+            'rss': fields['Rss'],
+            'pss': fields['Pss'],
+            'private': fields['Private_Clean'] + fields['Private_Dirty'],
+            'shared': fields['Shared_Clean'] + fields['Shared_Dirty'],
+        }
+    except (OSError, KeyError):
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {'peak_rss': peak if sys.platform == 'darwin' else peak * 1024}
+
+
+@dataclass(slots=True)
+class EndpointMemory:
+    """Traced-memory growth seen across one endpoint's requests"""
+    requests: int = 0
+    growth: int = 0
+    max_growth: int = 0
+    # Top lines of this endpoint's last snapshot ({'file:line': bytes}) and
+    # how they changed since the one before
+    lines: dict = field(default_factory=dict)
+    top_growth: list = field(default_factory=list)
+
+
+class MemoryProfiler:
+    """
+    MEMORY_PROFILING=on starts tracemalloc (keeping MEMORY_PROFILING_FRAMES
+    frames per allocation, default 1) and records for each endpoint how
+    much traced memory grew across its requests. Every
+    MEMORY_SNAPSHOT_EVERY-th request of an endpoint (default 200) takes a
+    snapshot and keeps the lines that grew most since that endpoint's
+    previous one, i.e. where memory that outlives requests is allocated.
+
+    Growth is measured process-wide, so under threaded workers it includes
+    concurrent requests: read it as a trend, not an exact per-request cost.
+    tracemalloc makes every allocation slower; profile one instance or a
+    staging deploy, not the whole fleet. Figures are per worker.
+    """
+
+    TOP_LINES = 200
+
+    def __init__(self, enabled=None, frames=None, snapshot_every=None):
+        if enabled is None:
+            enabled = os.environ.get('MEMORY_PROFILING', 'off').lower() in ('1', 'on', 'true', 'yes')
+        self.enabled = enabled
+        self.frames = frames or int(os.environ.get('MEMORY_PROFILING_FRAMES', 1))
+        self.snapshot_every = snapshot_every or int(os.environ.get('MEMORY_SNAPSHOT_EVERY', 200))
+        self.endpoints = {}
+        self._lock = threading.Lock()
+        if self.enabled and not tracemalloc.is_tracing():
+            # Started while the app is being built in the gunicorn master, so
+            # what workers inherit is traced too (PYTHONTRACEMALLOC=1 also
+            # covers the module imports before this point)
+            tracemalloc.start(self.frames)
+            logger.warning('Memory profiling on: tracemalloc slows allocations', extra={'frames': self.frames})
+
+    def init_app(self, app):
+        """Track traced memory around every request"""
+        if not self.enabled:
+            return
+
+        @app.before_request
+        def _memory_before():
+            g.traced_memory_start = tracemalloc.get_traced_memory()[0]
+
+        @app.after_request
+        def _memory_after(response):
+            start = getattr(g, 'traced_memory_start', None)
+            if start is not None:
+                self._record(request.endpoint or 'unknown', tracemalloc.get_traced_memory()[0] - start)
+            return response
+
+    def _snapshot_lines(self):
+        snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        return {
+            str(stat.traceback[0]): stat.size
+            for stat in snapshot.statistics('lineno')[:self.TOP_LINES]
+        }
+
+    def _record(self, endpoint, growth):
+        with self._lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointMemory()
+            stats.requests += 1
+            stats.growth += growth
+            stats.max_growth = max(stats.max_growth, growth)
+            due = (stats.requests - 1) % self.snapshot_every == 0
+        if not due:
+            return
+
+        # Snapshots take tens of milliseconds; they are taken outside the lock
+        lines = self._snapshot_lines()
+        with self._lock:
+            if stats.lines:
+                diff = ((line, size - stats.lines.get(line, 0)) for line, size in lines.items())
+                stats.top_growth = sorted((d for d in diff if d[1] > 0), key=lambda d: d[1], reverse=True)[:50]
+            stats.lines = lines
+
+    def report(self, limit=20):
+        """Process memory plus, when profiling, traced totals, per-endpoint growth and the top allocating lines"""
+        report = {'enabled': self.enabled, 'pid': os.getpid(), 'process': process_memory()}
+        if not self.enabled:
+            return report
+
+        current, peak = tracemalloc.get_traced_memory()
+        with self._lock:
+            endpoints = {
+                name: {
+                    'requests': stats.requests,
+                    'avg_growth': round(stats.growth / stats.requests),
+                    'max_growth': stats.max_growth,
+                    'top_growth': [{'line': line, 'bytes': size} for line, size in stats.top_growth[:limit]],
+                }
+                for name, stats in sorted(self.endpoints.items(), key=lambda item: -item[1].growth)
+            }
+        report.update({
+            'traced': {'current': current, 'peak': peak},
+            'endpoints': endpoints,
+            'top_lines': [
+                {'line': line, 'bytes': size} for line, size in list(self._snapshot_lines().items())[:limit]
+            ],
+        })
+        return report
@@ -0,0 +1,113 @@
+"""
+NANBAN AI - Model Router
+Picks a model tier and max_tokens per message from cheap local signals
+"""
+
+import os
+import re
+from dataclasses import dataclass, replace
+
+from observability import MODEL_COST, MODEL_REQUEST_SECONDS, MODEL_TOKENS
+
+# USD per 1M (prompt, completion) tokens, for the cost estimate metric
+MODEL_PRICES = {
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4.1-nano': (0.10, 0.40),
+    'gpt-4.1-mini': (0.40, 1.60),
+    'gpt-4.1': (2.00, 8.00),
+}
+
+# Words that signal the user wants an explanation rather than banter
+DETAIL_RE = re.compile(
+    r'\b(explain|why|how|steps?|detail|difference|compare|meaning)\b'
+    r'|விளக்க|விளக்கு|ஏன்|எப்படி|எதனால|வித்தியாசம்|அர்த்தம்|detail-?ஆ',
+    re.IGNORECASE
+)
+QUESTION_RE = re.compile(r'[?？]|\b(what|who|when|where|which|enna|epdi|yen)\b|என்ன|யார்|எப்போ|எங்க|எது', re.IGNORECASE)
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """Estimated USD cost of one call (0 for models without a known price)"""
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+@dataclass(frozen=True)
+class RouteDecision:
+    tier: str
+    model: str
+    max_tokens: int
+    length_hint: str
+    reason: str
+
+
+class ModelRouter:
+    """
+    Local, rule-based request classifier.
+
+    Tiers:
+        fast     short banter with no question
+        standard ordinary questions and chat
+        strong   detailed explanations (reply_mode 'detailed', VILAKKAMAANA, long asks)
+        vision   image messages
+
+    MODEL_ROUTE_OVERRIDE forces one tier for every text message ('off' uses standard).
+    Users over their soft token budget are pinned to the fast tier (images get
+    half the usual max_tokens).
+    """
+
+    def __init__(self, default_model='gpt-4o-mini'):
+        self.tiers = {
+            'fast': (os.environ.get('OPENAI_MODEL_FAST', default_model), 80,
+                     'Reply in 1-2 short sentences.'),
+            'standard': (default_model, 150,
+                         'Keep replies to 2-3 short sentences. Be brief unless the user asks for detail.'),
+            'strong': (os.environ.get('OPENAI_MODEL_STRONG', default_model), 400,
+                       'The user wants detail: explain step by step with local examples, in short paragraphs.'),
+            'vision': (os.environ.get('OPENAI_MODEL_VISION', 'gpt-4o-mini'), 300,
+                       'Keep responses short unless the user asks for detail.'),
+        }
+        self.override = os.environ.get('MODEL_ROUTE_OVERRIDE', '').strip().lower()
+
+    def _decide(self, tier, reason):
+        model, max_tokens, hint = self.tiers[tier]
+        return RouteDecision(tier, model, max_tokens, hint, reason)
+
+    def route(self, user_message, reply_mode='quick', persona='JALIANA', has_image=False, budget=None):
+        """Classify a request and return the tier to use"""
+        if has_image:
+            decision = self._decide('vision', 'image')
+            if budget:
+                decision = replace(decision, max_tokens=decision.max_tokens // 2, reason='budget')
+            return decision
+        if budget:
+            return self._decide('fast', 'budget')
+
+        if self.override == 'off':
+            return self._decide('standard', 'override')
+        if self.override in self.tiers:
+            return self._decide(self.override, 'override')
+
+        text = (user_message or '').strip()
+        wants_detail = reply_mode == 'detailed' or persona == 'VILAKKAMAANA'
+        if wants_detail and (len(text) > 25 or DETAIL_RE.search(text)):
+            return self._decide('strong', 'detailed')
+        if DETAIL_RE.search(text) and len(text) > 80:
+            return self._decide('strong', 'long_explanation')
+        if len(text) <= 40 and not QUESTION_RE.search(text):
+            return self._decide('fast', 'short_banter')
+        return self._decide('standard', 'default')
+
+    def record(self, decision, elapsed, usage=None):
+        """Record latency, token and estimated cost metrics for one upstream call"""
+        MODEL_REQUEST_SECONDS.labels(tier=decision.tier, model=decision.model).observe(elapsed)
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+        MODEL_TOKENS.labels(tier=decision.tier, kind='prompt').inc(prompt_tokens)
+        MODEL_TOKENS.labels(tier=decision.tier, kind='completion').inc(completion_tokens)
+        MODEL_COST.labels(tier=decision.tier, model=decision.model).inc(
+            estimate_cost(decision.model, prompt_tokens, completion_tokens)
+        )
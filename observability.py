@@ -0,0 +1,175 @@
+"""
+NANBAN AI - Observability
+Structured JSON logging with request ids and Prometheus metrics
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+)
+
+# Latency buckets (seconds) sized for chat turns: sub-ms DB work up to slow LLM calls
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+REQUEST_SECONDS = Histogram(
+    'nanban_request_seconds', 'HTTP request latency',
+    ['endpoint', 'method', 'status'], buckets=LATENCY_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    'nanban_stage_seconds', 'Time spent in each stage of a chat turn',
+    ['stage'], buckets=LATENCY_BUCKETS
+)
+UPSTREAM_RETRIES = Counter(
+    'nanban_upstream_retries_total', 'Retried upstream calls', ['service']
+)
+UPSTREAM_ERRORS = Counter(
+    'nanban_upstream_errors_total', 'Failed upstream call attempts', ['service']
+)
+FALLBACK_REPLIES = Counter(
+    'nanban_fallback_replies_total', 'Replies served from a fallback path', ['reason']
+)
+MODEL_REQUEST_SECONDS = Histogram(
+    'nanban_model_request_seconds', 'Upstream LLM latency per routing tier',
+    ['tier', 'model'], buckets=LATENCY_BUCKETS
+)
+MODEL_TOKENS = Counter(
+    'nanban_model_tokens_total', 'LLM tokens used per routing tier', ['tier', 'kind']
+)
+MODEL_COST = Counter(
+    'nanban_model_cost_usd_total', 'Estimated LLM spend per routing tier', ['tier', 'model']
+)
+INSTANT_REPLIES = Counter(
+    'nanban_instant_replies_total', 'Instant-reply lookups by matched intent (miss = sent to the model)',
+    ['result']
+)
+IDEMPOTENT_REQUESTS = Counter(
+    'nanban_idempotent_requests_total', 'Requests carrying an Idempotency-Key, by outcome', ['outcome']
+)
+COALESCED_CALLS = Counter(
+    'nanban_coalesced_calls_total', 'Upstream calls served by joining an identical in-flight call', ['service']
+)
+BUDGET_DEGRADED = Counter(
+    'nanban_budget_degraded_total', 'Chat turns degraded because the user is over budget', ['level']
+)
+SCHEDULER_RUNS = Counter(
+    'nanban_scheduler_runs_total', 'Scheduled maintenance job runs by outcome', ['job', 'status']
+)
+SCHEDULER_JOB_SECONDS = Histogram(
+    'nanban_scheduler_job_seconds', 'Scheduled maintenance job duration',
+    ['job'], buckets=LATENCY_BUCKETS + (60.0, 300.0, 900.0)
+)
+CIRCUIT_TRANSITIONS = Counter(
+    'nanban_circuit_transitions_total', 'Circuit breaker state changes per upstream', ['service', 'state']
+)
+COMPLETION_FAILOVERS = Counter(
+    'nanban_completion_failovers_total', 'Turns answered by the failover backend while the primary circuit was open',
+    ['backend']
+)
+TTS_CACHE = Counter(
+    'nanban_tts_cache_total', 'Shared TTS phrase cache lookups', ['result']
+)
+
+# Attributes every LogRecord has; anything else was passed via `extra=`
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Render log records as one JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if has_request_context():
+            entry['request_id'] = getattr(g, 'request_id', None)
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(level=None):
+    """Send all 'nanban' logs to stderr as JSON lines"""
+    logger = logging.getLogger('nanban')
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(JsonFormatter())
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel(level or os.environ.get('LOG_LEVEL', 'INFO'))
+    return logger
+
+
+def get_logger(name):
+    """Get a child of the 'nanban' logger"""
+    return logging.getLogger(f'nanban.{name}')
+
+
+@contextmanager
+def timed(stage):
+    """Record the duration of a block in the per-stage histogram"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage=stage).observe(time.perf_counter() - start)
+
+
+def metrics_payload():
+    """
+    Render metrics in Prometheus text format.
+
+    With PROMETHEUS_MULTIPROC_DIR set (as under gunicorn), values are read
+    from every worker's files so a scrape sees the whole server rather than
+    whichever worker answered it.
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def init_app(app):
+    """Attach request ids, access logs and request metrics to a Flask app"""
+    access_log = get_logger('access')
+
+    @app.before_request
+    def _start_request():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def _finish_request(response):
+        start = getattr(g, 'request_start', None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        endpoint = request.endpoint or 'unknown'
+        REQUEST_SECONDS.labels(
+            endpoint=endpoint, method=request.method, status=response.status_code
+        ).observe(elapsed)
+        response.headers['X-Request-ID'] = g.request_id
+        if endpoint != 'metrics':
+            access_log.info('request', extra={
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round(elapsed * 1000, 2),
+            })
+        return response
@@ -5,178 +5,71 @@ Handles all AI interactions with personality system
 
 import os
 import time
-from openai import OpenAI
 import json
+from dataclasses import replace
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from completion_backends import OpenAIBackend, create_backend
+from instant_replies import InstantReplies
+from model_router import ModelRouter
+from personality import BASE_SYSTEM_PROMPT, DEFAULT_OPENING, HUMAN_PATTERNS, OPENINGS, PERSONA_RULES, SLANG_RULES
+from response_pipeline import SuggestionEngine, mood_rule, postprocess
+from singleflight import SingleFlight, request_key
+from observability import COMPLETION_FAILOVERS, FALLBACK_REPLIES, UPSTREAM_ERRORS, UPSTREAM_RETRIES, get_logger, timed
+
+logger = get_logger('brain')
+
+# Image types the vision models accept; anything else is sent as JPEG
+IMAGE_MIMES = frozenset({'image/jpeg', 'image/png', 'image/webp', 'image/gif'})
 
 class NanbanBrain:
     def __init__(self):
-        # Initialize OpenAI client
-        api_key = os.environ.get('OPENAI_API_KEY')
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY not found in environment variables!")
+        # The OpenAI client (and SDK import) is created on first use to keep cold start fast
+        self.api_key = os.environ.get('OPENAI_API_KEY')
         
-        self.client = OpenAI(api_key=api_key)
         self.model = os.environ.get('OPENAI_MODEL', 'gpt-4o-mini')
+        # Picks model and max_tokens per message (see model_router.py)
+        self.router = ModelRouter(default_model=self.model)
+        # Coalesces concurrent identical chat completions
+        self.chat_flights = SingleFlight('openai_chat')
         
-        # System prompt with Tamil personality
-        self.base_system_prompt = """You are "Nanban AI" (நண்பன் AI) — a hyper-realistic Tamil conversational companion.
-You NEVER sound like a robot, assistant, or system.
-You ALWAYS sound like a real Tamil friend from a real town, with emotion, rhythm, and cultural awareness.
-
-Your goal:
-"இது AI இல்ல… நம்ம ஊரு நண்பன்."
-
-ABSOLUTE IDENTITY RULES (NON-NEGOTIABLE):
-- NEVER say you are an AI, bot, model, assistant, or software.
-- NEVER mention OpenAI, ChatGPT, training data, database, API, system, or sources.
-- NEVER include links, citations, or "according to reports".
-- You exist only as a friendly Tamil nanban.
-
-CORE LANGUAGE RULES:
-- NEVER use formal Tamil (Senthamizh) unless CHARACTER = VILAKKAMAANA.
-- Use spoken Tamil with natural Tanglish (bus, office, scene-u, tension).
-- Keep speech human, casual, and local.
-- Emojis are optional and minimal.
-
-RESPONSE STYLE RULES:
-- Crispy First Line: Start every reply with a 2–4 word local opener.
-- No Long Walls: Avoid big paragraphs. Break ideas naturally. Mobile-friendly replies.
-- Emotion First: Match the user's emotional state.
-
-CONTENT SAFETY (FRIENDLY):
-Adult / unsafe requests: Politely refuse and redirect with humour.
-Example: "மச்சி, இது நமக்கு செட் ஆகாது 😄 ஒரு மொக்க ஜோக் வேணுமா?"
-
-FINAL PRINCIPLE:
-You are not here to sound smart by guessing.
-You are here to be trusted by being honest.
-
-If someone listens with eyes closed, they must feel:
-"இவன் bot இல்ல… நம்ம ஊரு நண்பன்."
-"""
-
-        # Enhanced slang definitions
-        self.slang_rules = {
-            'CHENNAI': {
-                'style': 'Fast-paced, casual, friendly. Use English words naturally mixed in.',
-                'common_words': [
-                    'மச்சி (machi)', 'நைனா (naina)', 'கெத்து (gethu)', 'பீஜார் (bejaaru)',
-                    'சீன் (scene)', 'டென்ஷன் (tension)', 'சூப்பர் (super)', 'செம்ம (semma)',
-                    'கலக்கு (kalakku)', 'மாஸ் (mass)', 'லெவல் (level)'
-                ],
-                'sentence_patterns': [
-                    'என்ன {name} மச்சி?',
-                    'சூப்பரா இருக்கு!',
-                    'நைனா, கொஞ்சம் டென்ஷன் ஆகுது',
-                    'அடச்சீ! செம்ம சீன்டா இருக்கே!',
-                    'லெவல்லா இருக்கு மச்சி!'
-                ],
-                'avoid': ['formal Tamil', 'literary words', 'respectful suffixes like ங்கள்']
-            },
-            'KOVAI': {
-                'style': 'Polite, calm, respectful. Slower pace, musical.',
-                'common_words': [
-                    'சாமி (sami)', 'நங்க (nange)', 'வாங்க (vange)', 'போங்க (ponge)',
-                    'இங்க (inga)', 'அங்க (anga)', 'பாருங்க (paarunga)'
-                ],
-                'sentence_patterns': [
-                    'என்ன சாமி?',
-                    'நல்லா இருக்கு சாமி',
-                    'வாங்க, பேசலாம்',
-                    'பாருங்க சாமி, இப்படி இருக்கு'
-                ],
-                'avoid': ['harsh words', 'fast slang', 'Chennai-style English mixing']
-            },
-            'MADURAI': {
-                'style': 'Bold, confident, authoritative. Strong delivery.',
-                'common_words': [
-                    'அண்ணே (anne)', 'அண்ணாச்சி (annachi)', 'இங்குட்டு (inguttu)',
-                    'அங்குட்டு (anguttu)', 'எங்குட்டு (enguttu)', 'பாரு (paaru)',
-                    'சொல்லு (sollu)', 'கேளு (kelu)'
-                ],
-                'sentence_patterns': [
-                    'என்ன அண்ணே?',
-                    'இங்குட்டு வா',
-                    'சொல்லு அண்ணாச்சி',
-                    'பாரு, இப்படிதான் இருக்கும்'
-                ],
-                'avoid': ['polite forms', 'soft words', 'hesitant language']
-            },
-            'NELLAI': {
-                'style': 'Earthy, rhythmic, fast. Raw and energetic.',
-                'common_words': [
-                    'ஏலே (ele)', 'லே (le)', 'அண்ணனாச்சி (annanachi)',
-                    'கேளுடா (keluda)', 'சொல்லுடா (solluda)', 'பாருடா (paaruda)'
-                ],
-                'sentence_patterns': [
-                    'ஏலே! என்ன விஷயம்?',
-                    'கேளுடா மச்சி',
-                    'செம்மயா இருக்கு லே!',
-                    'அண்ணனாச்சி, இப்படி இருக்கு'
-                ],
-                'avoid': ['formal speech', 'slow pacing', 'polite forms']
-            },
-            'EELAM': {
-                'style': 'Pure Jaffna Tamil. Melodic, gentle, distinct.',
-                'common_words': [
-                    'என்னப்பா (ennappa)', 'ஓமோம் (omom)', 'சுகமா (sughama)',
-                    'பகிடி (paghidi)', 'கொஞ்சம் (konjam)', 'சரியோ (sariyo)'
-                ],
-                'sentence_patterns': [
-                    'என்னப்பா? சுகமா?',
-                    'ஓமோம், நல்லாத்தான் இருக்கு',
-                    'கொஞ்சம் சொல்லுங்கோ',
-                    'சரியோ அப்பா?'
-                ],
-                'avoid': ['Tamil Nadu slang', 'Chennai/Madurai words', 'aggressive tone']
-            },
-            'COMMON': {
-                'style': 'Neutral, friendly, clear. Universally understood.',
-                'common_words': [
-                    'நண்பா (nanba)', 'எப்படி (eppadi)', 'சரி (sari)',
-                    'நல்லா (nalla)', 'நன்றி (nandri)'
-                ],
-                'sentence_patterns': [
-                    'எப்படி இருக்கீங்க?',
-                    'நல்லா இருக்கு',
-                    'சரி நண்பா',
-                    'புரிஞ்சுது'
-                ],
-                'avoid': ['region-specific slang', 'extreme informality']
-            }
-        }
-
-        self.human_patterns = {
-            'fillers': ['ம்ம்ம்', 'அட', 'ஓ', 'அப்படியா', 'சரி சரி'],
-            'reactions': ['அடடா!', 'வாவ்!', 'சூப்பர்!', 'அய்யோ!', 'ஓஹோ!'],
-            'transitions': ['அதான்', 'அதுக்கு', 'அதுனால', 'அப்புறம்', 'முதல்ல'],
-            'confirmations': ['தெரிஞ்சுது', 'புரிஞ்சுது', 'ம்ம் சரி', 'ஓகே'],
-            'thinking': ['இப்ப பாக்கலாம்', 'ஒரு நிமிஷம்', 'யோசிக்கலாம்']
-        }
+        # Personality tables (see personality.py) are module-level and immutable,
+        # shared by every worker forked from a preloaded master
+        self.base_system_prompt = BASE_SYSTEM_PROMPT
+        self.slang_rules = SLANG_RULES
+        self.persona_rules = PERSONA_RULES
+        self.human_patterns = HUMAN_PATTERNS
         
-        # Persona definitions
-        self.persona_rules = {
-            'JALIANA': {
-                'description': 'Fun, energetic, casual',
-                'behavior': 'Light jokes allowed. Uses emojis 😄🔥',
-                'address': 'Calls user: Machi / Thala'
-            },
-            'AMAITHIYANA': {
-                'description': 'Calm, soft, respectful',
-                'behavior': 'Short replies. Minimal or no emojis.',
-                'address': 'Gentle and soothing'
-            },
-            'THELIVANA': {
-                'description': 'Direct, logical, no-nonsense',
-                'behavior': 'NO emojis. Clear pauses between points.',
-                'address': 'Straightforward and professional'
-            },
-            'VILAKKAMAANA': {
-                'description': 'Teacher / elder brother style',
-                'behavior': 'Deep explanation with LOCAL examples (Idli, Biryani, Halwa, Bus stand).',
-                'address': 'Formal Tamil allowed ONLY here'
-            }
-        }
+        # Local replies for common intents and upstream failures (see instant_replies.py)
+        self.instant = InstantReplies(self)
+        # Quick-reply chips under each reply (see response_pipeline.py)
+        self.suggestions = SuggestionEngine(self)
+        
+        # Completion backends (see completion_backends.py). Without an API key the
+        # offline template backend answers; the failover takes over while the
+        # primary's circuit is open.
+        primary = os.environ.get('COMPLETION_BACKEND') or ('openai' if self.api_key else 'template')
+        failover = os.environ.get('COMPLETION_FAILOVER', 'template')
+        if primary == 'openai' and not self.api_key:
+            logger.warning('OPENAI_API_KEY not found in environment variables! Chat will use fallback replies.')
+        elif primary == 'template':
+            logger.warning('Running offline: replies come from the local template backend')
+        self.backend = create_backend(primary, self)
+        self.failover = None if failover in ('off', primary) else create_backend(failover, self)
+        self.breaker = CircuitBreaker(self.backend.name)
+        self._openai = self.backend if primary == 'openai' else None
+    
+    @property
+    def client(self):
+        """OpenAI client (used directly by batch_jobs.py), created on first use"""
+        if self._openai is None:
+            self._openai = OpenAIBackend(api_key=self.api_key)
+        return self._openai.client
+    
+    def reset_client(self):
+        """Drop any client inherited across fork (its HTTP pool must not be shared)"""
+        for backend in (self.backend, self.failover, self._openai):
+            if backend is not None:
+                backend.reset()
     
     def build_system_prompt(self, slang, persona, user_name):
         """Build complete system prompt with slang and persona"""
@@ -190,15 +83,15 @@ CURRENT CONFIGURATION:
 ======================
 
 SLANG: {slang}
-- Style: {slang_info['style']}
-- Key words to use: {', '.join(slang_info['common_words'][:5])}
-- Example sentences: {', '.join(slang_info['sentence_patterns'][:3])}
-- Avoid: {', '.join(slang_info['avoid'])}
+- Style: {slang_info.style}
+- Key words to use: {', '.join(slang_info.common_words[:5])}
+- Example sentences: {', '.join(slang_info.sentence_patterns[:3])}
+- Avoid: {', '.join(slang_info.avoid)}
 
 CHARACTER: {persona}
-- Description: {persona_info['description']}
-- Behavior: {persona_info['behavior']}
-- How to address user: {persona_info['address']}
+- Description: {persona_info.description}
+- Behavior: {persona_info.behavior}
+- How to address user: {persona_info.address}
 
 USER'S NAME: {user_name if user_name else 'Not provided yet'}
 {f"- Remember and use '{user_name}' naturally in conversation" if user_name else "- Ask for their name naturally in conversation"}
@@ -206,12 +99,12 @@ USER'S NAME: {user_name if user_name else 'Not provided yet'}
 CRITICAL RULES FOR THIS CONVERSATION:
 - Speak ONLY in {slang} slang style
 - Be EXACTLY {persona} in personality
-- Use {', '.join(slang_info['common_words'][:5])} naturally
+- Use {', '.join(slang_info.common_words[:5])} naturally
 - NEVER mix other slang words
 - Stay in character 100% of the time
-- Use fillers: {', '.join(self.human_patterns['fillers'][:3])}
-- React naturally: {', '.join(self.human_patterns['reactions'][:3])}
-- Think out loud sometimes: {', '.join(self.human_patterns['thinking'][:2])}
+- Use fillers: {', '.join(self.human_patterns.fillers[:3])}
+- React naturally: {', '.join(self.human_patterns.reactions[:3])}
+- Think out loud sometimes: {', '.join(self.human_patterns.thinking[:2])}
 
 Example opening based on current config:
 {self._get_example_opening(slang, persona, user_name)}
@@ -220,104 +113,188 @@ Example opening based on current config:
         return system_prompt
     
     def _get_example_opening(self, slang, persona, user_name):
-        """Generate example opening based on slang and persona"""
+        """Example opening for a slang and persona (precomputed in personality.OPENINGS)"""
+        return OPENINGS.get((slang, persona), DEFAULT_OPENING).render(user_name)
+    
+    def _report_usage(self, on_usage, route, usage, latency, retries):
+        """Hand one call's token usage to the caller's on_usage callback"""
+        if on_usage is None:
+            return
+        try:
+            on_usage({
+                'model': route.model,
+                'tier': route.tier,
+                'prompt_tokens': getattr(usage, 'prompt_tokens', 0) or 0,
+                'completion_tokens': getattr(usage, 'completion_tokens', 0) or 0,
+                'latency_ms': int(latency * 1000),
+                'retries': retries,
+            })
+        except Exception:
+            logger.exception('Usage recording failed')
+    
+    def _complete(self, service, route, messages, context, on_usage=None, **options):
+        """
+        Run one completion (a Completion) on the primary backend with light
+        retry on transient errors. While the primary's circuit is open (or
+        opens during the retries) the failover backend answers instead; with
+        no failover the error propagates to the caller's fallback, as do
+        configuration errors (ValueError, e.g. a missing API key) at once.
+        """
+        backend = self.backend
+        if not backend.remote:
+            return backend.complete(messages, route.model, route.max_tokens, context, **options)
         
-        openers = {
-            ('CHENNAI', 'JALIANA'): f"வா {'மச்சி' if not user_name else user_name}! என்ன சீன் இன்னைக்கு? 😄",
-            ('CHENNAI', 'AMAITHIYANA'): f"வாங்க {user_name if user_name else 'நண்பரே'}...",
-            ('CHENNAI', 'THELIVANA'): f"சொல்லுங்க {user_name if user_name else 'மச்சி'}, என்ன வேணும்?",
-            ('CHENNAI', 'VILAKKAMAANA'): f"வாருங்கள் {user_name if user_name else 'நண்பரே'}. எப்படி உதவலாம்?",
+        if backend.model:
+            # A local server runs its own model; account for that instead of the routed one
+            route = replace(route, model=backend.model)
+        last_error = None
+        circuit_open = False
+        started = time.perf_counter()
+        for attempt in range(3):
+            if not self.breaker.allow():
+                circuit_open = True
+                break
+            if attempt:
+                UPSTREAM_RETRIES.labels(service=service).inc()
+            try:
+                start = time.perf_counter()
+                with timed('openai_call'):
+                    completion = backend.complete(messages, route.model, route.max_tokens, context, **options)
+                self.breaker.record_success()
+                self.router.record(route, time.perf_counter() - start, completion.usage)
+                self._report_usage(on_usage, route, completion.usage, time.perf_counter() - started, attempt)
+                return completion
+            except ValueError:
+                # Misconfiguration (e.g. no API key): retrying can't help, and it
+                # says nothing about the upstream, so free a half-open trial slot
+                self.breaker.cancel_trial()
+                raise
+            except Exception as e:
+                last_error = e
+                self.breaker.record_failure()
+                UPSTREAM_ERRORS.labels(service=service).inc()
+                logger.warning('Completion error', extra={
+                    'service': service, 'backend': backend.name, 'attempt': attempt + 1, 'error': str(e)
+                })
+                if self.breaker.is_open:
+                    circuit_open = True
+                    break
+                if attempt == 2:
+                    break
+                with timed('retry_backoff'):
+                    time.sleep(1.5 * (attempt + 1))
+        
+        if not circuit_open or self.failover is None:
+            raise last_error or CircuitOpenError(backend.name)
+        COMPLETION_FAILOVERS.labels(backend=self.failover.name).inc()
+        with timed('failover_call'):
+            return self.failover.complete(messages, route.model, route.max_tokens, context, **options)._replace(
+                fallback=True
+            )
+    
+    def _mood_and_memory(self, route, mood, memory_facts):
+        """Scale the route's max_tokens for the user's mood; return (route, prompt lines for mood and memory)"""
+        rule = mood_rule(mood)
+        if rule.token_scale != 1:
+            route = replace(route, max_tokens=round(route.max_tokens * rule.token_scale))
+        lines = "\n\nUSER'S MOOD RIGHT NOW: " + rule.prompt
+        if memory_facts:
+            lines += "\n\nWHAT YOU REMEMBER ABOUT THE USER (use naturally, never list it back):\n" + memory_facts
+        return route, lines
+    
+    def respond(self, text, slang='COMMON', persona='JALIANA', user_name='', mood=None, fallback=False,
+                truncated=False, kind='chat'):
+        """
+        The reply dict app.py returns: {'text', 'fallback', 'suggestions'}.
+        Model text is cleaned up (see response_pipeline.postprocess); an
+        empty reply becomes a local fallback.
+        """
+        with timed('postprocess'):
+            text = postprocess(text, persona, truncated)
+            if not text:
+                FALLBACK_REPLIES.labels(reason='empty_reply').inc()
+                text, fallback = self.instant.fallback(slang, persona, user_name, kind=kind), True
+            return {
+                'text': text,
+                'fallback': fallback,
+                'suggestions': self.suggestions.suggest(text, slang, persona, mood),
+            }
+    
+    def chat(self, user_message, slang='COMMON', persona='JALIANA', user_name='', conversation_history=None,
+             related_messages=None, mood=None, reply_mode='quick', memory_facts='', budget=None, on_usage=None):
+        """Generate AI response based on user message and context (token-optimized)"""
+        
+        with timed('prompt_build'):
+            route = self.router.route(user_message, reply_mode=reply_mode, persona=persona, budget=budget)
+            route, personal = self._mood_and_memory(route, mood, memory_facts)
             
-            ('KOVAI', 'JALIANA'): f"வாங்க சாமி {user_name if user_name else ''}! எப்படி இருக்கீங்க? 😊",
-            ('KOVAI', 'AMAITHIYANA'): f"வாங்க {user_name if user_name else 'சாமி'}...",
-            ('KOVAI', 'THELIVANA'): f"சொல்லுங்க {user_name if user_name else 'சாமி'}.",
-            ('KOVAI', 'VILAKKAMAANA'): f"வாருங்கள் {user_name if user_name else 'நண்பரே'}. எப்படி உதவலாம்?",
+            # Build system prompt with current configuration
+            system_prompt = self.build_system_prompt(slang, persona, user_name)
+            system_prompt += "\n\nHARD LIMIT: " + route.length_hint + personal
             
-            ('MADURAI', 'JALIANA'): f"வா {'அண்ணே' if not user_name else user_name}! என்ன விஷயம்? 🔥",
-            ('MADURAI', 'AMAITHIYANA'): f"சொல்லு {user_name if user_name else 'அண்ணே'}...",
-            ('MADURAI', 'THELIVANA'): f"என்ன {user_name if user_name else 'அண்ணே'}?",
-            ('MADURAI', 'VILAKKAMAANA'): f"வாருங்கள் {user_name if user_name else 'நண்பரே'}.",
+            # Older turns recalled by full-text search, trimmed to keep the prompt small
+            if related_messages:
+                recalled = '\n'.join(
+                    f"- {msg['role']}: {msg['content'][:200]}" for msg in related_messages
+                )
+                system_prompt += (
+                    "\n\nEARLIER IN YOUR CHATS (use only if relevant, never quote it back):\n" + recalled
+                )
             
-            ('NELLAI', 'JALIANA'): f"ஏலே {user_name if user_name else 'மச்சி'}! என்ன விஷயம்டா? 😄",
-            ('NELLAI', 'AMAITHIYANA'): f"சொல்லு {user_name if user_name else 'லே'}...",
-            ('NELLAI', 'THELIVANA'): f"என்னடா {user_name if user_name else 'லே'}?",
-            ('NELLAI', 'VILAKKAMAANA'): f"வாருங்கள் {user_name if user_name else 'நண்பரே'}.",
+            # Prepare messages for OpenAI
+            messages = [
+                {"role": "system", "content": system_prompt}
+            ]
             
-            ('EELAM', 'JALIANA'): f"என்னப்பா {user_name if user_name else ''}! சுகமா? 😊",
-            ('EELAM', 'AMAITHIYANA'): f"சொல்லுங்கோ {user_name if user_name else 'அப்பா'}...",
-            ('EELAM', 'THELIVANA'): f"சொல்லுங்கோ {user_name if user_name else 'அப்பா'}.",
-            ('EELAM', 'VILAKKAMAANA'): f"வாருங்கோ {user_name if user_name else 'நண்பரே'}.",
+            # Add conversation history if available (last 3 messages to save tokens)
+            if conversation_history:
+                for msg in conversation_history[-3:]:
+                    messages.append({
+                        "role": msg['role'],
+                        "content": msg['content']
+                    })
             
-            ('COMMON', 'JALIANA'): f"ஹாய் {user_name if user_name else 'நண்பா'}! எப்படி இருக்கீங்க? 😊",
-            ('COMMON', 'AMAITHIYANA'): f"வாங்க {user_name if user_name else 'நண்பரே'}...",
-            ('COMMON', 'THELIVANA'): f"சொல்லுங்க {user_name if user_name else 'நண்பா'}.",
-            ('COMMON', 'VILAKKAMAANA'): f"வாருங்கள் {user_name if user_name else 'நண்பரே'}.",
-        }
-        
-        key = (slang, persona)
-        return openers.get(key, f"வணக்கம் {user_name if user_name else 'நண்பரே'}!")
-    
-    def chat(self, user_message, slang='COMMON', persona='JALIANA', user_name='', conversation_history=None):
-        """Generate AI response based on user message and context (token-optimized)"""
-        
-        # Build system prompt with current configuration
-        system_prompt = self.build_system_prompt(slang, persona, user_name)
-        system_prompt += "\n\nHARD LIMIT: Keep replies to 2-3 short sentences. Be brief unless the user asks for detail."
-        
-        # Prepare messages for OpenAI
-        messages = [
-            {"role": "system", "content": system_prompt}
-        ]
-        
-        # Add conversation history if available (last 3 messages to save tokens)
-        if conversation_history:
-            for msg in conversation_history[-3:]:
-                messages.append({
-                    "role": msg['role'],
-                    "content": msg['content']
-                })
-        
-        # Add current user message
-        messages.append({
-            "role": "user",
-            "content": user_message
-        })
+            # Add current user message
+            messages.append({
+                "role": "user",
+                "content": user_message
+            })
+            context = {'slang': slang, 'persona': persona, 'user_name': user_name,
+                       'user_message': user_message, 'kind': 'chat'}
         
         try:
-            # Call OpenAI API with light retry on transient errors
-            last_error = None
-            for attempt in range(3):
-                try:
-                    response = self.client.chat.completions.create(
-                        model=self.model,
-                        messages=messages,
-                        temperature=0.8,  # Higher for more creative/natural responses
-                        max_tokens=150,   # Limit response length for token savings
-                        presence_penalty=0.6,  # Encourage variety
-                        frequency_penalty=0.3  # Reduce repetition
-                    )
-                    ai_response = response.choices[0].message.content
-                    return ai_response
-                except Exception as e:
-                    last_error = e
-                    print(f"OpenAI API Error: {e}")
-                    time.sleep(1.5 * (attempt + 1))
-            raise last_error
+            # Identical concurrent requests (e.g. the same festival greeting for the
+            # same slang/persona) share one upstream call
+            key = request_key(route.model, route.max_tokens, messages)
+            completion = self.chat_flights.do(key, lambda: self._complete(
+                'openai_chat', route, messages, context,
+                on_usage=on_usage,
+                temperature=0.8,  # Higher for more creative/natural responses
+                presence_penalty=0.6,  # Encourage variety
+                frequency_penalty=0.3  # Reduce repetition
+            ))
         except Exception:
+            FALLBACK_REPLIES.labels(reason='openai_chat').inc()
             # Fallback response
-            if 'JALIANA' in persona:
-                return f"மச்சி, சாரி டா... கொஞ்சம் technical issue. மறுபடியும் try பண்ணு! 😅"
-            else:
-                return "மன்னிக்கவும், technical issue உள்ளது. மீண்டும் முயற்சிக்கவும்."
+            return self.respond(self.instant.fallback(slang, persona, user_name, kind='chat'),
+                                slang, persona, user_name, mood, fallback=True)
+        return self.respond(completion.text, slang, persona, user_name, mood, fallback=completion.fallback,
+                            truncated=completion.finish_reason == 'length')
 
-    def chat_with_image(self, user_message, image_data, slang='COMMON', persona='JALIANA', user_name=''):
+    def chat_with_image(self, user_message, image_data, slang='COMMON', persona='JALIANA', user_name='',
+                        image_mime=None, mood=None, reply_mode='quick', memory_facts='', budget=None,
+                        on_usage=None):
         """Generate AI response using image + text"""
+        route = self.router.route(user_message, reply_mode=reply_mode, persona=persona, has_image=True,
+                                  budget=budget)
+        route, personal = self._mood_and_memory(route, mood, memory_facts)
         system_prompt = self.build_system_prompt(slang, persona, user_name)
         system_prompt += (
             "\n\nUser uploaded an image. Analyze it carefully and respond in Tamil slang."
             " If it's homework or a question, explain simply and helpfully."
-            " Keep responses short unless the user asks for detail."
+            " " + route.length_hint + personal
         )
+        mime = image_mime if image_mime in IMAGE_MIMES else 'image/jpeg'
 
         messages = [
             {"role": "system", "content": system_prompt},
@@ -328,28 +305,22 @@ Example opening based on current config:
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/jpeg;base64,{image_data}"
+                            "url": f"data:{mime};base64,{image_data}"
                         }
                     }
                 ]
             }
         ]
 
+        context = {'slang': slang, 'persona': persona, 'user_name': user_name,
+                   'user_message': user_message, 'kind': 'vision'}
+
         try:
-            last_error = None
-            for attempt in range(3):
-                try:
-                    response = self.client.chat.completions.create(
-                        model="gpt-4o-mini",
-                        messages=messages,
-                        max_tokens=300,
-                        temperature=0.7
-                    )
-                    return response.choices[0].message.content
-                except Exception as e:
-                    last_error = e
-                    print(f"OpenAI Image Error: {e}")
-                    time.sleep(1.5 * (attempt + 1))
-            raise last_error
+            completion = self._complete('openai_vision', route, messages, context, on_usage=on_usage,
+                                        temperature=0.7)
         except Exception:
-            return "மச்சி, படம் படிக்க முடியல. இன்னொரு தடவை try பண்ணு 😅"
+            FALLBACK_REPLIES.labels(reason='openai_vision').inc()
+            return self.respond(self.instant.fallback(slang, persona, user_name, kind='vision'),
+                                slang, persona, user_name, mood, fallback=True, kind='vision')
+        return self.respond(completion.text, slang, persona, user_name, mood, fallback=completion.fallback,
+                            truncated=completion.finish_reason == 'length', kind='vision')
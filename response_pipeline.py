@@ -0,0 +1,214 @@
+"""
+NANBAN AI - Response Pipeline
+Mood rules for the prompt, clean-up of model replies and quick-reply
+suggestions, all local (no extra model call per turn)
+"""
+
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import namedtuple
+
+# How a mood changes the turn: a line for the system prompt and a factor on
+# the routed max_tokens (low moods get room for a gentler, fuller reply)
+MoodRule = namedtuple('MoodRule', ['prompt', 'token_scale'])
+
+MOODS = {
+    'CHILL': MoodRule('Relaxed. Match their easy vibe; light jokes are fine.', 1.0),
+    'HAPPY': MoodRule('Happy. Celebrate with them and keep the energy up.', 1.0),
+    'SAD': MoodRule(
+        'Feeling low. Be gentle and warm, listen first, no jokes at their expense, no lectures.', 1.25
+    ),
+    'STRESSED': MoodRule(
+        'Stressed. Stay calm, reassure them and suggest one small practical next step.', 1.25
+    ),
+    'ANGRY': MoodRule('Upset. Acknowledge it, do not argue or joke, keep it short and steady.', 0.8),
+}
+DEFAULT_MOOD = 'CHILL'
+
+# Chips the user might tap next. 'continue' follows a statement, 'answer'
+# follows a reply that ends in a question. Casual chips get the user's
+# slang address on the first one ("அப்புறம் மச்சி?").
+SUGGESTIONS = {
+    'continue': {
+        'casual': {
+            'CHILL': ('அப்புறம்?', 'இன்னும் சொல்லு', 'செம்ம!', 'வேற ஏதாவது?'),
+            'HAPPY': ('சூப்பர்!', 'அப்புறம்?', 'இன்னும் சொல்லு', 'ஹா ஹா 😄'),
+            'SAD': ('ம்ம்…', 'கொஞ்சம் பேசணும்', 'thanks', 'வேற ஏதாவது பேசலாம்'),
+            'STRESSED': ('என்ன பண்ணலாம்?', 'step by step சொல்லு', 'சரி, try பண்றேன்', 'கொஞ்சம் relax ஆகணும்'),
+            'ANGRY': ('சரி', 'விடு', 'நான் சொல்றத கேளு', 'வேற பேசலாம்'),
+        },
+        'formal': {
+            'CHILL': ('மேலும் சொல்லுங்கள்', 'உதாரணம் தாருங்கள்', 'சரி', 'நன்றி'),
+            'HAPPY': ('மிக்க மகிழ்ச்சி', 'மேலும் சொல்லுங்கள்', 'நன்றி'),
+            'SAD': ('கொஞ்சம் பேச வேண்டும்', 'நன்றி', 'வேறு விஷயம் பேசலாம்'),
+            'STRESSED': ('அடுத்து என்ன செய்யலாம்?', 'படிப்படியாக விளக்குங்கள்', 'சரி, முயற்சிக்கிறேன்'),
+            'ANGRY': ('சரி', 'புரிகிறது', 'வேறு விஷயம் பேசலாம்'),
+        },
+    },
+    'answer': {
+        'casual': {
+            'CHILL': ('ஆமா', 'இல்ல', 'தெரியல', 'நீ சொல்லு'),
+            'HAPPY': ('ஆமா!', 'இல்ல', 'நீ சொல்லு'),
+            'SAD': ('ஆமா', 'இல்ல', 'தெரியல', 'அப்புறம் சொல்றேன்'),
+            'STRESSED': ('ஆமா', 'இல்ல', 'தெரியல', 'நீயே சொல்லு'),
+            'ANGRY': ('ஆமா', 'இல்ல', 'விடு'),
+        },
+        'formal': {
+            'CHILL': ('ஆம்', 'இல்லை', 'தெரியவில்லை'),
+            'HAPPY': ('ஆம்', 'இல்லை', 'தெரியவில்லை'),
+            'SAD': ('ஆம்', 'இல்லை', 'பிறகு சொல்கிறேன்'),
+            'STRESSED': ('ஆம்', 'இல்லை', 'நீங்களே சொல்லுங்கள்'),
+            'ANGRY': ('ஆம்', 'இல்லை', 'பிறகு பேசலாம்'),
+        },
+    },
+}
+# Batch-generated chips (batch_jobs.py suggestions) carry no mood, so they
+# only stand in for the neutral moods
+NEUTRAL_MOODS = ('CHILL', 'HAPPY')
+MAX_SUGGESTIONS = 4
+
+MARKDOWN_RE = re.compile(r'\*\*|__|`+|^#{1,6}[ \t]*', re.MULTILINE)
+BULLET_RE = re.compile(r'^[ \t]*[*-][ \t]+', re.MULTILINE)
+# Zero-width space, word joiner and BOM; ZWJ/ZWNJ (U+200D/U+200C) shape Tamil and are kept
+ZERO_WIDTH_RE = re.compile('[\u200b\u2060\ufeff]')
+EMOJI_RE = re.compile('[\U0001F300-\U0001FAFF\u2600-\u27BF]\uFE0F?')
+SPACES_RE = re.compile('[ \t\u00a0]+')
+SPACE_BEFORE_PUNCT_RE = re.compile(r' +([?？!.,])')
+BLANK_LINES_RE = re.compile(r' *\n\s*\n\s*')
+LINE_EDGE_RE = re.compile(r' *\n *')
+# A sentence ends at . ! ? … (not inside "1.5") or at a line break
+SENTENCE_END_RE = re.compile(r'[.!?？…](?=\s|$)|\n')
+QUESTION_END_RE = re.compile(r'[?？][^\w\u0B80-\u0BFF]*$')
+
+
+def mood_rule(mood):
+    """MoodRule for a mood name (case-insensitive); unknown moods are CHILL"""
+    return MOODS.get(str(mood or '').strip().upper(), MOODS[DEFAULT_MOOD])
+
+
+def _with_address(chip, address):
+    """'அப்புறம்?' -> 'அப்புறம் மச்சி?'"""
+    body = chip.rstrip('?!…')
+    return f'{body} {address}{chip[len(body):]}'
+
+
+def _keep_first_emoji(text):
+    seen = []
+
+    def keep(match):
+        if seen:
+            return ''
+        seen.append(match)
+        return match.group()
+
+    return EMOJI_RE.sub(keep, text)
+
+
+def postprocess(text, persona='JALIANA', truncated=False):
+    """
+    Tidy a model reply for the chat bubble and TTS:
+
+    - NFC-normalize, so the same Tamil word always has the same code points
+      (cache keys, search and the voice all see one spelling)
+    - drop markdown the plain-text bubble would show literally, and stray
+      zero-width characters
+    - apply the persona's emoji policy (THELIVANA none, AMAITHIYANA at most one)
+    - squeeze whitespace
+    - when the reply hit max_tokens, cut back to the last full sentence
+      (or mark the cut with … if that would lose most of it)
+    """
+    text = unicodedata.normalize('NFC', text or '')
+    text = ZERO_WIDTH_RE.sub('', text)
+    text = MARKDOWN_RE.sub('', text)
+    text = BULLET_RE.sub('• ', text)
+    if persona == 'THELIVANA':
+        text = EMOJI_RE.sub('', text)
+    elif persona == 'AMAITHIYANA':
+        text = _keep_first_emoji(text)
+    text = SPACES_RE.sub(' ', text)
+    text = SPACE_BEFORE_PUNCT_RE.sub(r'\1', text)
+    text = BLANK_LINES_RE.sub('\n\n', text)
+    text = LINE_EDGE_RE.sub('\n', text).strip()
+
+    if truncated and text:
+        ends = [match.start() for match in SENTENCE_END_RE.finditer(text)]
+        if ends and ends[-1] >= len(text) // 2:
+            text = text[:ends[-1] + 1].rstrip()
+        else:
+            text = text.rstrip(' ,;:-') + '…'
+    return text
+
+
+class SuggestionEngine:
+    """
+    Quick-reply chips per (slang, persona, mood, kind), built once at
+    startup from SUGGESTIONS, so picking them is a dict lookup. kind is
+    'answer' when the reply ends in a question, else 'continue'.
+    Batch-generated chips replace the 'continue' ones for neutral moods
+    when available.
+    """
+
+    PRECOMPUTED_TTL = 600
+
+    def __init__(self, brain):
+        self.brain = brain
+        self.table = self._build_table()
+        self._loader = None
+        self._precomputed = {}
+        self._precomputed_loaded_at = None
+        self._precomputed_lock = threading.Lock()
+
+    def _build_table(self):
+        table = {}
+        for slang in self.brain.slang_rules:
+            for persona in self.brain.persona_rules:
+                register = 'formal' if persona in ('VILAKKAMAANA', 'AMAITHIYANA') else 'casual'
+                address = self.brain.instant.address(slang, persona, '')
+                for kind, registers in SUGGESTIONS.items():
+                    for mood, chips in registers[register].items():
+                        if register == 'casual':
+                            chips = (_with_address(chips[0], address),) + chips[1:]
+                        if persona == 'THELIVANA':
+                            chips = tuple(EMOJI_RE.sub('', chip).strip() for chip in chips)
+                        table[(slang, persona, mood, kind)] = chips[:MAX_SUGGESTIONS]
+        return table
+
+    def use_precomputed(self, loader):
+        """Also draw chips from loader() -> {(slang, persona): JSON array}"""
+        self._loader = loader
+
+    def _precomputed_stale(self):
+        loaded_at = self._precomputed_loaded_at
+        return loaded_at is None or time.monotonic() - loaded_at > self.PRECOMPUTED_TTL
+
+    def _precomputed_chips(self, slang, persona):
+        if self._loader is None:
+            return None
+        if self._precomputed_stale():
+            with self._precomputed_lock:
+                if self._precomputed_stale():
+                    chips = {}
+                    try:
+                        for key, content in self._loader().items():
+                            chips[key] = tuple(json.loads(content))[:MAX_SUGGESTIONS]
+                    except Exception:
+                        chips = {}
+                    self._precomputed = chips
+                    self._precomputed_loaded_at = time.monotonic()
+        return self._precomputed.get((slang, persona))
+
+    def suggest(self, reply, slang='COMMON', persona='JALIANA', mood=None):
+        """Chips to show under a reply"""
+        mood = str(mood or '').strip().upper()
+        if mood not in MOODS:
+            mood = DEFAULT_MOOD
+        kind = 'answer' if QUESTION_END_RE.search(reply or '') else 'continue'
+        if kind == 'continue' and mood in NEUTRAL_MOODS:
+            precomputed = self._precomputed_chips(slang, persona)
+            if precomputed:
+                return list(precomputed)
+        chips = self.table.get((slang, persona, mood, kind)) or self.table[('COMMON', 'JALIANA', mood, kind)]
+        return list(chips)
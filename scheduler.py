@@ -0,0 +1,289 @@
+"""
+NANBAN AI - Scheduler
+In-process scheduler for periodic maintenance. Every gunicorn worker runs
+one, but only the worker holding the SQLite leader lease runs jobs.
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+from observability import SCHEDULER_JOB_SECONDS, SCHEDULER_RUNS, get_logger
+
+logger = get_logger('scheduler')
+
+# Longest result/error text kept in job_runs
+MAX_DETAIL_CHARS = 2000
+
+
+class Cron:
+    """
+    Five-field cron expression, "minute hour day-of-month month day-of-week",
+    evaluated in UTC. Fields take *, n, a-b, */n, a-b/n and comma lists;
+    day-of-week is 0-7 with both 0 and 7 meaning Sunday. As in cron, when
+    both day fields are restricted a day matching either one runs.
+    """
+
+    FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expr):
+        parts = expr.split()
+        if len(parts) != 5:
+            raise ValueError(f'Cron expression needs 5 fields: {expr!r}')
+        self.expr = expr
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parse(part, low, high) for part, (low, high) in zip(parts, self.FIELDS)
+        )
+        self.weekdays = frozenset(day % 7 for day in weekdays)
+        self.any_day = parts[2] == '*'
+        self.any_weekday = parts[4] == '*'
+
+    @staticmethod
+    def _parse(spec, low, high):
+        values = set()
+        for part in spec.split(','):
+            span, _, step = part.partition('/')
+            if span == '*':
+                start, end = low, high
+            elif '-' in span:
+                start, end = (int(v) for v in span.split('-', 1))
+            else:
+                start = int(span)
+                end = high if step else start
+            step = int(step) if step else 1
+            if not low <= start <= end <= high or step < 1:
+                raise ValueError(f'Bad cron field {spec!r} (range {low}-{high})')
+            values.update(range(start, end + 1, step))
+        return frozenset(values)
+
+    def _day_matches(self, when):
+        weekday = (when.weekday() + 1) % 7
+        if self.any_day:
+            return self.any_weekday or weekday in self.weekdays
+        if self.any_weekday:
+            return when.day in self.days
+        return when.day in self.days or weekday in self.weekdays
+
+    def next_after(self, when):
+        """First matching minute strictly after when (an aware UTC datetime)"""
+        t = when.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 5)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f'Cron expression never matches: {self.expr!r}')
+
+
+@dataclass
+class Job:
+    """A named maintenance function run every N seconds or on a cron schedule"""
+    name: str
+    fn: Callable
+    every: float = None
+    cron: Cron = None
+    next_run: float = field(default=None, compare=False)
+
+    def next_after(self, started_at):
+        if self.every:
+            return started_at + self.every
+        return self.cron.next_after(datetime.fromtimestamp(started_at, timezone.utc)).timestamp()
+
+    @property
+    def schedule(self):
+        return f'every {self.every:g}s' if self.every else f'cron {self.cron.expr} (UTC)'
+
+
+class Scheduler:
+    """
+    Runs registered jobs on a background thread.
+
+    Each tick the scheduler takes or renews the leader lease row; only the
+    leader runs jobs, so work is done once per deployment rather than once
+    per worker. A lease that is not renewed (worker killed) expires after
+    LEASE_SECONDS and another worker takes over. Schedules are derived from
+    the job_runs history, so a new leader picks up where the old one left
+    off. At most max_concurrency jobs run at once and a job never overlaps
+    itself.
+
+    SCHEDULER=off disables the thread; jobs can still be run by hand with
+    run_now (see /api/admin/jobs).
+    """
+
+    LEASE_SECONDS = 30
+
+    def __init__(self, db, max_concurrency=None, tick_seconds=None, enabled=None):
+        self.db = db
+        self.enabled = (
+            os.environ.get('SCHEDULER', 'on').lower() not in ('off', '0', 'false') if enabled is None else enabled
+        )
+        self.max_concurrency = max_concurrency or int(os.environ.get('SCHEDULER_CONCURRENCY', 2))
+        self.tick_seconds = tick_seconds or float(os.environ.get('SCHEDULER_TICK_SECONDS', 5))
+        self.jobs = {}
+        self.owner = self._new_owner()
+        self.is_leader = False
+        self._running = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pool = None
+
+    @staticmethod
+    def _new_owner():
+        return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+    def add(self, name, fn, every=None, cron=None):
+        """Register fn (no arguments; its return value is stored as the run result)"""
+        if (every is None) == (cron is None):
+            raise ValueError('Give a job exactly one of every= or cron=')
+        self.jobs[name] = Job(name, fn, every=every, cron=Cron(cron) if cron else None)
+
+    def start(self):
+        """Start the scheduler thread (call in each worker, after fork)"""
+        if not self.enabled or not self.jobs or (self._thread and self._thread.is_alive()):
+            return
+        # A forked worker inherits the master's object but none of its threads
+        self.owner = self._new_owner()
+        self.is_leader = False
+        self._running = set()
+        self._stop = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='nanban-job')
+        self._thread = threading.Thread(target=self._loop, name='nanban-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop ticking and hand the lease to another worker (running jobs finish)"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        if self.is_leader:
+            self.db.release_scheduler_lease(self.owner)
+            self.is_leader = False
+        self._pool.shutdown(wait=False)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception:
+                logger.exception('Scheduler tick failed')
+            self._stop.wait(self.tick_seconds)
+
+    def tick(self, now=None):
+        """Renew leadership and start whatever is due"""
+        now = now or time.time()
+        leader, previous_owner = self.db.acquire_scheduler_lease(self.owner, now, self.LEASE_SECONDS)
+        if leader and not self.is_leader:
+            self._become_leader(now, previous_owner)
+        self.is_leader = leader
+        if not leader:
+            return
+
+        for job in self.jobs.values():
+            if job.next_run > now:
+                continue
+            with self._lock:
+                if job.name in self._running or len(self._running) >= self.max_concurrency:
+                    continue
+                self._running.add(job.name)
+            job.next_run = job.next_after(now)
+            self._pool.submit(self._run_scheduled, job)
+
+    def _become_leader(self, now, previous_owner=None):
+        # Only the lapsed leader's runs are orphaned; other workers' run_now
+        # calls are still going and will record their own outcome
+        abandoned = self.db.abandon_job_runs(previous_owner) if previous_owner else 0
+        logger.info('Scheduler leader elected', extra={
+            'owner': self.owner, 'previous_owner': previous_owner, 'abandoned_runs': abandoned
+        })
+        last_starts = self.db.get_last_job_starts()
+        for job in self.jobs.values():
+            last = last_starts.get(job.name)
+            if last is not None:
+                job.next_run = job.next_after(last)
+            elif job.cron:
+                job.next_run = job.next_after(now)
+            else:
+                # Never-run interval jobs start right away
+                job.next_run = now
+
+    def _run_scheduled(self, job):
+        try:
+            self._execute(job)
+        finally:
+            with self._lock:
+                self._running.discard(job.name)
+
+    def _execute(self, job):
+        started_at = time.time()
+        run_id = self.db.start_job_run(job.name, self.owner, started_at)
+        result = error = None
+        try:
+            result = job.fn()
+            status = 'ok'
+        except Exception as e:
+            status = 'error'
+            error = f'{type(e).__name__}: {e}'[:MAX_DETAIL_CHARS]
+            logger.exception('Scheduled job failed', extra={'job': job.name})
+        duration = time.time() - started_at
+
+        detail = json.dumps(result, ensure_ascii=False, default=str)[:MAX_DETAIL_CHARS] if result is not None else None
+        self.db.finish_job_run(run_id, status, time.time(), int(duration * 1000), detail, error)
+        SCHEDULER_RUNS.labels(job=job.name, status=status).inc()
+        SCHEDULER_JOB_SECONDS.labels(job=job.name).observe(duration)
+        if status == 'ok':
+            logger.info('Scheduled job finished', extra={
+                'job': job.name, 'duration_ms': int(duration * 1000), 'result': result
+            })
+        return {'job': job.name, 'status': status, 'result': result, 'error': error}
+
+    def run_now(self, name):
+        """Run a job synchronously in this process, recording it like a scheduled run"""
+        job = self.jobs[name]
+        with self._lock:
+            if name in self._running:
+                return {'job': name, 'status': 'running', 'result': None, 'error': None}
+            self._running.add(name)
+        try:
+            return self._execute(job)
+        finally:
+            with self._lock:
+                self._running.discard(name)
+
+    def status(self, history=20):
+        """Registered jobs, their next run (as seen by this worker) and recent runs"""
+        def iso(ts):
+            return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts else None
+
+        runs = self.db.get_job_runs(limit=history)
+        for run in runs:
+            run['started_at'], run['finished_at'] = iso(run['started_at']), iso(run['finished_at'])
+        return {
+            'enabled': self.enabled,
+            'leader': self.is_leader,
+            'owner': self.owner,
+            'jobs': [
+                {
+                    'name': job.name,
+                    'schedule': job.schedule,
+                    'running': job.name in self._running,
+                    'next_run': iso(job.next_run) if self.is_leader else None,
+                }
+                for job in self.jobs.values()
+            ],
+            'recent_runs': runs,
+        }
@@ -0,0 +1,211 @@
+"""
+NANBAN AI - Session Store
+Server-side Flask sessions. The cookie carries only "<sid>.<version>";
+the data lives in SQLite with a per-process LRU cache in front.
+"""
+
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSessionInterface, SessionInterface, SessionMixin
+
+from observability import get_logger
+
+logger = get_logger('sessions')
+
+COOKIE_RE = re.compile(r'^([0-9a-f]{32})\.(\d+)$')
+# Setting any of these (logging a user in) moves the session to a new sid
+ROTATE_KEYS = frozenset({'user_id'})
+# A read records a visit (last_seen) at most this often per session
+TOUCH_INTERVAL_SECONDS = 24 * 3600
+
+
+class ServerSession(SessionMixin):
+    """
+    Session dict that loads its data on first access and only counts as
+    modified when a value actually changes, so requests that never touch
+    the session (or re-set the same values) cost no store reads or writes.
+    Mutating a nested value in place is not detected; assign it back.
+    Changing a ROTATE_KEYS value marks the session for a new sid on save.
+    """
+
+    def __init__(self, loader=None, sid=None, version=0):
+        self._loader = loader
+        self._data = None
+        self.sid = sid
+        self.version = version
+        self.new = sid is None
+        self.modified = False
+        self.accessed = False
+        self.rotate = False
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    def _ensure(self):
+        self.accessed = True
+        if self._data is None:
+            self._data = self._loader() if self._loader else {}
+        return self._data
+
+    def __getitem__(self, key):
+        return self._ensure()[key]
+
+    def __setitem__(self, key, value):
+        data = self._ensure()
+        if key not in data or data[key] != value:
+            data[key] = value
+            self.modified = True
+            if key in ROTATE_KEYS:
+                self.rotate = True
+
+    def __delitem__(self, key):
+        del self._ensure()[key]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self._ensure())
+
+    def __len__(self):
+        return len(self._ensure())
+
+    def __repr__(self):
+        return f'<ServerSession {self.sid} {self._data!r}>'
+
+
+class ServerSessionInterface(SessionInterface):
+    """
+    Flask session interface backed by Database.sessions.
+
+    The version in the cookie is bumped on every write, so a worker's
+    cached copy is only used while it matches what the client last saw;
+    a write from another gunicorn worker simply misses the cache.
+    Cookies from the old signed-cookie sessions are migrated on first use.
+    A sid the store doesn't know is never adopted (that would let a planted
+    cookie fix a victim's session id): the session starts empty and gets a
+    freshly minted sid when saved, as it does when a user id is first set.
+    Reads record a visit in last_seen at most once per TOUCH_INTERVAL_SECONDS,
+    so purge(), run by the scheduler, only removes sessions nobody has used
+    for max_age_days, however long ago their data last changed.
+    """
+
+    def __init__(self, db, cache_size=10000, max_age_days=None):
+        self.db = db
+        self.cache_size = cache_size
+        self.max_age_days = max_age_days or int(os.environ.get('SESSION_MAX_AGE_DAYS', 90))
+        self.serializer = TaggedJSONSerializer()
+        self.legacy = SecureCookieSessionInterface()
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cache_get(self, sid, version):
+        """(data, last_seen) for a cached sid at this version, or None"""
+        with self._lock:
+            entry = self._cache.get(sid)
+            if entry is None or entry[0] != version:
+                return None
+            self._cache.move_to_end(sid)
+            return dict(entry[1]), entry[2]
+
+    def _cache_put(self, sid, version, data, last_seen):
+        with self._lock:
+            self._cache[sid] = (version, dict(data), last_seen)
+            self._cache.move_to_end(sid)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _cache_drop(self, sid):
+        with self._lock:
+            self._cache.pop(sid, None)
+
+    def _touch(self, sid, version, data, last_seen):
+        """Record a visit if the stored last_seen is a day or more old"""
+        now = int(time.time())
+        if last_seen is None or now - last_seen >= TOUCH_INTERVAL_SECONDS:
+            self.db.touch_session(sid)
+            self._cache_put(sid, version, data, now)
+
+    def _load(self, session):
+        cached = self._cache_get(session.sid, session.version)
+        if cached is not None:
+            data, last_seen = cached
+            self._touch(session.sid, session.version, data, last_seen)
+            return data
+        row = self.db.get_session(session.sid)
+        if row is None:
+            # Expired, purged or made up: treat as a new session
+            session.sid = None
+            return {}
+        data = self.serializer.loads(row[0])
+        self._cache_put(session.sid, row[1], data, row[2])
+        self._touch(session.sid, row[1], data, row[2])
+        return dict(data)
+
+    def open_session(self, app, request):
+        value = request.cookies.get(self.get_cookie_name(app))
+        if not value:
+            return ServerSession()
+
+        match = COOKIE_RE.match(value)
+        if match:
+            session = ServerSession(sid=match.group(1), version=int(match.group(2)))
+            session._loader = lambda: self._load(session)
+            return session
+
+        # A signed cookie from before server-side sessions: carry its data over
+        legacy = self.legacy.open_session(app, request)
+        data = dict(legacy) if legacy else {}
+        session = ServerSession(lambda: data)
+        session.modified = bool(data)
+        return session
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not session.modified or not session.loaded:
+            return
+
+        data = dict(session)
+        if not data:
+            if session.sid:
+                self.db.delete_session(session.sid)
+                self._cache_drop(session.sid)
+            if not session.new:
+                response.delete_cookie(
+                    name, domain=domain, path=path,
+                    secure=self.get_cookie_secure(app),
+                    samesite=self.get_cookie_samesite(app),
+                    httponly=self.get_cookie_httponly(app),
+                )
+            return
+
+        if session.rotate and session.sid:
+            self.db.delete_session(session.sid)
+            self._cache_drop(session.sid)
+            session.sid = None
+        sid = session.sid or secrets.token_hex(16)
+        version = self.db.save_session(sid, self.serializer.dumps(data))
+        self._cache_put(sid, version, data, int(time.time()))
+        response.set_cookie(
+            name, f'{sid}.{version}',
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+    def purge(self):
+        """Delete sessions not seen for more than max_age_days"""
+        return self.db.purge_sessions(self.max_age_days)
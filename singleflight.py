@@ -0,0 +1,59 @@
+"""
+NANBAN AI - Single Flight
+Coalesces concurrent identical upstream calls into one in-progress call
+"""
+
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future
+
+from observability import COALESCED_CALLS
+
+# How long a caller waits on someone else's identical call before giving up
+DEFAULT_TIMEOUT = float(os.environ.get('SINGLEFLIGHT_TIMEOUT', 30))
+
+
+def request_key(*parts):
+    """Stable hash of a JSON-serializable upstream request"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SingleFlight:
+    """
+    The first caller for a key runs fn; callers arriving while it runs wait
+    on the same Future and get its result, or its exception re-raised. A
+    waiter that times out gets TimeoutError. Nothing is cached: once the
+    call finishes, the next caller starts a fresh one.
+    """
+
+    def __init__(self, service, timeout=None):
+        self.service = service
+        self.timeout = DEFAULT_TIMEOUT if timeout is None else timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            COALESCED_CALLS.labels(service=self.service).inc()
+            return future.result(timeout=self.timeout)
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
@@ -0,0 +1,20 @@
+import pytest
+
+from database import Database
+
+
+@pytest.fixture
+def db(tmp_path):
+    return Database(str(tmp_path / 'nanban.db'))
+
+
+@pytest.fixture
+def app_module(db, monkeypatch):
+    """The app module with its database swapped for a fresh one"""
+    monkeypatch.setenv('SESSION_BACKEND', 'cookie')
+    monkeypatch.setenv('SCHEDULER', 'off')
+    import app
+    from memory_index import MemoryIndex
+    monkeypatch.setattr(app, 'db', db)
+    monkeypatch.setattr(app, 'memory_index', MemoryIndex(db))
+    return app
@@ -0,0 +1,140 @@
+import gzip
+import os
+
+import pytest
+from flask import Flask, url_for
+
+import assets
+import compression
+from assets import build, minify_css, render_cached
+
+STYLE = '''
+/* layout */
+.chat :hover , .card > .title {
+    color : #333 ;
+    margin: 0 auto;
+}
+.x :not(.y) { background: url(data:image/png;base64,AAAA) }
+@media (max-width: 600px) {
+    .a :first-child { padding : 4px 8px ; }
+}
+''' + ''.join(f'.m{i} {{ color: red; }}\n' for i in range(40))
+
+
+@pytest.mark.parametrize('css, minified', [
+    ('.a :hover { color : red ; }', '.a :hover{color:red}'),
+    ('.a:hover{color:red}', '.a:hover{color:red}'),
+    ('.x :not(.y) , .b > .c { margin : 0 auto }', '.x :not(.y),.b > .c{margin:0 auto}'),
+    ('@media (max-width: 600px) { .a ::before { content : "x" } }',
+     '@media (max-width: 600px){.a ::before{content:"x"}}'),
+    ('/* c */ .a { color: rgba(0 , 0 , 0 , .5) ; }', '.a{color:rgba(0,0,0,.5)}'),
+])
+def test_minify_css_keeps_selector_whitespace(css, minified):
+    assert minify_css(css) == minified
+
+
+@pytest.fixture
+def static_dir(tmp_path):
+    static = tmp_path / 'static'
+    (static / 'css').mkdir(parents=True)
+    (static / 'css' / 'style.css').write_text(STYLE)
+    (static / 'logo.txt').write_text('நண்பா')
+    return static
+
+
+def test_build_fingerprints_minifies_and_precompresses(static_dir):
+    manifest = build(str(static_dir))
+    assert sorted(manifest) == ['css/style.css', 'logo.txt']
+
+    dist = static_dir / assets.DIST_DIR
+    css = (dist / manifest['css/style.css']).read_text()
+    assert css == minify_css(STYLE)
+    assert '.chat :hover' in css
+    assert gzip.decompress((dist / (manifest['css/style.css'] + '.gz')).read_bytes()).decode() == css
+    # Too small to be worth compressing
+    assert not os.path.exists(dist / (manifest['logo.txt'] + '.gz'))
+    assert assets.load_manifest(str(static_dir)) == manifest
+
+    # Rebuilding skips the previous output and is deterministic
+    assert build(str(static_dir)) == manifest
+    (static_dir / 'css' / 'style.css').write_text(STYLE + '.new { color: blue }')
+    assert build(str(static_dir))['css/style.css'] != manifest['css/style.css']
+
+
+@pytest.fixture
+def app(static_dir, tmp_path):
+    build(str(static_dir))
+    templates = tmp_path / 'templates'
+    templates.mkdir()
+    (templates / 'page.html').write_text(
+        '<link href="{{ url_for(\'static\', filename=\'css/style.css\') }}">' + '<p>வணக்கம்</p>' * 200
+    )
+    app = Flask(__name__, static_folder=str(static_dir), template_folder=str(templates))
+    assets.init_app(app)
+
+    @app.route('/page')
+    def page():
+        return render_cached('page.html')
+
+    return app
+
+
+def test_url_for_points_at_the_fingerprinted_file(app):
+    with app.test_request_context():
+        assert url_for('static', filename='css/style.css') == (
+            f"/static/dist/{app.extensions['assets']['manifest']['css/style.css']}"
+        )
+
+
+@pytest.mark.parametrize('accept, encoding', [
+    ('br, gzip', 'br'),
+    ('gzip', 'gzip'),
+    ('identity', None),
+])
+def test_dist_asset_negotiates_the_encoding(app, accept, encoding):
+    if encoding == 'br' and compression.brotli is None:
+        pytest.skip('brotli not installed')
+    with app.test_request_context():
+        path = url_for('static', filename='css/style.css')
+
+    response = app.test_client().get(path, headers={'Accept-Encoding': accept})
+    assert response.status_code == 200
+    assert response.headers.get('Content-Encoding') == encoding
+    assert response.mimetype == 'text/css'
+    assert response.headers['Cache-Control'] == assets.IMMUTABLE
+    assert 'Accept-Encoding' in response.vary
+    body = response.get_data()
+    if encoding == 'gzip':
+        body = gzip.decompress(body)
+    elif encoding == 'br':
+        body = compression.brotli.decompress(body)
+    assert body.decode() == minify_css(STYLE)
+
+
+def test_dist_asset_rejects_paths_outside_dist(app):
+    assert app.test_client().get('/static/dist/../css/style.css').status_code == 404
+    assert app.test_client().get('/static/dist/missing.css').status_code == 404
+
+
+def test_render_cached_etags_per_encoding(app):
+    client = app.test_client()
+    plain = client.get('/page', headers={'Accept-Encoding': 'identity'})
+    zipped = client.get('/page', headers={'Accept-Encoding': 'gzip'})
+
+    assert plain.headers['Cache-Control'] == assets.REVALIDATE
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(zipped.get_data()) == plain.get_data()
+    # Different bytes, different validators
+    assert plain.headers['ETag'] != zipped.headers['ETag']
+
+    again = client.get('/page', headers={'Accept-Encoding': 'gzip', 'If-None-Match': zipped.headers['ETag']})
+    assert again.status_code == 304
+    mismatched = client.get('/page', headers={'Accept-Encoding': 'identity', 'If-None-Match': zipped.headers['ETag']})
+    assert mismatched.status_code == 200
+
+
+def test_render_cached_renders_once(app, monkeypatch):
+    client = app.test_client()
+    client.get('/page')
+    monkeypatch.setattr(assets, 'render_template', lambda *args, **kwargs: pytest.fail('re-rendered'))
+    assert client.get('/page').status_code == 200
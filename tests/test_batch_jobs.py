@@ -0,0 +1,94 @@
+import pytest
+
+from batch_jobs import (
+    BatchJobRunner, LocalBatchBackend, build_memory_summaries, make_template_responder, write_memory_summaries
+)
+from openai_brain import NanbanBrain
+
+
+@pytest.fixture(scope='module')
+def brain():
+    return NanbanBrain()
+
+
+def summarize(db):
+    """Build the memory_summaries job and answer every request"""
+    return [(request.custom_id, '- Loves biryani') for request in build_memory_summaries(db, None)]
+
+
+def test_summaries_are_written_for_unchanged_facts(db):
+    user_id = db.create_user('Priya')
+    db.set_memory(user_id, consent=True, facts='I love biryani.')
+
+    write_memory_summaries(db, summarize(db))
+    assert db.get_memory_summary(user_id) == '- Loves biryani'
+
+
+def test_summaries_of_changed_facts_are_dropped(db):
+    user_id = db.create_user('Priya')
+    db.set_memory(user_id, consent=True, facts='I love biryani.')
+    results = summarize(db)
+
+    db.set_memory(user_id, consent=True, facts='I am vegetarian now.')
+    write_memory_summaries(db, results)
+    assert db.get_memory_summary(user_id) is None
+
+
+def test_changing_or_clearing_memory_removes_the_summary(db):
+    user_id = db.create_user('Priya')
+    db.set_memory(user_id, consent=True, facts='I love biryani.')
+    write_memory_summaries(db, summarize(db))
+
+    # Same facts (e.g. only the mood changed) keep it
+    db.set_memory(user_id, consent=True, facts='I love biryani.', mood='HAPPY')
+    assert db.get_memory_summary(user_id) == '- Loves biryani'
+
+    db.set_memory(user_id, consent=False, facts='I love biryani.')
+    assert db.get_memory_summary(user_id) is None
+
+    db.set_memory(user_id, consent=True, facts='I love biryani.')
+    write_memory_summaries(db, summarize(db))
+    db.clear_memory(user_id)
+    assert db.get_memory_summary(user_id) is None
+
+
+def runner_for(db, brain, tmp_path, responder):
+    return BatchJobRunner(db, brain, LocalBatchBackend(responder, workdir=str(tmp_path)))
+
+
+@pytest.mark.parametrize('job, kind', [('greetings', 'greeting'), ('suggestions', 'suggestions')])
+def test_empty_completions_are_marked_invalid_and_retried(db, brain, tmp_path, job, kind):
+    template = make_template_responder(brain)
+    # A refusal or length cut-off: the completion has no content
+    refused = lambda request: None if ':CHENNAI:JALIANA:' in request['custom_id'] else template(request)
+    combos = len(brain.slang_rules) * len(brain.persona_rules)
+
+    summary = runner_for(db, brain, tmp_path, refused).run(job)
+    assert summary['requests'] == combos
+    replies = db.get_precomputed_replies(kind)
+    assert len(replies) == combos - 1
+    assert ('CHENNAI', 'JALIANA') not in replies
+
+    # The invalid one is not checkpointed as done, so the next run retries only it
+    summary = runner_for(db, brain, tmp_path, template).run(job)
+    assert summary['requests'] == 1
+    assert ('CHENNAI', 'JALIANA') in db.get_precomputed_replies(kind)
+
+
+def test_empty_memory_summary_is_retried(db, tmp_path):
+    user_id = db.create_user('Priya')
+    db.set_memory(user_id, consent=True, facts='I love biryani.')
+
+    assert write_memory_summaries(db, [(request.custom_id, None) for request in build_memory_summaries(db, None)])
+    assert db.get_memory_summary(user_id) is None
+
+
+def test_changed_prompts_are_regenerated_without_fresh(db, brain, tmp_path, monkeypatch):
+    template = make_template_responder(brain)
+    combos = len(brain.slang_rules) * len(brain.persona_rules)
+    assert runner_for(db, brain, tmp_path, template).run('greetings')['requests'] == combos
+    assert runner_for(db, brain, tmp_path, template).run('greetings')['requests'] == 0
+
+    build = brain.build_system_prompt
+    monkeypatch.setattr(brain, 'build_system_prompt', lambda *args: build(*args) + '\nBe extra warm.')
+    assert runner_for(db, brain, tmp_path, template).run('greetings')['requests'] == combos
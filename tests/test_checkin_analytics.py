@@ -0,0 +1,73 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from checkin_analytics import compute_rollups, mood_trends, period_start
+
+
+def rollups(db, user_id):
+    counts = db.get_checkin_mood_counts(user_id, 'week', '2000-01-01', '2100-01-01')
+    counts += db.get_checkin_mood_counts(user_id, 'month', '2000-01-01', '2100-01-01')
+    return sorted((row['period_start'], row['mood'], row['count']) for row in counts), db.get_checkin_streak(user_id)
+
+
+def test_period_start():
+    assert period_start('2024-05-08', 'week') == '2024-05-06'
+    assert period_start('2024-05-08', 'month') == '2024-05-01'
+
+
+def test_compute_rollups_counts_and_streaks():
+    counts, streaks = compute_rollups(
+        [1, 1, 1, 1, 2],
+        ['2024-04-29', '2024-04-30', '2024-05-01', '2024-05-03', '2024-05-01'],
+        ['happy', 'happy', 'sad', 'happy', None],
+    )
+    assert (1, 'week', '2024-04-29', 'happy', 3) in counts
+    assert (1, 'month', '2024-04-01', 'happy', 2) in counts
+    assert (1, 'month', '2024-05-01', 'sad', 1) in counts
+    assert (2, 'week', '2024-04-29', '', 1) in counts
+    assert sorted(streaks) == [(1, 1, 3, '2024-05-03', 4), (2, 1, 1, '2024-05-01', 1)]
+
+
+def test_incremental_rollups_match_a_rebuild(db):
+    user_id = db.create_user('Priya')
+    rng = random.Random(7)
+    days = [(date(2024, 3, 1) + timedelta(days=i)).isoformat() for i in range(60)]
+    # In and out of order, with some days checked in twice under a new mood
+    for day in rng.sample(days, 45) + rng.sample(days, 10):
+        db.upsert_checkin(user_id, day, rng.choice(['happy', 'sad', 'tired']), None)
+
+    incremental = rollups(db, user_id)
+    db.rebuild_checkin_rollups([user_id])
+    assert rollups(db, user_id) == incremental
+
+
+def test_backfilled_day_joins_streaks(db):
+    user_id = db.create_user('Priya')
+    for day in ('2024-05-01', '2024-05-02', '2024-05-04'):
+        db.upsert_checkin(user_id, day, 'happy', None)
+    assert db.get_checkin_streak(user_id)['longest_streak'] == 2
+
+    db.upsert_checkin(user_id, '2024-05-03', 'sad', None)
+    streak = db.get_checkin_streak(user_id)
+    assert (streak['current_streak'], streak['longest_streak'], streak['total_days']) == (4, 4, 4)
+
+
+def test_mood_trends(db):
+    user_id = db.create_user('Priya')
+    for day, mood in (('2024-05-06', 'happy'), ('2024-05-07', 'happy'), ('2024-05-08', 'sad'), ('2024-05-13', 'sad')):
+        db.upsert_checkin(user_id, day, mood, None)
+
+    trends = mood_trends(db, user_id, 'week', '2024-05-06', '2024-05-19', today=date(2024, 5, 14))
+    assert trends['buckets'] == [
+        {'start': '2024-05-06', 'total': 3, 'moods': {'happy': 2, 'sad': 1}},
+        {'start': '2024-05-13', 'total': 1, 'moods': {'sad': 1}},
+    ]
+    assert trends['streak']['current_streak'] == 1
+
+    # A run that ended before yesterday is reported as broken
+    assert mood_trends(db, user_id, 'week', today=date(2024, 5, 20))['streak']['current_streak'] == 0
+
+    with pytest.raises(ValueError):
+        mood_trends(db, user_id, 'year')
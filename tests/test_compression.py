@@ -0,0 +1,135 @@
+import gzip
+import json
+from datetime import datetime, timezone
+
+import pytest
+from flask import Flask, Response, jsonify
+
+import compression
+import json_provider
+from json_provider import FastJSONProvider
+
+BIG = {'messages': [{'role': 'assistant', 'content': 'வணக்கம் நண்பா! எப்படி இருக்க?'}] * 40}
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    compression.init_app(app)
+
+    @app.get('/api/big')
+    def big():
+        return jsonify(BIG)
+
+    @app.get('/api/small')
+    def small():
+        return jsonify(ok=True)
+
+    @app.get('/api/stream')
+    def stream():
+        return Response((json.dumps(BIG) for _ in range(2)), mimetype='application/json')
+
+    @app.get('/api/encoded')
+    def encoded():
+        response = Response(gzip.compress(json.dumps(BIG).encode()), mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+        return response
+
+    @app.get('/api/image')
+    def image():
+        return Response(b'\x89PNG' * 1000, mimetype='image/png')
+
+    @app.get('/page')
+    def page():
+        return Response('x' * 5000, mimetype='text/html')
+
+    return app
+
+
+@pytest.mark.parametrize('accept, encoding', [
+    ('gzip, deflate, br', 'br'),
+    ('gzip', 'gzip'),
+    ('br;q=0, gzip', 'gzip'),
+    ('identity', None),
+    ('', None),
+])
+def test_negotiates_the_encoding(app, accept, encoding):
+    if encoding == 'br' and compression.brotli is None:
+        pytest.skip('brotli not installed')
+    response = app.test_client().get('/api/big', headers={'Accept-Encoding': accept})
+    assert response.headers.get('Content-Encoding') == encoding
+    assert 'Accept-Encoding' in response.vary
+    body = response.data
+    if encoding == 'gzip':
+        body = gzip.decompress(body)
+    elif encoding == 'br':
+        body = compression.brotli.decompress(body)
+    assert json.loads(body) == BIG
+
+
+def test_gzip_only_without_brotli(app, monkeypatch):
+    monkeypatch.setattr(compression, 'brotli', None)
+    response = app.test_client().get('/api/big', headers={'Accept-Encoding': 'br, gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+
+
+def test_min_bytes_threshold(app, monkeypatch):
+    client = app.test_client()
+    assert 'Content-Encoding' not in client.get('/api/small', headers={'Accept-Encoding': 'gzip'}).headers
+
+    monkeypatch.setattr(compression, 'MIN_BYTES', 1)
+    assert client.get('/api/small', headers={'Accept-Encoding': 'gzip'}).headers['Content-Encoding'] == 'gzip'
+
+
+@pytest.mark.parametrize('path', ['/api/stream', '/api/image', '/page'])
+def test_skips_streamed_binary_and_non_api_responses(app, path):
+    response = app.test_client().get(path, headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_leaves_already_encoded_responses_alone(app):
+    response = app.test_client().get('/api/encoded', headers={'Accept-Encoding': 'br, gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(response.data)) == BIG
+
+
+def test_history_etag_survives_compression(app_module, db):
+    user_id = db.create_user('Priya')
+    for _ in range(30):
+        db.save_message(user_id, 'user', 'இன்னைக்கு exam எப்படி போச்சு தெரியுமா')
+    client = app_module.app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+
+    response = client.get('/api/history', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+
+    again = client.get('/api/history', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+
+
+OBJECTS = [
+    {'text': 'வணக்கம் நண்பா', 'n': 3, 'ok': True, 'none': None, 'ratio': 0.5, 'nested': [1, [2, {'a': 'b'}]]},
+    {'when': datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)},
+    ['🔥', 'machi', -7],
+    {'big': 2 ** 70},
+]
+
+
+@pytest.mark.parametrize('obj', OBJECTS)
+def test_stdlib_fallback_matches_orjson(app, monkeypatch, obj):
+    fast = app.json.dumps_bytes(obj)
+    monkeypatch.setattr(json_provider, 'orjson', None)
+    assert app.json.dumps_bytes(obj) == fast
+    assert app.json.dumps(obj) == fast.decode('utf-8')
+
+
+def test_json_is_compact_utf8(app):
+    with app.test_request_context():
+        response = jsonify(text='நண்பா', b=1, a=2)
+    assert response.data == '{"text":"நண்பா","b":1,"a":2}\n'.encode('utf-8')
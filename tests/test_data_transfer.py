@@ -0,0 +1,182 @@
+import gzip
+import json
+
+import pytest
+
+from data_transfer import import_lines, iter_export_lines
+from memory_index import MemoryIndex
+
+
+def seed(db):
+    user_id = db.create_user('Priya', 'CHENNAI', 'AMAITHIYANA')
+    db.set_memory(user_id, consent=True, facts='I love biryani.\nStudying for CA exams.', mood='STRESSED')
+    db.upsert_checkin(user_id, '2024-05-01', 'happy', 'exam done')
+    db.upsert_checkin(user_id, '2024-05-02', 'tired', None)
+    db.save_message(user_id, 'user', 'வணக்கம் நண்பா')
+    db.save_message(user_id, 'assistant', 'வணக்கம்! எப்படி இருக்க?')
+    return user_id
+
+
+def test_export_import_round_trip(db, tmp_path):
+    user_id = seed(db)
+    lines = list(iter_export_lines(db, user_ids=[user_id], batch_size=1))
+    assert json.loads(lines[0])['type'] == 'header'
+
+    from database import Database
+    target = Database(str(tmp_path / 'target.db'))
+    index = MemoryIndex(target)
+    counts = import_lines(target, lines, batch_size=1, memory_index=index)
+    assert counts == {'users': 1, 'messages': 2, 'checkins': 2}
+
+    new_id = next(iter(target.iter_user_ids()))
+    assert target.get_user(new_id)['persona'] == 'AMAITHIYANA'
+    assert target.get_memory(new_id)['facts'] == db.get_memory(user_id)['facts']
+    assert [m['content'] for m in target.iter_conversations(new_id)] == [
+        m['content'] for m in db.iter_conversations(user_id)
+    ]
+    assert [c['day'] for c in target.iter_checkins(new_id)] == ['2024-05-01', '2024-05-02']
+    assert target.get_checkin_streak(new_id)['total_days'] == 2
+    assert index.relevant_facts(new_id, 'biryani', k=1) == 'I love biryani.'
+
+
+@pytest.mark.parametrize('body, message', [
+    ('{"type": "header", "version": 1}\n[1, 2]\n', 'line 2: expected a JSON object'),
+    ('{"type": "header", "version": 1}\n{"type": "message"\n', 'line 2:'),
+    ('{"type": "checkin", "user_id": 1, "mood": "happy"}\n', 'line 1: check-in without a day'),
+    ('{"type": "header", "version": 99}\n', 'Unsupported export version'),
+    ('{"type": "header", "version": "1"}\n', 'Unsupported export version'),
+    ('{"type": "header", "version": null}\n', 'Unsupported export version'),
+    ('{"type": "message", "user_id": [1], "role": "user", "content": "hi"}\n', 'line 1: user_id'),
+    ('{"type": "message", "user_id": {"id": 1}, "role": "user", "content": "hi"}\n', 'line 1: user_id'),
+    ('{"type": "checkin", "user_id": 1, "day": ["2024-05-01"]}\n', 'line 1: check-in without a day'),
+    ('{"type": "message", "user_id": 1, "role": null, "content": "hi"}\n', 'line 1: message without a role'),
+    ('{"type": "message", "user_id": 1, "role": "user", "content": 5}\n', 'line 1: message without a role'),
+    ('{"type": "checkin", "user_id": 1, "day": "not-a-date"}\n', 'line 1: day must be YYYY-MM-DD'),
+    ('{"type": "checkin", "user_id": 1, "day": "20240501"}\n', 'line 1: day must be YYYY-MM-DD'),
+    ('{"type": "checkin", "user_id": 1, "day": "2024-05-01", "mood": [1]}\n', 'line 1: mood must be a string'),
+    ('{"type": "checkin", "user_id": 1, "day": "2024-05-01", "note": 7}\n', 'line 1: note must be a string'),
+    ('{"type": "memory", "user_id": 1, "consent": true, "facts": 123}\n', 'line 1: facts must be a string'),
+    ('{"type": "memory", "user_id": 1, "consent": "yes", "facts": "x"}\n', 'line 1: consent must be'),
+    ('{"type": "message", "user_id": 1, "role": "user", "content": "hi", "timestamp": {}}\n',
+     'line 1: timestamp must be a string'),
+    ('{"type": "user", "user_id": 1, "name": "Priya", "persona": 3}\n', 'line 1: persona must be a string'),
+])
+def test_import_rejects_malformed_lines(db, body, message):
+    with pytest.raises(ValueError, match=message):
+        import_lines(db, body.splitlines())
+
+
+def client_for(app_module, user_id):
+    client = app_module.app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+    return client
+
+
+def test_import_endpoint_returns_400_for_bad_input(app_module, db):
+    client = client_for(app_module, db.create_user('Priya'))
+
+    response = client.post('/api/import', data='"just a string"\n', content_type='application/x-ndjson')
+    assert response.status_code == 400
+    assert 'line 1' in response.json['error']
+
+    corrupt = gzip.compress(b'{"type": "header", "version": 1}\n')[:-12] + b'garbage!!!!!'
+    response = client.post('/api/import', data=corrupt, content_type='application/gzip')
+    assert response.status_code == 400
+
+    response = client.post('/api/import', data=b'not gzip at all', content_type='application/gzip')
+    assert response.status_code == 400
+
+    for body in (
+        '{"type": "header", "version": "2"}\n',
+        '{"type": "message", "user_id": [1], "role": "user", "content": "hi"}\n',
+        '{"type": "checkin", "day": "not-a-date"}\n',
+        '{"type": "memory", "user_id": 1, "consent": true, "facts": 123}\n',
+        '{"type": "message", "user_id": 1, "role": "user", "content": "hi", "timestamp": {}}\n',
+        '{"type": "checkin", "user_id": 1, "day": "2024-05-01", "mood": [1]}\n',
+    ):
+        response = client.post('/api/import', data=body, content_type='application/x-ndjson')
+        assert response.status_code == 400
+
+
+def test_import_endpoint_accepts_gzip(app_module, db):
+    user_id = seed(db)
+    body = gzip.compress(''.join(iter_export_lines(db, user_ids=[user_id])).encode('utf-8'))
+
+    response = client_for(app_module, db.create_user('Priya')).post(
+        '/api/import', data=body, content_type='application/gzip'
+    )
+    assert response.status_code == 200
+    assert response.json['imported'] == {'users': 1, 'messages': 2, 'checkins': 2}
+
+
+def test_import_endpoint_needs_a_user_or_the_admin_token(app_module, db, monkeypatch):
+    user_id = seed(db)
+    body = ''.join(iter_export_lines(db, user_ids=[user_id]))
+    before = sum(1 for _ in db.iter_user_ids())
+
+    response = app_module.app.test_client().post('/api/import', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 404
+    assert sum(1 for _ in db.iter_user_ids()) == before
+
+    monkeypatch.setattr(app_module, 'ADMIN_TOKEN', 'secret')
+    response = app_module.app.test_client().post(
+        '/api/import', data=body, content_type='application/x-ndjson', headers={'Authorization': 'Bearer secret'}
+    )
+    assert response.status_code == 200
+    assert sum(1 for _ in db.iter_user_ids()) == before + 1
+
+
+def test_import_endpoint_caps_the_upload(app_module, db, monkeypatch):
+    monkeypatch.setattr(app_module, 'IMPORT_MAX_BYTES', 100)
+    client = client_for(app_module, db.create_user('Priya'))
+    lines = ''.join(
+        json.dumps({'type': 'message', 'user_id': 1, 'role': 'user', 'content': 'வணக்கம்'}) + '\n' for _ in range(20)
+    ).encode('utf-8')
+
+    response = client.post('/api/import', data=lines, content_type='application/x-ndjson')
+    assert response.status_code == 413
+
+    # A small gzip body that inflates past the limit is cut off while spooling
+    response = client.post('/api/import', data=gzip.compress(lines), content_type='application/gzip')
+    assert response.status_code == 413
+    assert len(list(db.iter_conversations(1))) == 0
+
+
+def test_upload_is_validated_before_the_transaction(app_module, db, monkeypatch):
+    client = client_for(app_module, db.create_user('Priya'))
+    monkeypatch.setattr(db, 'import_records', lambda *args, **kwargs: pytest.fail('import started'))
+    body = '{"type": "message", "user_id": 1, "role": "user", "content": "hi"}\n{"type": "checkin"}\n'
+
+    response = client.post('/api/import', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 400
+    assert 'line 2' in response.json['error']
+
+
+def test_failed_import_leaves_nothing_behind(db):
+    user_id = seed(db)
+    lines = list(iter_export_lines(db, user_ids=[user_id]))
+    before = sum(1 for _ in db.iter_user_ids())
+
+    with pytest.raises(ValueError, match=f'line {len(lines) + 1}'):
+        import_lines(db, lines + ['{"type": "message", "user_id": 1}\n'], batch_size=1)
+
+    assert sum(1 for _ in db.iter_user_ids()) == before
+    assert len(list(db.iter_conversations(user_id))) == 2
+
+
+def test_import_rebuilds_rollups_once(db, monkeypatch):
+    user_id = db.create_user('Priya')
+    lines = [
+        json.dumps({'type': 'checkin', 'user_id': 7, 'day': f'2024-05-{day:02d}', 'mood': 'happy'})
+        for day in range(1, 11)
+    ]
+    calls = []
+    rebuild = db._rebuild_checkin_rollups
+    monkeypatch.setattr(db, '_rebuild_checkin_rollups', lambda *args: calls.append(args) or rebuild(*args))
+
+    counts = import_lines(db, lines, target_user_id=user_id, batch_size=3)
+
+    assert counts == {'users': 1, 'messages': 0, 'checkins': 10}
+    assert len(calls) == 1
+    assert db.get_checkin_streak(user_id)['current_streak'] == 10
@@ -0,0 +1,70 @@
+import pytest
+
+
+@pytest.fixture
+def client(app_module, db):
+    user_id = db.create_user('Priya')
+    for i in range(1, 8):
+        db.save_message(user_id, 'user' if i % 2 else 'assistant', f'message {i}')
+    client = app_module.app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+    return client
+
+
+def page_contents(response):
+    return [message['content'] for message in response.json['messages']]
+
+
+def test_pages_walk_back_to_the_start(client):
+    first = client.get('/api/history?limit=3')
+    assert page_contents(first) == ['message 5', 'message 6', 'message 7']
+
+    cursor = first.json['next_cursor']
+    second = client.get(f'/api/history?limit=3&before={cursor}')
+    assert page_contents(second) == ['message 2', 'message 3', 'message 4']
+
+    last = client.get(f"/api/history?limit=3&before={second.json['next_cursor']}")
+    assert page_contents(last) == ['message 1']
+    assert last.json['next_cursor'] is None
+
+
+def test_exact_last_page_has_no_cursor(client):
+    response = client.get('/api/history?limit=7')
+    assert len(response.json['messages']) == 7
+    assert response.json['next_cursor'] is None
+
+    response = client.get('/api/history?limit=6')
+    assert response.json['next_cursor'] is not None
+
+
+def test_cursor_past_the_start_is_empty(client):
+    response = client.get('/api/history?before=1')
+    assert response.json == {'messages': [], 'next_cursor': None}
+
+
+def test_limit_is_clamped(client):
+    assert len(client.get('/api/history?limit=0').json['messages']) == 1
+    assert len(client.get('/api/history?limit=1000').json['messages']) == 7
+
+
+def test_no_user_gets_an_empty_page(app_module):
+    response = app_module.app.test_client().get('/api/history')
+    assert response.json == {'messages': [], 'next_cursor': None}
+
+
+def test_unchanged_page_is_a_304(client, db):
+    response = client.get('/api/history?limit=3')
+    etag = response.headers['ETag']
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+
+    again = client.get('/api/history?limit=3', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+
+    # A new message changes the newest page
+    user_id = next(iter(db.iter_user_ids()))
+    db.save_message(user_id, 'user', 'message 8')
+    changed = client.get('/api/history?limit=3', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert page_contents(changed)[-1] == 'message 8'
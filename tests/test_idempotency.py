@@ -0,0 +1,97 @@
+import itertools
+
+import pytest
+from flask import Flask, jsonify, request, session
+
+import idempotency
+from idempotency import PROCEED, REPLAY, IdempotencyStore, idempotent
+from session_store import ServerSessionInterface
+
+
+@pytest.fixture
+def store(db):
+    return IdempotencyStore(db, wait_timeout=1)
+
+
+@pytest.fixture
+def app(db, store):
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.session_interface = ServerSessionInterface(db)
+    counter = itertools.count(1)
+
+    @app.post('/login/<int:user_id>')
+    def login(user_id):
+        session['user_id'] = user_id
+        return jsonify(ok=True)
+
+    @app.post('/visit')
+    def visit():
+        session['slang'] = 'CHENNAI'
+        return jsonify(ok=True)
+
+    @app.post('/chat')
+    @idempotent(store)
+    def chat():
+        return jsonify(reply=next(counter), message=request.json['message'])
+
+    return app
+
+
+def post_chat(client, key='k1', message='hi'):
+    return client.post('/chat', json={'message': message}, headers={'Idempotency-Key': key})
+
+
+def test_retry_replays_first_response(app):
+    client = app.test_client()
+    client.post('/login/1')
+    first = post_chat(client)
+    retry = post_chat(client)
+
+    assert retry.json == first.json
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert post_chat(client, key='k2').json['reply'] == first.json['reply'] + 1
+
+
+def test_reused_key_with_different_body_conflicts(app):
+    client = app.test_client()
+    client.post('/login/1')
+    post_chat(client)
+    assert post_chat(client, message='bye').status_code == 422
+
+
+def test_keys_are_scoped_per_user(app):
+    alice, bob = app.test_client(), app.test_client()
+    alice.post('/login/1')
+    bob.post('/login/2')
+
+    assert post_chat(alice).json['reply'] != post_chat(bob).json['reply']
+
+
+def test_anonymous_sessions_do_not_share_keys(app):
+    first, second = app.test_client(), app.test_client()
+    first.post('/visit')
+    second.post('/visit')
+
+    a = post_chat(first)
+    assert post_chat(second).json['reply'] != a.json['reply']
+    assert post_chat(first).json == a.json
+
+
+def test_callers_without_identity_are_not_deduplicated(app):
+    client = app.test_client()
+    assert post_chat(client).json['reply'] != post_chat(client).json['reply']
+
+
+def test_completed_entries_expire_on_insert(store, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(idempotency.time, 'monotonic', lambda: now[0])
+
+    assert store.begin('chat:user:1:a', 'x') == (PROCEED, None)
+    store.complete('chat:user:1:a', 200, 'application/json', b'{}')
+    assert store.begin('chat:user:1:a', 'x')[0] == REPLAY
+
+    now[0] += store.LOCAL_TTL + 1
+    store.begin('chat:user:1:b', 'y')
+    assert 'chat:user:1:a' not in store._local
+    assert 'chat:user:1:b' in store._local
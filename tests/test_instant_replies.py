@@ -0,0 +1,92 @@
+import pytest
+
+from instant_replies import InstantReplies, normalize
+from openai_brain import NanbanBrain
+
+
+@pytest.fixture(scope='module')
+def brain():
+    return NanbanBrain()
+
+
+@pytest.fixture
+def instant(brain):
+    return InstantReplies(brain, enabled=True)
+
+
+@pytest.mark.parametrize('message, intent', [
+    ('hi', 'greeting'),
+    ('Hiiii!!! 👋', 'greeting'),
+    ('good morning', 'greeting'),
+    ('how are you?', 'how_are_you'),
+    ('thanks a lot', 'thanks'),
+    ('bye bye', 'bye'),
+    ('who are you', 'identity'),
+    # Tamil script
+    ('வணக்கம்', 'greeting'),
+    ('எப்படி இருக்கீங்க?', 'how_are_you'),
+    ('ரொம்ப நன்றி', 'thanks'),
+    ('போயிட்டு வரேன்', 'bye'),
+    ('நீ யாரு', 'identity'),
+    # Tanglish
+    ('vanakkam', 'greeting'),
+    ('epdi irukka', 'how_are_you'),
+    ('romba nandri', 'thanks'),
+    ('apram pesalam', 'bye'),
+    ('nee yaaru', 'identity'),
+])
+def test_triggers_match(instant, message, intent):
+    assert instant.classify(message) == intent
+
+
+@pytest.mark.parametrize('message, intent', [
+    ('hi machi', 'greeting'),
+    ('thanks da', 'thanks'),
+    ('bye nanba', 'bye'),
+    ('நன்றி மச்சி', 'thanks'),
+    ('dei vanakkam bro', 'greeting'),
+    ('thanks so much', 'thanks'),
+])
+def test_filler_words_are_accepted(instant, message, intent):
+    assert instant.classify(message) == intent
+
+
+def test_the_users_name_is_accepted(instant):
+    assert instant.classify('hi Priya', user_name='Priya') == 'greeting'
+    assert instant.classify('thanks Karthik', user_name='Priya') is None
+
+
+@pytest.mark.parametrize('message', [
+    'hi, explain GST',
+    'how are you able to remember things',
+    'thanks, but why is my code failing',
+    'who are you voting for',
+    'vanakkam, CA exam-ku epdi padikkanum',
+    'bye the way, enna plan',
+    'hi hi hi hi hi hi hi',
+    '',
+    '???',
+])
+def test_questions_with_trigger_words_reach_the_model(instant, message):
+    assert instant.classify(message) is None
+
+
+def test_match_builds_a_reply_for_the_slang_and_persona(instant):
+    reply = instant.match('thanks', slang='CHENNAI', persona='AMAITHIYANA')
+    assert reply and 'மச்சி' in reply
+    assert 'Priya' in instant.match('bye', slang='MADURAI', persona='JALIANA', user_name='Priya')
+    assert instant.match('hi, explain GST') is None
+
+
+def test_disabled_by_env(brain, monkeypatch):
+    monkeypatch.setenv('INSTANT_REPLIES', 'off')
+    instant = InstantReplies(brain)
+    assert not instant.enabled
+    assert instant.match('hi') is None
+    # Fallbacks still work
+    assert instant.fallback(kind='chat')
+
+
+def test_normalize():
+    assert normalize('Hellooo, Machiii!!') == ['helo', 'machi']
+    assert normalize('வணக்கம் 🙏') == ['வணக்கம்']
@@ -0,0 +1,37 @@
+import sqlite3
+
+from database import Database
+from memory_index import MemoryIndex
+
+
+def test_relevant_facts_ranks_by_query(db):
+    user_id = db.create_user('Priya', 'CHENNAI', 'JALIANA')
+    index = MemoryIndex(db)
+    index.replace_facts(user_id, 'I love biryani.\nStudying for CA exams.\nMy sister lives in Madurai.')
+
+    assert index.relevant_facts(user_id, 'biryani', k=1) == 'I love biryani.'
+
+
+def test_upgrade_indexes_existing_consented_memory(tmp_path):
+    path = str(tmp_path / 'nanban.db')
+    old = Database(path)
+    user_id = old.create_user('Priya', 'CHENNAI', 'JALIANA')
+    other_id = old.create_user('Karthik', 'MADURAI', 'JALIANA')
+    old.set_memory(user_id, consent=True, facts='I love biryani.\nStudying for CA exams.')
+    old.set_memory(other_id, consent=False, facts='Supports CSK.')
+
+    # A v7 database: facts saved, but nothing ever chunked them
+    conn = sqlite3.connect(path)
+    conn.execute('DELETE FROM memory_chunks')
+    conn.execute('PRAGMA user_version = 7')
+    conn.commit()
+    conn.close()
+
+    upgraded = Database(path)
+    index = MemoryIndex(upgraded)
+    assert index.relevant_facts(user_id, 'biryani saapdalaama?', k=1) == 'I love biryani.'
+    assert upgraded.get_memory_chunks(other_id) == []
+
+    # Already-current databases are left alone
+    again = Database(path)
+    assert len(again.get_memory_chunks(user_id)) == 2
@@ -0,0 +1,77 @@
+import pytest
+
+from model_router import ModelRouter, estimate_cost
+
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.delenv('MODEL_ROUTE_OVERRIDE', raising=False)
+    monkeypatch.setenv('OPENAI_MODEL_FAST', 'fast-model')
+    monkeypatch.setenv('OPENAI_MODEL_STRONG', 'strong-model')
+    monkeypatch.setenv('OPENAI_MODEL_VISION', 'vision-model')
+    return ModelRouter(default_model='standard-model')
+
+
+@pytest.mark.parametrize('message, reply_mode, persona, tier, reason', [
+    ('semma da', 'quick', 'JALIANA', 'fast', 'short_banter'),
+    ('', 'quick', 'JALIANA', 'fast', 'short_banter'),
+    ('x' * 40, 'quick', 'JALIANA', 'fast', 'short_banter'),
+    ('x' * 41, 'quick', 'JALIANA', 'standard', 'default'),
+    ('lunch enna?', 'quick', 'JALIANA', 'standard', 'default'),
+    ('நீ யார்', 'quick', 'JALIANA', 'standard', 'default'),
+    ('why?', 'quick', 'JALIANA', 'standard', 'default'),
+    ('please explain ' + 'x' * 66, 'quick', 'JALIANA', 'strong', 'long_explanation'),
+    ('please explain ' + 'x' * 65, 'quick', 'JALIANA', 'standard', 'default'),
+    ('ஏன் இப்படி ஆச்சு ' + 'x' * 70, 'quick', 'JALIANA', 'strong', 'long_explanation'),
+    ('why', 'detailed', 'JALIANA', 'strong', 'detailed'),
+    ('x' * 26, 'detailed', 'JALIANA', 'strong', 'detailed'),
+    ('x' * 25, 'detailed', 'JALIANA', 'fast', 'short_banter'),
+    ('CA exam-ku epdi padikkanum', 'quick', 'VILAKKAMAANA', 'strong', 'detailed'),
+    ('semma', 'quick', 'VILAKKAMAANA', 'fast', 'short_banter'),
+])
+def test_text_routing(router, message, reply_mode, persona, tier, reason):
+    decision = router.route(message, reply_mode=reply_mode, persona=persona)
+    assert (decision.tier, decision.reason) == (tier, reason)
+    assert decision.model == {
+        'fast': 'fast-model', 'standard': 'standard-model', 'strong': 'strong-model'
+    }[tier]
+
+
+@pytest.mark.parametrize('override, tier', [
+    ('fast', 'fast'),
+    ('STRONG', 'strong'),
+    (' standard ', 'standard'),
+    ('off', 'standard'),
+])
+def test_override_pins_every_text_message(monkeypatch, override, tier):
+    monkeypatch.setenv('MODEL_ROUTE_OVERRIDE', override)
+    router = ModelRouter()
+    for message, reply_mode in (('hi', 'quick'), ('explain ' + 'x' * 100, 'detailed')):
+        decision = router.route(message, reply_mode=reply_mode)
+        assert (decision.tier, decision.reason) == (tier, 'override')
+
+
+def test_unknown_override_is_ignored(monkeypatch):
+    monkeypatch.setenv('MODEL_ROUTE_OVERRIDE', 'turbo')
+    assert ModelRouter().route('semma').reason == 'short_banter'
+
+
+def test_images_go_to_vision_even_with_an_override(router, monkeypatch):
+    decision = router.route('idhu enna?', has_image=True)
+    assert (decision.tier, decision.model, decision.max_tokens) == ('vision', 'vision-model', 300)
+
+    monkeypatch.setattr(router, 'override', 'fast')
+    assert router.route('', has_image=True).tier == 'vision'
+
+
+def test_over_budget_users_get_the_fast_tier(router):
+    decision = router.route('explain ' + 'x' * 100, reply_mode='detailed', budget='soft')
+    assert (decision.tier, decision.reason) == ('fast', 'budget')
+
+    decision = router.route('idhu enna?', has_image=True, budget='soft')
+    assert (decision.tier, decision.max_tokens, decision.reason) == ('vision', 150, 'budget')
+
+
+def test_estimate_cost():
+    assert estimate_cost('gpt-4o-mini', 1_000_000, 1_000_000) == pytest.approx(0.75)
+    assert estimate_cost('unknown', 1000, 1000) == 0
@@ -0,0 +1,105 @@
+import pytest
+
+import circuit_breaker
+import openai_brain
+from circuit_breaker import CLOSED, HALF_OPEN, CircuitBreaker
+from completion_backends import Completion, Usage
+from openai_brain import NanbanBrain
+
+
+class FlakyBackend:
+    name = 'flaky'
+    remote = True
+    model = None
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def complete(self, messages, model, max_tokens, context, **options):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return Completion('சரி நண்பா', Usage(10, 5))
+
+    def reset(self):
+        pass
+
+
+@pytest.fixture
+def brain(monkeypatch):
+    monkeypatch.setenv('COMPLETION_BACKEND', 'template')
+    monkeypatch.setenv('COMPLETION_FAILOVER', 'off')
+    brain = NanbanBrain()
+    brain.breaker = CircuitBreaker('flaky', failure_threshold=10, reset_timeout=30)
+    return brain
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    calls = []
+    monkeypatch.setattr(openai_brain.time, 'sleep', calls.append)
+    return calls
+
+
+def complete(brain):
+    route = brain.router.route('exam-க்கு எப்படி prepare பண்றது?')
+    return brain._complete('openai', route, [{'role': 'user', 'content': 'hi'}], {})
+
+
+def test_retries_transient_errors(brain, sleeps):
+    brain.backend = FlakyBackend([RuntimeError('502'), RuntimeError('502')])
+    assert complete(brain).text == 'சரி நண்பா'
+    assert brain.backend.calls == 3
+    assert sleeps == [1.5, 3.0]
+
+
+def test_no_backoff_after_the_last_attempt(brain, sleeps):
+    brain.backend = FlakyBackend([RuntimeError('502')] * 3)
+    with pytest.raises(RuntimeError):
+        complete(brain)
+    assert brain.backend.calls == 3
+    assert sleeps == [1.5, 3.0]
+
+
+def test_configuration_errors_fail_fast(brain, sleeps):
+    brain.backend = FlakyBackend([ValueError('OPENAI_API_KEY not found')])
+    with pytest.raises(ValueError):
+        complete(brain)
+    assert brain.backend.calls == 1
+    assert sleeps == []
+    assert brain.breaker.allow()
+
+
+def test_configuration_error_frees_the_half_open_trial(brain, sleeps, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker.time, 'monotonic', lambda: now[0])
+    brain.breaker = CircuitBreaker('flaky', failure_threshold=1, reset_timeout=30)
+    brain.breaker.record_failure()
+    brain.failover = FlakyBackend([])
+    now[0] += 31
+
+    # The half-open trial hits a configuration error
+    brain.backend = FlakyBackend([ValueError('OPENAI_API_KEY not found')])
+    with pytest.raises(ValueError):
+        complete(brain)
+    assert brain.breaker.state == HALF_OPEN
+    assert not brain.breaker.is_open
+
+    # The next call is the trial again and reaches the primary
+    completion = complete(brain)
+    assert not completion.fallback
+    assert brain.backend.calls == 2
+    assert brain.failover.calls == 0
+    assert brain.breaker.state == CLOSED
+
+
+def test_open_circuit_fails_over(brain, sleeps):
+    brain.breaker = CircuitBreaker('flaky', failure_threshold=2, reset_timeout=30)
+    brain.backend = FlakyBackend([RuntimeError('502')] * 3)
+    brain.failover = FlakyBackend([])
+
+    completion = complete(brain)
+    assert completion.fallback
+    assert brain.backend.calls == 2
+    assert sleeps == [1.5]
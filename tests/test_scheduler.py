@@ -0,0 +1,114 @@
+import time
+from datetime import datetime, timezone
+
+from scheduler import Cron, Scheduler
+
+LEASE = Scheduler.LEASE_SECONDS
+
+
+def held(db, owner, now):
+    return db.acquire_scheduler_lease(owner, now, LEASE)[0]
+
+
+def test_lease_is_exclusive_until_it_expires(db):
+    assert db.acquire_scheduler_lease('a', 1000, LEASE) == (True, None)
+    assert not held(db, 'b', 1000 + LEASE - 1)
+    # The holder renews
+    assert db.acquire_scheduler_lease('a', 1000 + LEASE - 1, LEASE) == (True, None)
+    assert not held(db, 'b', 1000 + LEASE)
+
+    # Not renewed: another worker takes over, and learns whose lease lapsed
+    assert db.acquire_scheduler_lease('b', 1000 + 2 * LEASE, LEASE) == (True, 'a')
+    assert not held(db, 'a', 1000 + 2 * LEASE)
+
+
+def test_released_lease_is_free_at_once(db):
+    assert held(db, 'a', 1000)
+    db.release_scheduler_lease('b')
+    assert not held(db, 'b', 1001)
+    db.release_scheduler_lease('a')
+    assert db.acquire_scheduler_lease('b', 1001, LEASE) == (True, None)
+
+
+class InlinePool:
+    """Runs submitted jobs right away so tick() can be checked synchronously"""
+
+    def submit(self, fn, *args):
+        fn(*args)
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def scheduler(db, runs):
+    s = Scheduler(db, enabled=False)
+    s._pool = InlinePool()
+    s.add('purge', lambda: runs.append(s.owner) or 'done', every=120)
+    return s
+
+
+def test_only_the_leader_runs_jobs_and_a_new_leader_resumes(db):
+    runs = []
+    first, second = scheduler(db, runs), scheduler(db, runs)
+    # Job runs are stamped with the wall clock, so ticks use it too
+    now = time.time()
+
+    first.tick(now)
+    second.tick(now)
+    assert runs == [first.owner]
+    assert first.is_leader and not second.is_leader
+
+    first.tick(now + 30)
+    assert len(runs) == 1
+
+    # first stops renewing; once its lease lapses second takes over and,
+    # from the job history, knows purge is next due two minutes after it last ran
+    second.tick(now + 30 + LEASE + 1)
+    assert second.is_leader
+    assert len(runs) == 1
+    assert abs(second.jobs['purge'].next_run - (now + 120)) < 5
+    second.tick(now + 125)
+    assert runs == [first.owner, second.owner]
+    assert [run['status'] for run in db.get_job_runs(limit=10)] == ['ok', 'ok']
+
+
+def test_new_leader_only_abandons_the_lapsed_leaders_runs(db):
+    runs = []
+    first, second = scheduler(db, runs), scheduler(db, runs)
+    now = time.time()
+    first.tick(now)
+
+    lapsed = db.start_job_run('purge', first.owner, now)
+    # A manual run in a third, still-live worker
+    manual = db.start_job_run('purge', 'worker-3', now)
+
+    second.tick(now + LEASE + 1)
+    assert second.is_leader
+    statuses = {run['id']: run['status'] for run in db.get_job_runs(limit=10)}
+    assert statuses[lapsed] == 'abandoned'
+    assert statuses[manual] == 'running'
+
+
+def test_cron_next_after():
+    cron = Cron('30 3 * * *')
+    assert cron.next_after(datetime(2024, 5, 1, 3, 30, tzinfo=timezone.utc)) == datetime(
+        2024, 5, 2, 3, 30, tzinfo=timezone.utc
+    )
+    assert cron.next_after(datetime(2024, 5, 1, 1, 0, tzinfo=timezone.utc)) == datetime(
+        2024, 5, 1, 3, 30, tzinfo=timezone.utc
+    )
+
+
+def test_conversation_retention_keeps_message_totals_in_step(db):
+    priya, karthik = db.create_user('Priya'), db.create_user('Karthik')
+    for user_id in (priya, priya, priya, karthik):
+        db.save_message(user_id, 'user', 'vanakkam')
+    db.save_message(priya, 'user', 'innaikku')
+    conn = db.get_connection()
+    conn.execute("UPDATE conversations SET timestamp = datetime('now', '-40 days') WHERE content = 'vanakkam'")
+    conn.commit()
+    conn.close()
+
+    assert db.purge_conversations(30, batch_size=2) == 4
+    assert db.get_user_stats(priya)['total_messages'] == 1
+    assert db.get_user_stats(karthik)['total_messages'] == 0
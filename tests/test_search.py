@@ -0,0 +1,115 @@
+import json
+
+import pytest
+
+from data_transfer import import_lines
+
+
+def contents(results):
+    return [row['content'] for row in results]
+
+
+def fts_check(db):
+    """Raise unless conversations_fts matches the conversations table exactly"""
+    conn = db.get_connection()
+    conn.execute("INSERT INTO conversations_fts (conversations_fts) VALUES ('integrity-check')")
+    conn.close()
+
+
+def fts_count(db, user_id, term):
+    conn = db.get_connection()
+    count = conn.execute(
+        'SELECT COUNT(*) FROM conversations_fts WHERE conversations_fts MATCH ?',
+        (f'user_id : "{user_id}" AND content : "{term}"*',)
+    ).fetchone()[0]
+    conn.close()
+    return count
+
+
+@pytest.fixture
+def fts_db(db):
+    db.ping()
+    if not db.fts_enabled:
+        pytest.skip('SQLite built without FTS5')
+    return db
+
+
+def test_tamil_words_stay_whole_tokens(fts_db):
+    user_id = fts_db.create_user('Priya')
+    fts_db.save_message(user_id, 'user', 'நேத்து பிரியாணிக்கு போனோம்')
+
+    conn = fts_db.get_connection()
+    conn.execute("CREATE VIRTUAL TABLE temp.vocab USING fts5vocab(main, 'conversations_fts', 'row')")
+    terms = {row[0] for row in conn.execute('SELECT term FROM temp.vocab')}
+    conn.close()
+    assert {'நேத்து', 'பிரியாணிக்கு', 'போனோம்'} <= terms
+
+
+def test_prefix_matches_tamil_suffixes(fts_db):
+    user_id = fts_db.create_user('Priya')
+    for content in ('பிரியாணிக்கு போலாமா', 'பிரியா நல்லா இருக்கா', 'exam-ku padikkanum', 'CA exam result வந்துச்சு'):
+        fts_db.save_message(user_id, 'user', content)
+
+    assert contents(fts_db.search_messages(user_id, 'பிரியாணி')) == ['பிரியாணிக்கு போலாமா']
+    assert sorted(contents(fts_db.search_messages(user_id, 'பிரியா'))) == ['பிரியா நல்லா இருக்கா', 'பிரியாணிக்கு போலாமா']
+    assert contents(fts_db.search_messages(user_id, 'exam result')) == ['CA exam result வந்துச்சு']
+    assert len(fts_db.search_messages(user_id, 'exam result', match_any=True)) == 2
+
+
+def test_search_is_scoped_to_the_user(fts_db):
+    priya, karthik = fts_db.create_user('Priya'), fts_db.create_user('Karthik')
+    fts_db.save_message(priya, 'user', 'biryani venum')
+    fts_db.save_message(karthik, 'user', 'biryani saapten')
+
+    assert contents(fts_db.search_messages(karthik, 'biryani')) == ['biryani saapten']
+    assert fts_db.search_messages(None, 'biryani') == []
+    # Single-character and punctuation-only terms are dropped
+    assert fts_db.search_messages(priya, 'a ?!') == []
+
+
+def test_like_fallback(db):
+    db.ping()
+    db.fts_enabled = False
+    user_id = db.create_user('Priya')
+    for content in ('பிரியாணிக்கு போலாமா', 'CA exam result வந்துச்சு', 'exam-ku padikkanum'):
+        db.save_message(user_id, 'user', content)
+
+    assert contents(db.search_messages(user_id, 'பிரியாணி')) == ['பிரியாணிக்கு போலாமா']
+    assert contents(db.search_messages(user_id, 'exam result')) == ['CA exam result வந்துச்சு']
+    assert contents(db.search_messages(user_id, 'exam result', match_any=True)) == [
+        'exam-ku padikkanum', 'CA exam result வந்துச்சு'
+    ]
+
+
+def test_triggers_keep_the_index_in_sync(fts_db):
+    user_id = fts_db.create_user('Priya')
+    fts_db.save_message(user_id, 'user', 'மழை வருது')
+    fts_db.save_message(user_id, 'assistant', 'குடை எடுத்துக்கோ')
+    fts_check(fts_db)
+    assert fts_count(fts_db, user_id, 'மழை') == 1
+
+    conn = fts_db.get_connection()
+    conn.execute("UPDATE conversations SET content = 'வெயில் அடிக்குது' WHERE content = 'மழை வருது'")
+    conn.commit()
+    conn.close()
+    fts_check(fts_db)
+    assert fts_count(fts_db, user_id, 'மழை') == 0
+    assert fts_count(fts_db, user_id, 'வெயில்') == 1
+
+    fts_db.clear_conversation_history(user_id)
+    fts_check(fts_db)
+    assert fts_count(fts_db, user_id, 'வெயில்') == 0
+    assert fts_db.search_messages(user_id, 'குடை') == []
+
+
+def test_imported_messages_are_searchable(fts_db):
+    user_id = fts_db.create_user('Priya')
+    lines = [
+        json.dumps({'type': 'message', 'user_id': 9, 'role': 'user', 'content': f'கிரிக்கெட் match {i}'},
+                   ensure_ascii=False)
+        for i in range(5)
+    ]
+    import_lines(fts_db, lines, target_user_id=user_id, batch_size=2)
+
+    fts_check(fts_db)
+    assert len(fts_db.search_messages(user_id, 'கிரிக்கெட்', limit=10)) == 5
@@ -0,0 +1,146 @@
+import pytest
+from flask import Flask, jsonify, session
+
+from session_store import ServerSessionInterface
+
+
+@pytest.fixture
+def app(db):
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.session_interface = ServerSessionInterface(db)
+
+    @app.post('/set/<key>/<value>')
+    def set_value(key, value):
+        session[key] = value
+        return jsonify(ok=True)
+
+    @app.get('/get/<key>')
+    def get_value(key):
+        return jsonify(value=session.get(key))
+
+    @app.get('/ping')
+    def ping():
+        return jsonify(ok=True)
+
+    return app
+
+
+def sid_of(client):
+    cookie = client.get_cookie('session')
+    return cookie.value.split('.')[0] if cookie else None
+
+
+def test_round_trip_and_version_bump(app):
+    client = app.test_client()
+    client.post('/set/slang/CHENNAI')
+    first = client.get_cookie('session').value
+    assert client.get('/get/slang').json['value'] == 'CHENNAI'
+
+    client.post('/set/slang/MADURAI')
+    second = client.get_cookie('session').value
+    assert second.split('.')[0] == first.split('.')[0]
+    assert int(second.split('.')[1]) == int(first.split('.')[1]) + 1
+    assert client.get('/get/slang').json['value'] == 'MADURAI'
+
+
+def test_untouched_session_writes_nothing(app, db):
+    client = app.test_client()
+    response = client.get('/ping')
+    assert 'Set-Cookie' not in response.headers
+    assert 'Cookie' not in response.vary
+
+
+def test_unknown_sid_is_not_adopted(app, db):
+    planted = 'a' * 32
+    client = app.test_client()
+    client.set_cookie('session', f'{planted}.1')
+
+    assert client.get('/get/slang').json['value'] is None
+    client.post('/set/slang/CHENNAI')
+
+    assert sid_of(client) != planted
+    assert db.get_session(planted) is None
+
+
+def test_setting_user_id_rotates_sid(app, db):
+    client = app.test_client()
+    client.post('/set/slang/CHENNAI')
+    before = sid_of(client)
+
+    client.post('/set/user_id/42')
+    after = sid_of(client)
+
+    assert after != before
+    assert db.get_session(before) is None
+    assert client.get('/get/slang').json['value'] == 'CHENNAI'
+
+    # Re-setting the same user id is not a login
+    client.post('/set/user_id/42')
+    assert sid_of(client) == after
+
+
+def backdate(db, sid, days):
+    conn = db.get_connection()
+    conn.execute(
+        "UPDATE sessions SET updated_at = datetime('now', ?), last_seen = datetime('now', ?) WHERE sid = ?",
+        (f'-{days} days', f'-{days} days', sid)
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_reads_keep_an_unchanged_session_alive(app, db):
+    interface = app.session_interface
+    client = app.test_client()
+    client.post('/set/user_id/42')
+    sid = sid_of(client)
+    idle = app.test_client()
+    idle.post('/set/user_id/7')
+    idle_sid = sid_of(idle)
+
+    backdate(db, sid, 100)
+    backdate(db, idle_sid, 100)
+    interface._cache.clear()
+    # Re-setting the same value writes nothing, but the read counts as a visit
+    client.post('/set/user_id/42')
+    assert interface.purge() == 1
+    assert db.get_session(sid) is not None
+    assert db.get_session(idle_sid) is None
+
+
+def test_reads_touch_at_most_once_a_day(app, db, monkeypatch):
+    client = app.test_client()
+    client.post('/set/slang/CHENNAI')
+    touches = []
+    touch = db.touch_session
+    monkeypatch.setattr(db, 'touch_session', lambda sid: touches.append(sid) or touch(sid))
+
+    for _ in range(3):
+        client.get('/get/slang')
+    assert touches == []
+
+    backdate(db, sid_of(client), 2)
+    app.session_interface._cache.clear()
+    for _ in range(3):
+        client.get('/get/slang')
+    assert touches == [sid_of(client)]
+
+
+def test_upgrade_adds_last_seen(tmp_path):
+    import sqlite3
+
+    from database import Database
+
+    path = str(tmp_path / 'nanban.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE sessions (sid TEXT PRIMARY KEY, data TEXT, version INTEGER DEFAULT 1, '
+                 'updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
+    conn.execute("INSERT INTO sessions (sid, data, updated_at) VALUES ('abc', '{}', datetime('now', '-100 days'))")
+    conn.execute('PRAGMA user_version = 8')
+    conn.commit()
+    conn.close()
+
+    db = Database(path)
+    assert db.get_session('abc')[2] is not None
+    assert db.purge_sessions(90) == 1
@@ -0,0 +1,111 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from prometheus_client import REGISTRY
+
+from singleflight import SingleFlight, request_key
+
+
+def coalesced(service):
+    return REGISTRY.get_sample_value('nanban_coalesced_calls_total', {'service': service}) or 0
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+
+def run_concurrently(flight, service, leader_fn, waiters):
+    """Start leader_fn for a key, then `waiters` identical calls once it is in flight"""
+    key = request_key('chat', service)
+    calls = []
+
+    def other():
+        calls.append('waiter')
+        return 'own result'
+
+    pool = ThreadPoolExecutor(max_workers=waiters + 1)
+    leader = pool.submit(flight.do, key, leader_fn)
+    wait_for(lambda: key in flight._calls)
+    before = coalesced(service)
+    joined = [pool.submit(flight.do, key, other) for _ in range(waiters)]
+    wait_for(lambda: coalesced(service) - before == waiters)
+    return key, leader, joined, calls, pool
+
+
+def test_waiters_share_the_leaders_result():
+    flight = SingleFlight('test-share', timeout=5)
+    release = threading.Event()
+    runs = []
+
+    def fn():
+        runs.append(1)
+        release.wait(5)
+        return {'text': 'வணக்கம்'}
+
+    key, leader, joined, calls, pool = run_concurrently(flight, 'test-share', fn, waiters=4)
+    release.set()
+
+    assert leader.result(5) == {'text': 'வணக்கம்'}
+    assert [f.result(5) for f in joined] == [{'text': 'வணக்கம்'}] * 4
+    assert runs == [1] and calls == []
+    assert key not in flight._calls
+    pool.shutdown()
+
+
+def test_the_leaders_exception_reaches_every_waiter():
+    flight = SingleFlight('test-error', timeout=5)
+    release = threading.Event()
+
+    def fn():
+        release.wait(5)
+        raise ConnectionError('upstream down')
+
+    key, leader, joined, calls, pool = run_concurrently(flight, 'test-error', fn, waiters=3)
+    release.set()
+
+    for future in [leader] + joined:
+        with pytest.raises(ConnectionError, match='upstream down'):
+            future.result(5)
+    assert calls == []
+    assert key not in flight._calls
+    pool.shutdown()
+
+
+def test_waiter_times_out_but_the_leader_finishes():
+    flight = SingleFlight('test-timeout', timeout=0.05)
+    release = threading.Event()
+
+    def fn():
+        release.wait(5)
+        return 'late'
+
+    key, leader, joined, calls, pool = run_concurrently(flight, 'test-timeout', fn, waiters=1)
+    with pytest.raises(TimeoutError):
+        joined[0].result(5)
+
+    release.set()
+    assert leader.result(5) == 'late'
+    assert key not in flight._calls
+    pool.shutdown()
+
+
+def test_key_is_cleared_so_the_next_call_runs_again():
+    flight = SingleFlight('test-clear')
+    key = request_key('tts', 'வணக்கம்', 'ta-IN')
+    results = iter(['first', 'second'])
+
+    assert flight.do(key, lambda: next(results)) == 'first'
+    assert flight.do(key, lambda: next(results)) == 'second'
+    with pytest.raises(ValueError):
+        flight.do(key, lambda: int('x'))
+    assert flight._calls == {}
+
+
+def test_request_key_is_order_independent_for_dicts():
+    assert request_key({'a': 1, 'b': 2}) == request_key({'b': 2, 'a': 1})
+    assert request_key('chat', 'hi') != request_key('chat', 'hello')
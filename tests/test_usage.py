@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import usage as usage_module
+from usage import UsageTracker
+
+
+def turn(prompt_tokens, completion_tokens, model='gpt-4o-mini', tier='standard'):
+    return {
+        'model': model, 'tier': tier, 'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens, 'latency_ms': 100, 'retries': 0,
+    }
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Pin usage.datetime.now to a settable UTC instant"""
+    state = {'now': datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)}
+
+    class FixedDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return state['now'].astimezone(tz) if tz else state['now'].replace(tzinfo=None)
+
+    monkeypatch.setattr(usage_module, 'datetime', FixedDatetime)
+    return state
+
+
+@pytest.mark.parametrize('spent, level', [
+    (0, None),
+    (799, None),
+    (800, 'soft'),
+    (999, 'soft'),
+    (1000, 'hard'),
+    (5000, 'hard'),
+])
+def test_budget_thresholds(db, clock, spent, level):
+    tracker = UsageTracker(db, daily_budget=1000, soft_ratio=0.8)
+    user_id = db.create_user('Priya')
+    if spent:
+        tracker.record(user_id, 'CHENNAI', 'JALIANA', turn(spent - spent // 4, spent // 4))
+    assert tracker.budget_level(user_id) == level
+
+
+def test_budgets_disabled_or_without_a_user(db, clock):
+    user_id = db.create_user('Priya')
+    tracker = UsageTracker(db, daily_budget=0)
+    tracker.record(user_id, 'CHENNAI', 'JALIANA', turn(10000, 10000))
+    assert tracker.budget_level(user_id) is None
+    assert UsageTracker(db, daily_budget=10).budget_level(None) is None
+
+
+def test_budget_resets_at_utc_midnight(db, clock):
+    tracker = UsageTracker(db, daily_budget=1000, soft_ratio=0.8)
+    user_id = db.create_user('Priya')
+
+    # 23:30 UTC is already the next morning in Chennai, but still the same accounting day
+    clock['now'] = datetime(2024, 5, 1, 23, 30, tzinfo=timezone.utc)
+    tracker.record(user_id, 'CHENNAI', 'JALIANA', turn(900, 200))
+    assert usage_module.today() == '2024-05-01'
+    assert tracker.budget_level(user_id) == 'hard'
+
+    clock['now'] += timedelta(minutes=31)
+    assert usage_module.today() == '2024-05-02'
+    assert tracker.budget_level(user_id) is None
+    tracker.record(user_id, 'CHENNAI', 'JALIANA', turn(700, 150))
+    assert tracker.budget_level(user_id) == 'soft'
+
+
+def test_other_users_spend_does_not_count(db, clock):
+    tracker = UsageTracker(db, daily_budget=1000)
+    priya, karthik = db.create_user('Priya'), db.create_user('Karthik')
+    tracker.record(priya, 'CHENNAI', 'JALIANA', turn(2000, 0))
+    assert tracker.budget_level(priya) == 'hard'
+    assert tracker.budget_level(karthik) is None
+
+
+def test_daily_rollup_matches_the_turns(db, clock):
+    tracker = UsageTracker(db)
+    user_id = db.create_user('Priya')
+    turns = [
+        (user_id, 'CHENNAI', 'JALIANA', turn(100, 20)),
+        (user_id, 'CHENNAI', 'JALIANA', turn(300, 80)),
+        (user_id, 'CHENNAI', 'JALIANA', turn(50, 10, model='gpt-4o', tier='strong')),
+        (user_id, 'MADURAI', 'AMAITHIYANA', turn(70, 30)),
+        (None, 'COMMON', 'JALIANA', turn(40, 5)),
+    ]
+    for args in turns:
+        tracker.record(*args)
+    clock['now'] += timedelta(days=1)
+    tracker.record(user_id, 'CHENNAI', 'JALIANA', turn(10, 1))
+
+    conn = db.get_connection()
+    from_turns = [tuple(row) for row in conn.execute('''
+        SELECT day, user_id, slang, persona, model, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens),
+            SUM(latency_ms), SUM(retries), ROUND(SUM(cost_usd), 9)
+        FROM usage_turns GROUP BY day, user_id, slang, persona, model ORDER BY 1, 2, 3, 4, 5
+    ''')]
+    from_daily = [tuple(row) for row in conn.execute('''
+        SELECT day, user_id, slang, persona, model, turns, prompt_tokens, completion_tokens,
+            latency_ms, retries, ROUND(cost_usd, 9)
+        FROM usage_daily ORDER BY 1, 2, 3, 4, 5
+    ''')]
+    conn.close()
+
+    assert from_daily == from_turns
+    assert len(from_daily) == 5
+    # Anonymous turns are recorded under user 0
+    assert ('2024-05-01', 0) in {row[:2] for row in from_daily}
+    assert db.get_daily_tokens(user_id, '2024-05-01') == 100 + 20 + 300 + 80 + 50 + 10 + 70 + 30
+
+
+def test_purging_turns_keeps_the_rollups(db, clock):
+    tracker = UsageTracker(db, retention_days=90)
+    user_id = db.create_user('Priya')
+    tracker.record(user_id, 'CHENNAI', 'JALIANA', turn(100, 20))
+    clock['now'] += timedelta(days=91)
+
+    assert tracker.purge_turns() == 1
+    assert db.get_daily_tokens(user_id, '2024-05-01') == 120
+    assert tracker.report(days=365)['top_users'][0]['prompt_tokens'] == 100
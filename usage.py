@@ -0,0 +1,97 @@
+"""
+NANBAN AI - Usage Accounting
+Per-turn LLM token/latency capture, daily rollups and per-user budgets
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+
+from model_router import estimate_cost
+from observability import BUDGET_DEGRADED, get_logger
+
+logger = get_logger('usage')
+
+
+def today():
+    """Accounting day (UTC), as stored in usage tables"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+
+class UsageTracker:
+    """
+    Records each upstream LLM call and decides how far a user's turns should
+    be degraded:
+
+        None    under budget, normal routing
+        'soft'  past USER_BUDGET_SOFT_RATIO of the daily budget: fast tier,
+                cheaper model and shorter max_tokens
+        'hard'  past the daily budget: local replies only until tomorrow (UTC)
+
+    USER_DAILY_TOKEN_BUDGET=0 disables budgets (usage is still recorded).
+    """
+
+    def __init__(self, db, daily_budget=None, soft_ratio=None, retention_days=None):
+        self.db = db
+        # Per-turn rows are kept this long; the daily rollups are kept forever
+        self.retention_days = int(
+            os.environ.get('USAGE_RETENTION_DAYS', 90) if retention_days is None else retention_days
+        )
+        self.daily_budget = int(
+            os.environ.get('USER_DAILY_TOKEN_BUDGET', 50000) if daily_budget is None else daily_budget
+        )
+        self.soft_ratio = float(
+            os.environ.get('USER_BUDGET_SOFT_RATIO', 0.8) if soft_ratio is None else soft_ratio
+        )
+
+    def record(self, user_id, slang, persona, usage):
+        """Store one call's usage (the dict passed to NanbanBrain's on_usage)"""
+        self.db.record_usage(
+            today(), user_id or 0, slang, persona, usage['model'], usage['tier'],
+            usage['prompt_tokens'], usage['completion_tokens'], usage['latency_ms'], usage['retries'],
+            estimate_cost(usage['model'], usage['prompt_tokens'], usage['completion_tokens'])
+        )
+
+    def recorder(self, user_id, slang, persona):
+        """on_usage callback bound to one turn's context"""
+        return lambda usage: self.record(user_id, slang, persona, usage)
+
+    def budget_level(self, user_id):
+        """None, 'soft' or 'hard' for a user's spend so far today"""
+        if not self.daily_budget or not user_id:
+            return None
+        spent = self.db.get_daily_tokens(user_id, today())
+        if spent >= self.daily_budget:
+            level = 'hard'
+        elif spent >= self.daily_budget * self.soft_ratio:
+            level = 'soft'
+        else:
+            return None
+        BUDGET_DEGRADED.labels(level=level).inc()
+        return level
+
+    def purge_turns(self):
+        """Drop per-turn usage rows past the retention window (run by the scheduler)"""
+        before = (datetime.now(timezone.utc) - timedelta(days=self.retention_days)).strftime('%Y-%m-%d')
+        return self.db.purge_usage_turns(before)
+
+    def report(self, days=7, top=20):
+        """Usage totals from the daily rollups for the admin endpoint"""
+        since = (datetime.now(timezone.utc) - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+
+        def summarize(rows):
+            for row in rows:
+                turns = row['turns'] or 0
+                row['avg_latency_ms'] = round(row.pop('latency_ms') / turns, 1) if turns else 0
+                row['cost_usd'] = round(row['cost_usd'] or 0, 6)
+            return rows
+
+        by_user = summarize(self.db.get_usage_rollup(since, ('user_id',)))
+        by_user.sort(key=lambda row: row['prompt_tokens'] + row['completion_tokens'], reverse=True)
+        return {
+            'since': since,
+            'daily_budget': self.daily_budget,
+            'by_day': sorted(summarize(self.db.get_usage_rollup(since, ('day',))), key=lambda r: r['day']),
+            'by_model': summarize(self.db.get_usage_rollup(since, ('model',))),
+            'by_slang_persona': summarize(self.db.get_usage_rollup(since, ('slang', 'persona'))),
+            'top_users': by_user[:top],
+        }
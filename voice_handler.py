@@ -4,142 +4,208 @@ Google Cloud Text-to-Speech Integration with Tamil voices
 """
 
 import os
-from google.cloud import texttospeech
+import threading
 import hashlib
 import base64
+from observability import TTS_CACHE, UPSTREAM_ERRORS, get_logger, timed
+from personality import PERSONA_VOICE, VOICE_CONFIG
+from singleflight import SingleFlight, request_key
+
+logger = get_logger('voice')
+
+# Emojis dropped before synthesis
+TTS_STRIP_EMOJIS = ('😄', '🔥', '😊', '😅', '🎉', '👏', '💪', '🚀', '⭐', '✨', '💯', '😂', '🤣', '😍', '🥰', '😎')
 
 class VoiceHandler:
-    def __init__(self):
-        # Initialize Google Cloud TTS client
-        try:
-            self.client = texttospeech.TextToSpeechClient()
-            self.enabled = True
-        except Exception as e:
-            print(f"Warning: Google Cloud TTS not configured: {e}")
-            print("Voice features will be disabled. To enable:")
-            print("1. Set up Google Cloud account")
-            print("2. Enable Text-to-Speech API")
-            print("3. Set GOOGLE_APPLICATION_CREDENTIALS environment variable")
-            self.enabled = False
-        
-        # Voice mapping for different slangs
-        self.voice_config = {
-            'CHENNAI': {
-                'name': 'ta-IN-Wavenet-A',  # Male, energetic
-                'speaking_rate': 1.15,  # Faster (Chennai is fast-paced)
-                'pitch': 1.0
-            },
-            'KOVAI': {
-                'name': 'ta-IN-Wavenet-B',  # Male, softer
-                'speaking_rate': 0.92,  # Slower (Kovai is calm)
-                'pitch': 0.0
-            },
-            'MADURAI': {
-                'name': 'ta-IN-Wavenet-A',  # Male, authoritative
-                'speaking_rate': 1.0,  # Normal speed
-                'pitch': -2.0  # Lower pitch (authority)
-            },
-            'NELLAI': {
-                'name': 'ta-IN-Wavenet-A',  # Male, energetic
-                'speaking_rate': 1.1,  # Slightly fast
-                'pitch': 2.0  # Higher pitch (lively)
-            },
-            'EELAM': {
-                'name': 'ta-IN-Wavenet-B',  # Male, gentle
-                'speaking_rate': 0.95,  # Slightly slow
-                'pitch': 0.0  # Normal pitch
-            },
-            'COMMON': {
-                'name': 'ta-IN-Wavenet-A',  # Male, neutral
-                'speaking_rate': 1.0,  # Normal
-                'pitch': 0.0  # Normal
-            }
-        }
-        
-        # Persona modifiers
-        self.persona_modifiers = {
-            'JALIANA': {
-                'pitch_adjust': 1.0,  # Slightly higher (energetic)
-                'rate_adjust': 1.05  # Slightly faster
-            },
-            'AMAITHIYANA': {
-                'pitch_adjust': -0.5,  # Slightly lower (calm)
-                'rate_adjust': 0.92  # Slower (peaceful)
-            },
-            'THELIVANA': {
-                'pitch_adjust': 0.0,  # Normal
-                'rate_adjust': 1.0  # Normal (professional)
-            },
-            'VILAKKAMAANA': {
-                'pitch_adjust': -1.0,  # Lower (teacher-like)
-                'rate_adjust': 0.95  # Slightly slower (explanatory)
-            }
-        }
+    # Replies up to this long are looked up in the shared phrase cache
+    CACHE_MAX_CHARS = 200
+    
+    def __init__(self, cache=None):
+        # The Google Cloud TTS client (and its SDK import) is created on first use:
+        # credential discovery alone costs seconds of cold start
+        self._client = None
+        self._enabled = None
+        self._client_lock = threading.Lock()
+        # Coalesces concurrent synthesis of the same text with the same voice
+        self.flights = SingleFlight('google_tts')
+        # Database whose tts_cache holds audio for common phrases (filled by warm())
+        self.cache = cache
+        
+        # Shared, immutable voice tables (see personality.py)
+        self.voice_config = VOICE_CONFIG
+        self.persona_modifiers = PERSONA_VOICE
+    
+    @property
+    def enabled(self):
+        """Whether TTS is configured (initializes the client on first access)"""
+        if self._enabled is None:
+            self._init_client()
+        return self._enabled
+    
+    @property
+    def client(self):
+        if self._enabled is None:
+            self._init_client()
+        return self._client
+    
+    def _init_client(self):
+        with self._client_lock:
+            if self._enabled is not None:
+                return
+            try:
+                self._client = self._create_client()
+                self._enabled = True
+            except Exception as e:
+                logger.warning(
+                    'Google Cloud TTS not configured, voice features disabled. To enable: '
+                    'set up a Google Cloud account, enable the Text-to-Speech API and set '
+                    'GOOGLE_APPLICATION_CREDENTIALS',
+                    extra={'error': str(e)}
+                )
+                self._enabled = False
+    
+    def reset_client(self):
+        """Drop any client inherited across fork (gRPC channels are not fork-safe)"""
+        with self._client_lock:
+            self._client = None
+            self._enabled = None
+    
+    def _create_client(self):
+        """Create the TTS client (TTS_API_ENDPOINT points it at a local stand-in)"""
+        from google.cloud import texttospeech
+        
+        endpoint = os.environ.get('TTS_API_ENDPOINT')
+        if not endpoint:
+            return texttospeech.TextToSpeechClient()
+        
+        from google.auth.credentials import AnonymousCredentials
+        from google.cloud.texttospeech_v1.services.text_to_speech.transports.rest import (
+            TextToSpeechRestTransport
+        )
+        scheme, _, host = endpoint.rpartition('://')
+        transport = TextToSpeechRestTransport(
+            host=host,
+            url_scheme=scheme or 'https',
+            credentials=AnonymousCredentials()
+        )
+        return texttospeech.TextToSpeechClient(transport=transport)
+    
+    def _request(self, text, slang, persona):
+        """(cache key, SSML, voice name, speaking rate, pitch) for a reply"""
+        # Get voice configuration for this slang
+        voice_cfg = self.voice_config.get(slang, self.voice_config['COMMON'])
+        persona_mod = self.persona_modifiers.get(persona, self.persona_modifiers['JALIANA'])
+        
+        # Clean text for TTS (remove emojis, keep Tamil and English)
+        clean_text = self._clean_text_for_tts(text)
+        
+        # If text is very long, truncate for TTS (but keep full text in chat)
+        if len(clean_text) > 500:
+            clean_text = clean_text[:500] + "..."
+        
+        # Prepare SSML for more natural speech
+        ssml_text = self._create_ssml(clean_text, voice_cfg, persona_mod)
+        
+        # Calculate final speaking rate and pitch
+        final_rate = voice_cfg.speaking_rate * persona_mod.rate_adjust
+        final_pitch = voice_cfg.pitch + persona_mod.pitch_adjust
+        
+        key = request_key(ssml_text, voice_cfg.name, final_rate, final_pitch)
+        return key, ssml_text, voice_cfg.name, final_rate, final_pitch
+    
+    def _synthesize(self, ssml_text, voice_name, speaking_rate, pitch):
+        """Call Google TTS and return the audio as a data URL"""
+        from google.cloud import texttospeech
+        
+        # Set up voice parameters
+        voice = texttospeech.VoiceSelectionParams(
+            language_code="ta-IN",
+            name=voice_name
+        )
+        
+        # Set up audio configuration
+        audio_config = texttospeech.AudioConfig(
+            audio_encoding=texttospeech.AudioEncoding.MP3,
+            speaking_rate=speaking_rate,
+            pitch=pitch
+        )
+        
+        # Synthesize speech
+        synthesis_input = texttospeech.SynthesisInput(ssml=ssml_text)
+        with timed('tts_synthesize'):
+            response = self.client.synthesize_speech(
+                input=synthesis_input,
+                voice=voice,
+                audio_config=audio_config
+            )
+        
+        # Convert audio to base64 for easy transmission
+        audio_base64 = base64.b64encode(response.audio_content).decode('utf-8')
+        
+        # Return as data URL
+        return f"data:audio/mp3;base64,{audio_base64}"
     
     def text_to_speech(self, text, slang='COMMON', persona='JALIANA'):
         """Convert text to speech with appropriate voice for slang and persona"""
         
         if not self.enabled:
-            print("TTS disabled, returning None")
+            logger.debug('TTS disabled, returning None')
             return None
         
         try:
-            # Get voice configuration for this slang
-            voice_cfg = self.voice_config.get(slang, self.voice_config['COMMON'])
-            persona_mod = self.persona_modifiers.get(persona, self.persona_modifiers['JALIANA'])
-            
-            # Clean text for TTS (remove emojis, keep Tamil and English)
-            clean_text = self._clean_text_for_tts(text)
-            
-            # If text is very long, truncate for TTS (but keep full text in chat)
-            if len(clean_text) > 500:
-                clean_text = clean_text[:500] + "..."
-            
-            # Prepare SSML for more natural speech
-            ssml_text = self._create_ssml(clean_text, voice_cfg, persona_mod)
-            
-            # Set up voice parameters
-            voice = texttospeech.VoiceSelectionParams(
-                language_code="ta-IN",
-                name=voice_cfg['name']
-            )
-            
-            # Calculate final speaking rate and pitch
-            final_rate = voice_cfg['speaking_rate'] * persona_mod['rate_adjust']
-            final_pitch = voice_cfg['pitch'] + persona_mod['pitch_adjust']
-            
-            # Set up audio configuration
-            audio_config = texttospeech.AudioConfig(
-                audio_encoding=texttospeech.AudioEncoding.MP3,
-                speaking_rate=final_rate,
-                pitch=final_pitch
-            )
+            key, ssml_text, voice_name, final_rate, final_pitch = self._request(text, slang, persona)
             
-            # Synthesize speech
-            synthesis_input = texttospeech.SynthesisInput(ssml=ssml_text)
+            if self.cache is not None and len(text) <= self.CACHE_MAX_CHARS:
+                audio = self.cache.get_tts_cache(key)
+                TTS_CACHE.labels(result='hit' if audio else 'miss').inc()
+                if audio:
+                    return audio
             
-            response = self.client.synthesize_speech(
-                input=synthesis_input,
-                voice=voice,
-                audio_config=audio_config
+            return self.flights.do(
+                key, lambda: self._synthesize(ssml_text, voice_name, final_rate, final_pitch)
             )
             
-            # Convert audio to base64 for easy transmission
-            audio_base64 = base64.b64encode(response.audio_content).decode('utf-8')
-            
-            # Return as data URL
-            return f"data:audio/mp3;base64,{audio_base64}"
-            
         except Exception as e:
-            print(f"TTS Error: {e}")
+            UPSTREAM_ERRORS.labels(service='google_tts').inc()
+            logger.warning('TTS error', extra={'error': str(e)})
             return None
     
+    def warm(self, phrases):
+        """
+        Make the phrase cache hold exactly these (text, slang, persona)
+        phrases: synthesize the ones not cached yet and drop cached audio
+        for phrases no longer in the list (e.g. after a voice change).
+        """
+        if self.cache is None or not self.enabled:
+            return {'synthesized': 0, 'failed': 0, 'removed': 0, 'cached': 0}
+        
+        cached = self.cache.get_tts_cache_keys()
+        wanted = set()
+        synthesized = failed = 0
+        for text, slang, persona in phrases:
+            if len(text) > self.CACHE_MAX_CHARS:
+                continue
+            key, ssml_text, voice_name, final_rate, final_pitch = self._request(text, slang, persona)
+            wanted.add(key)
+            if key in cached:
+                continue
+            try:
+                self.cache.save_tts_cache(key, self._synthesize(ssml_text, voice_name, final_rate, final_pitch))
+                synthesized += 1
+            except Exception as e:
+                UPSTREAM_ERRORS.labels(service='google_tts').inc()
+                logger.warning('TTS warm-up error', extra={'error': str(e)})
+                failed += 1
+        
+        stale = cached - wanted
+        self.cache.delete_tts_cache(stale)
+        return {'synthesized': synthesized, 'failed': failed, 'removed': len(stale), 'cached': len(wanted)}
+    
     def _clean_text_for_tts(self, text):
         """Remove emojis and clean text for TTS"""
         # Remove common emojis
-        emoji_list = ['😄', '🔥', '😊', '😅', '🎉', '👏', '💪', '🚀', '⭐', '✨', '💯', '😂', '🤣', '😍', '🥰', '😎']
         cleaned = text
-        for emoji in emoji_list:
+        for emoji in TTS_STRIP_EMOJIS:
             cleaned = cleaned.replace(emoji, '')
         
         # Clean up extra spaces